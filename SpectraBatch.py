@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraBatch
+@author: Sebastian Mehmed
+
+Description:
+    Headless batch mode of SpectraC. A JSON or YAML recipe describes the
+    steps that are otherwise done in the window: load, filter, relative
+    intensity, compare (average or common species), plots and export. The
+    recipe is run on every matching data folder in a process pool, and the
+    figures and CSV files are written to an output folder without opening
+    any window.
+
+Usage:
+    python SpectraBatch.py recipe.json [--workers N] [--output DIR]
+
+Recipe (every key except "folders" is optional):
+    {
+        "folders": ["/data/campaign/*"],
+        "output": "batch_output",
+        "filter": {
+            "families": ["Aliphatics", "Aromatics"],
+            "c_range": [5, 40], "c_ranges": [[50, 60]],
+            "mass_range": [100, 800], "mass_ranges": [],
+            "intensity_range": [0, 1e9]
+        },
+        "relative_intensity": true,
+        "compare": {"method": "average", "samples": [["Murchison", "IOM"], ["Murchison", "SOM"]]},
+        "plots": [
+            {"type": "DBE vs C#", "groups": ["CH Species"], "asymptotes": ["DBE = 0.5*C# (Aromatic)"],
+             "xlim": [0, 60], "ylim": [0, 40], "intensity_range": [0, 0], "save_data": true},
+            {"type": "H/C vs Mass", "mode": "density", "aggregate": "max"},
+            {"type": "Family Analysis", "families": ["Aliphatics", "Aromatics"], "scale": "log"}
+        ],
+        "figure_format": "png",
+        "asymptotes_file": "asymptotes.json",
+        "export": true,
+        "stream": false,
+        "chunk_rows": 100000,
+        "compact": false
+    }
+
+    Missing filter families or ranges select everything, a missing compare
+    "samples" list selects every sample of the folder, and missing plot
+    groups select all four groups of species. A scatter plot with
+    "mode": "density" bins the peaks and draws the "sum" (default) or "max"
+    intensity per cell, see SpectraPlots.density_grid. The user asymptotes
+    of "asymptotes_file" (see SpectraPlots.load_asymptotes) can be selected
+    in "asymptotes" like the built-in ones.
+
+    With "stream": true the files are read in chunks of "chunk_rows" lines
+    and the recipe filter is applied while reading, so only the rows that
+    pass it are kept in memory. The rows read and kept per file are printed.
+    "compact": true loads the data with the compact schema of
+    SpectraIO.COMPACT_DTYPES.
+
+"""
+
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from SpectraIO import load_folder, stream_folder
+from SpectraCore import (filter_data, row_predicate, relative_intensity, average_samples,
+                         common_species, sample_index, GROUP_FAMILIES)
+from SpectraPlots import (scatter_figures, family_figures, intensity_norm, average_title, load_asymptotes,
+                          file_name)
+
+
+def load_recipe(recipe_path):
+    """Read a JSON or YAML recipe."""
+
+    with open(recipe_path, 'r', encoding='utf-8') as file:
+        if recipe_path.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+
+            except ImportError:
+                raise SystemExit("YAML recipes need PyYAML (pip install pyyaml), or use a JSON recipe.")
+
+            return yaml.safe_load(file)
+
+        return json.load(file)
+
+
+def find_folders(patterns):
+    """Return the data folders matching the glob patterns, in sorted order."""
+
+    folders = []
+
+    for pattern in patterns:
+        folders.extend(path for path in sorted(glob.glob(pattern)) if os.path.isdir(path))
+
+    # Remove duplicates but keep the order
+    return list(dict.fromkeys(os.path.normpath(folder) for folder in folders))
+
+
+def apply_filter(data, options):
+    # Missing options select everything, like the "All" buttons of the filter dialog
+    intensity = 'Relative intensity' if 'Relative intensity' in data else 'Absolute intensity'
+
+    families = options.get('families') or list(data['Family'].unique())
+    c_range = options.get('c_range')
+    mass_range = options.get('mass_range')
+    c_ranges = options.get('c_ranges')
+    mass_ranges = options.get('mass_ranges')
+
+    if not c_range and not c_ranges:
+        c_range = (data['C#'].min(), data['C#'].max())
+
+    if not mass_range and not mass_ranges:
+        mass_range = (data['Mass'].min(), data['Mass'].max())
+
+    intensity_range = options.get('intensity_range') or (data[intensity].min(), data[intensity].max())
+
+    return filter_data(data, families, c_range, mass_range, intensity_range, c_ranges, mass_ranges)
+
+
+def stream_predicate(options):
+    # Same filter as apply_filter, evaluated on every chunk while the files are read
+    return row_predicate(options.get('families') or None, options.get('c_range'), options.get('c_ranges'),
+                         options.get('mass_range'), options.get('mass_ranges'), options.get('intensity_range'))
+
+
+def output_folder(folder_path, output_path):
+    """Return the folder the results of a data folder are written to, named after the data folder."""
+
+    return os.path.join(output_path, os.path.basename(folder_path))
+
+
+def run_folder(folder_path, recipe, output_path):
+    """Run the recipe on one data folder and return a summary of what was done."""
+
+    start = time.perf_counter()
+    summary = {'folder': folder_path, 'errors': [], 'figures': 0}
+
+    if recipe.get('asymptotes_file'):
+        # Every worker process has its own asymptote registry
+        load_asymptotes(recipe['asymptotes_file'])
+
+    out_dir = output_folder(folder_path, output_path)
+    os.makedirs(out_dir, exist_ok=True)
+
+    if recipe.get('stream'):
+        # Only the rows that pass the filter are kept while reading
+        predicate = stream_predicate(recipe.get('filter', {}))
+        data, errors, row_counts = stream_folder(folder_path, predicate, recipe.get('chunk_rows', 100_000),
+                                                 compact=recipe.get('compact', False))
+        summary['row_counts'] = row_counts
+
+    else:
+        # The folders are already spread over processes, read the files one by one
+        data, errors = load_folder(folder_path, workers=1, compact=recipe.get('compact', False))
+
+    summary['errors'].extend(f"{file}: {error}" for file, error in errors)
+
+    if data is None:
+        summary['errors'].append("No data could be loaded")
+        summary['time'] = time.perf_counter() - start
+        return summary
+
+    summary['rows_loaded'] = len(data)
+
+    if 'filter' in recipe and not recipe.get('stream'):
+        data = apply_filter(data, recipe['filter'])
+
+    summary['rows_filtered'] = len(data)
+
+    if recipe.get('relative_intensity'):
+        data = relative_intensity(data)
+
+    compared_title = ''
+
+    if 'compare' in recipe:
+        compare = recipe['compare']
+        samples = compare.get('samples') or list(sample_index(data).unique())
+        unique_samples, unique_descriptions = zip(*samples)
+        compared_title = average_title(unique_samples, unique_descriptions)
+
+        if compare.get('method', 'average') == 'average':
+            data = average_samples(data, samples)
+
+        else:
+            data = common_species(data, samples)
+
+            if data is None:
+                summary['errors'].append("The selected samples have no species in common")
+                summary['time'] = time.perf_counter() - start
+                return summary
+
+    figure_format = recipe.get('figure_format', 'png')
+
+    for i, plot in enumerate(recipe.get('plots', [])):
+        plot_type = plot['type']
+
+        if plot_type == "Family Analysis":
+            families = plot.get('families') or list(data['Family'].unique())
+            figures = family_figures(data, families, plot.get('scale') == 'log', compared_title)
+
+            for j, (title, fig) in enumerate(figures):
+                metric = 'intensity' if j % 2 == 0 else 'species'
+                fig.savefig(os.path.join(out_dir, f"{i:02d}_{file_name(title)}_{metric}.{figure_format}"))
+
+        else:
+            norm = intensity_norm(*plot.get('intensity_range', (0.0, 0.0)))
+            figures = scatter_figures(data, plot_type, plot.get('groups') or list(GROUP_FAMILIES),
+                                      samples=plot.get('samples'), selected_asymptotes=plot.get('asymptotes', ()),
+                                      xlim=plot.get('xlim'), ylim=plot.get('ylim'), norm=norm,
+                                      compared_title=compared_title, mode=plot.get('mode', 'scatter'),
+                                      aggregate=plot.get('aggregate', 'sum'))
+
+            for title, fig, plot_data in figures:
+                name = f"{i:02d}_{file_name(plot_type)}_{file_name(title)}"
+                fig.savefig(os.path.join(out_dir, f"{name}.{figure_format}"))
+
+                if plot.get('save_data'):
+                    plot_data.to_csv(os.path.join(out_dir, f"{name}.csv"), sep=',', index=False)
+
+        summary['figures'] += len(figures)
+
+    if recipe.get('export', True):
+        data.to_csv(os.path.join(out_dir, "data.csv"), index=False, sep=',')
+
+    summary['rows_out'] = len(data)
+    summary['time'] = time.perf_counter() - start
+
+    return summary
+
+
+def _run_folder_safe(args):
+    # Worker entry point, a failing folder does not stop the batch
+    folder_path, recipe, output_path = args
+
+    try:
+        return run_folder(folder_path, recipe, output_path)
+
+    except Exception as error:
+        return {'folder': folder_path, 'errors': [f"{type(error).__name__}: {error}"], 'figures': 0}
+
+
+def run_batch(recipe, workers=None, output_path=None):
+    """Run a recipe on all its folders in a process pool and return the summaries.
+
+    Raises ValueError before running anything if two folders would be
+    written to the same output folder, i.e. folders with the same name.
+    """
+
+    folders = find_folders(recipe['folders'])
+    output_path = output_path or recipe.get('output', 'batch_output')
+    outputs = {}
+
+    for folder in folders:
+        outputs.setdefault(os.path.abspath(output_folder(folder, output_path)), []).append(folder)
+
+    clashes = [inputs for inputs in outputs.values() if len(inputs) > 1]
+
+    if clashes:
+        raise ValueError("These folders would be written to the same output: "
+                         + "; ".join(", ".join(inputs) for inputs in clashes))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(folders)))
+
+    jobs = [(folder, recipe, output_path) for folder in folders]
+
+    if workers == 1:
+        return [_run_folder_safe(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_folder_safe, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a SpectraC recipe on many data folders without the GUI.")
+    parser.add_argument('recipe', help="JSON or YAML recipe file")
+    parser.add_argument('--workers', type=int, default=None, help="Number of folders processed in parallel")
+    parser.add_argument('--output', default=None, help="Output folder, overrides the recipe")
+    args = parser.parse_args(argv)
+
+    recipe = load_recipe(args.recipe)
+
+    try:
+        summaries = run_batch(recipe, args.workers, args.output)
+
+    except ValueError as error:
+        print(f"Error: {error}")
+        return 1
+
+    if not summaries:
+        print("No data folder matches the recipe.")
+        return 1
+
+    failed = 0
+
+    for summary in summaries:
+        rows = f"{summary.get('rows_loaded', 0)} rows loaded, {summary.get('rows_out', 0)} exported"
+        print(f"{summary['folder']}: {rows}, {summary['figures']} figures, {summary.get('time', 0):.1f} s")
+
+        for file, rows_in, rows_out in summary.get('row_counts', []):
+            print(f"    {file}: {rows_in} rows read, {rows_out} kept")
+
+        for error in summary['errors']:
+            print(f"    error: {error}")
+
+        failed += bool(summary['errors'])
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,9 +23,7 @@ Note to Readers:
 import tkinter as tk
 from tkinter import ttk, filedialog, simpledialog, messagebox
 import os
-import glob
 import pandas as pd
-import numpy as np
 import tkinter.font as tkfont
 import sv_ttk
 import matplotlib.pyplot as plt
@@ -33,6 +31,20 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib import colors
 import matplotlib.ticker as ticker
 import csv
+from SpectraIO import load_folder, compact_frame
+from SpectraCore import (average_samples, common_species, to_relative, to_absolute, sample_maxima,
+                         select_samples, intensity_columns, add_group_column, add_derived_columns,
+                         drop_derived_columns, sample_stats, sample_range)
+from SpectraPlots import (family_figures, scatter_figures, average_title, intensity_norm,
+                          load_asymptotes, ASYMPTOTES)
+from SpectraRender import render_figures
+from SpectraJobs import Job
+from SpectraSearch import FormulaIndex, split_query
+from SpectraFilter import DataFilter
+
+
+# File with the user asymptotes, see SpectraPlots.load_asymptotes
+ASYMPTOTES_FILE = "asymptotes.json"
 
 
 class DataFilterApp(tk.Tk):
@@ -46,6 +58,25 @@ class DataFilterApp(tk.Tk):
         self.data_path = tk.StringVar()
         self.all_data = None
         self.displayed_data = None
+        
+        # Job running on the worker thread, only one at a time
+        self.job = None
+        
+        # Formula index of the displayed data for the search bar
+        self.formula_index = None
+        
+        # Per (Sample, Description) statistics of the displayed data, with the data they belong to
+        self.sample_stats = None
+        
+        # Filter of the data with its cached masks, and the values of the filter dialog
+        self.data_filter = None
+        self.filter_values = None
+        
+        # Absolute intensity columns replaced by the relative ones, indexed like the data
+        self.absolute_intensities = None
+        
+        # Maximum intensity of every compared sample, to make compared data relative
+        self.compared_maxima = None
 
         self.apply_azure_theme()
         self.create_widgets()
@@ -56,6 +87,21 @@ class DataFilterApp(tk.Tk):
         
         self.unique_samples = []
         self.unique_descriptions = []
+        
+        self.load_user_asymptotes()
+
+    def load_user_asymptotes(self):
+        # Reference curves of the user, from asymptotes.json next to this file
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ASYMPTOTES_FILE)
+        
+        if not os.path.exists(file_path):
+            return
+        
+        try:
+            load_asymptotes(file_path)
+            
+        except (OSError, ValueError) as error:
+            messagebox.showerror("Error", f"The asymptotes of {ASYMPTOTES_FILE} could not be loaded:\n{error}")
 
     def apply_azure_theme(self):
         sv_ttk.set_theme("dark")
@@ -70,20 +116,9 @@ class DataFilterApp(tk.Tk):
         main_frame = ttk.Frame(self)
         main_frame.pack(fill=tk.BOTH, expand=True)
     
-        # Create the Treeview widget
-        self.treeview = ttk.Treeview(main_frame, height=25)
-        self.treeview.grid(row=1, column=0, columnspan=4, padx=(10, 10), pady=(5, 5), sticky="nsew")
-    
-        # Create scrollbars
-        y_scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL)
-        y_scrollbar.grid(row=1, column=4, sticky="ns")
-        self.treeview.configure(yscrollcommand=y_scrollbar.set)
-        y_scrollbar.config(command=self.treeview.yview)
-    
-        x_scrollbar = ttk.Scrollbar(main_frame, orient=tk.HORIZONTAL)
-        x_scrollbar.grid(row=2, column=0, columnspan=4, sticky="ew")
-        self.treeview.configure(xscrollcommand=x_scrollbar.set)
-        x_scrollbar.config(command=self.treeview.xview)
+        # Create the table, it only holds the rows that are visible
+        self.table = VirtualTable(main_frame, height=25)
+        self.table.grid(row=1, column=0, columnspan=5, padx=(10, 0), pady=(5, 5), sticky="nsew")
     
         # Create a frame to hold all the LabelFrames
         container_frame = ttk.Frame(main_frame)
@@ -105,6 +140,11 @@ class DataFilterApp(tk.Tk):
         clear_button = ttk.Button(data_frame, text="Clear", command=self.clear_data)
         clear_button.grid(row=0, column=3, padx=(0, 5), pady=(5, 5))
     
+        # Load the data with categorical strings and float32 ratios to save memory
+        self.compact_var = tk.BooleanVar(value=False)
+        compact_check = ttk.Checkbutton(data_frame, text="Compact", variable=self.compact_var)
+        compact_check.grid(row=0, column=4, padx=(0, 5), pady=(5, 5))
+    
         # Search frame
         search_frame = ttk.LabelFrame(container_frame, text="Search", padding=(5, 5, 5, 5))
         search_frame.grid(row=0, column=1, padx=(10, 10), pady=(5,5), sticky="w")
@@ -179,109 +219,130 @@ class DataFilterApp(tk.Tk):
                 # Save the directory in which the chosen folder resides for next time
                 self.parent_folder_path = os.path.dirname(folder_path)
                 
-                self.data_path.set(folder_path)
                 self.load_data(folder_path)
-                self.browse_data = True
     
     def load_data(self, folder_path):
         os.chdir(folder_path)
-        data_frames = []
-    
-        for file in glob.glob("*.txt"):
-    
-            # Load data files
-            df = pd.read_csv(file, delimiter=';', header=None, skiprows=2, skipfooter=4, engine='python')
-    
-            # Set column headers
-            df.columns = [
-                'Name', 'Formula', 'Mass', 'Theoretical mass', 'Error', 'C#', 
-                'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Element 1', 
-                'Element 2', 'Element 3', 'Element 4', 'Family', 
-                'Absolute intensity'
-                ]
-    
-            file_name = os.path.splitext(file)[0]
-    
-            # Add Columns for "sample" and "description" from the file name
-            first_word, second_word = file_name.split('_')
-            df['Sample'] = first_word
-            df['Description'] = second_word
-    
-            data_frames.append(df)
-    
-        # Combine the data into one dataframe
-        self.all_data = pd.concat(data_frames, ignore_index=True)
-    
-        # Remove unwanted columns
-        self.all_data = self.all_data.drop(columns=[
-            'Name', 'Element 1', 'Element 2', 'Element 3', 'Element 4'
-            ])
-    
-        # Rearrange columns
-        self.all_data = self.all_data[[
-            'C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Sample', 
-            'Description', 'Formula', 'Mass', 'Theoretical mass', 'Error', 
-            'Family', 'Absolute intensity'
-            ]]
-    
-        # Strip any extra spaces from the 'Formula' column
-        self.all_data['Formula'] = self.all_data['Formula'].str.strip()
-    
-        # Split the Aromatics family
-        self.all_data['DBE/C#'] = self.all_data['DBE/C#'].astype(float)
-        self.all_data['Family'] = self.all_data['Family'].str.strip()
-    
-        aromatics_mask = (self.all_data['Family'] == "Aromatics")
-        value_mask = (self.all_data['DBE/C#'] >= 0.67)
-    
-        # Create new family (Condensed Aromatics)
-        combined_mask = np.logical_and(aromatics_mask, value_mask)
-        self.all_data.loc[combined_mask, 'Family'] = "Condensed Aromatics"
+
+        compact = self.compact_var.get()
+
+        def load_job(job):
+            data, errors = load_folder(folder_path, progress=job.report, compact=compact)
+            
+            # Add the derived columns, index the formulas for the search bar and
+            # compute the per sample statistics while still on the worker thread
+            if data is not None:
+                job.report(0, 0, "Computing derived columns")
+                data = add_derived_columns(data)
+                
+                if compact:
+                    data = compact_frame(data)
+                
+                job.report(0, 0, "Indexing formulas")
+                return data, errors, FormulaIndex(data), sample_stats(data)
+            
+            return data, errors, None, None
+
+        def data_loaded(result):
+            data, errors, formula_index, stats = result
+            
+            if errors:
+                failed_files = "\n".join(f"{file}: {error}" for file, error in errors)
+                messagebox.showerror("Error", f"The following files could not be loaded:\n{failed_files}")
+
+            if data is None:
+                return
+
+            # The folder only counts as loaded once its data is there
+            self.data_path.set(folder_path)
+            self.browse_data = True
+
+            # Display the data
+            self.all_data = data
+            self.formula_index = formula_index
+            self.sample_stats = (data, stats)
+            self.display_data(self.all_data)
+
+        # Load the changed data files in parallel, the others from the cache,
+        # and combine them into one dataframe
+        self.run_job("Loading data", data_loaded, load_job)
+        
+    def run_job(self, title, on_done, func, *args):
+        # Run func(job, *args) on a worker thread and call on_done(result) on
+        # the Tk thread when it is finished, unless it was cancelled
+        if self.job is not None:
+            messagebox.showerror("Error", "Please wait until the current operation is finished.")
+            return
+        
+        job = self.job = Job(func, *args).start()
+        
+        # Create a progress window, it blocks the main window until the job is done
+        progress_window = tk.Toplevel(self)
+        progress_window.title(title)
+        progress_window.resizable(False, False)
+        progress_window.transient(self)
+        
+        label = ttk.Label(progress_window, text=title, width=50)
+        label.pack(padx=10, pady=(10, 5))
+        
+        # The progress is unknown until the job reports a total
+        progress_bar = ttk.Progressbar(progress_window, length=400, mode='indeterminate')
+        progress_bar.pack(padx=10, pady=5)
+        progress_bar.start(10)
+        
+        def cancel():
+            job.cancel()
+            cancel_button.config(state='disabled')
+            label.config(text="Cancelling...")
+        
+        cancel_button = ttk.Button(progress_window, text="Cancel", command=cancel)
+        cancel_button.pack(padx=10, pady=(5, 10))
+        
+        progress_window.protocol("WM_DELETE_WINDOW", cancel)
+        progress_window.grab_set()
+        
+        def poll():
+            if not job.done():
+                done, total, message = job.progress
+                
+                if total and not job.cancel_requested:
+                    if str(progress_bar['mode']) != 'determinate':
+                        progress_bar.stop()
+                        progress_bar.config(mode='determinate', maximum=total)
+                    
+                    progress_bar['value'] = done
+                    label.config(text=f"{message} {done}/{total}")
+                
+                self.after(100, poll)
+                return
+            
+            progress_window.grab_release()
+            progress_window.destroy()
+            self.job = None
+            
+            # A cancelled job is dropped, the displayed data stays as it was
+            if job.cancelled or job.cancel_requested:
+                return
+            
+            if job.error is not None:
+                messagebox.showerror("Error", f"{title} failed:\n{job.error}")
+                return
+            
+            on_done(job.result)
         
-        # Display the data
-        self.display_data(self.all_data)
+        self.after(100, poll)
         
     def display_data(self, data):
         self.displayed_data = data
     
-        # Clear the treeview before displaying new data
-        for row in self.treeview.get_children():
-            self.treeview.delete(row)
-    
-        # Add an empty first column for the Treeview widget
-        self.treeview['columns'] = ('',) + tuple(data.columns)
-    
-        # Configure the first column
-        self.treeview.column('', width=0, stretch=tk.NO)
-    
-        # Update the treeview columns
-        padding = 20
-        for col in data.columns:
-            self.treeview.heading(col, text=col, anchor=tk.W)
-    
-            # Set the column width based on the maximum width of the content in the column
-            max_width = max(tkfont.Font().measure(str(val)) for val in data[col].fillna(''))
-            header_width = tkfont.Font().measure(col.title())
-            column_width = max(header_width, max_width) + padding
-    
-            # Use minwidth instead of width to allow resizing
-            self.treeview.column(col, anchor=tk.W, minwidth=column_width)
-    
-        # Add rows to the treeview
-        for index, row in data.iterrows():
-            self.treeview.insert("", "end", values=(index,) + tuple(row.to_list()))
+        # Show the data in the table, only the visible window of rows is rendered.
+        # The derived columns are only used internally, for the plots
+        self.table.set_data(drop_derived_columns(data))
 
     def clear_data(self):
         
-        # Clear the treeview
-        for col in self.treeview["columns"]:
-            self.treeview.heading(col, text="")
-            self.treeview.column(col, width=0)
-            
-        self.treeview["columns"] = ()
-        
-        for row in self.treeview.get_children():
-            self.treeview.delete(row)
+        # Clear the table
+        self.table.clear()
     
         # Reset variables
         self.data_path.set("")
@@ -292,6 +353,26 @@ class DataFilterApp(tk.Tk):
         self.browse_data = False
         self.unique_samples = []
         self.unique_descriptions = []
+        self.formula_index = None
+        self.sample_stats = None
+        self.data_filter = None
+        self.filter_values = None
+        self.absolute_intensities = None
+        self.compared_maxima = None
+        
+    def get_sample_stats(self):
+        # The statistics are only recomputed when the displayed data changed since they were computed
+        if self.sample_stats is None or self.sample_stats[0] is not self.displayed_data:
+            self.sample_stats = (self.displayed_data, sample_stats(self.displayed_data))
+            
+        return self.sample_stats[1]
+        
+    def get_formula_index(self):
+        # The index is only rebuilt when the displayed data changed since it was built
+        if self.formula_index is None or self.formula_index.data is not self.displayed_data:
+            self.formula_index = FormulaIndex(self.displayed_data)
+            
+        return self.formula_index
         
     def search_data(self):
         if self.displayed_data is None:
@@ -301,16 +382,21 @@ class DataFilterApp(tk.Tk):
             # Get the search string from the search bar
             search_string = self.search_var.get()
         
-            # Split the search string into formulas
-            formulas = [formula.strip() for formula in search_string.split(',')]
+            # Split the search string into formulas, prefixes (C10H*) or element ranges (C10-20 H* N1 O0-2)
+            formulas = split_query(search_string)
         
             # Check if there are any formulas to search for
             if not formulas:
                 messagebox.showinfo("Info", "No formulas entered. Please enter one or more formulas, separated by commas.")
                 return
         
-            # Filter the displayed data based on the formulas
-            filtered_data = self.displayed_data[self.displayed_data['Formula'].isin(formulas)]
+            # Filter the displayed data based on the formulas, using the formula index
+            try:
+                filtered_data = self.get_formula_index().search(formulas)
+                
+            except ValueError as error:
+                messagebox.showerror("Error", str(error))
+                return
             
             # Check if the filtered data is empty
             if filtered_data.empty:
@@ -374,53 +460,25 @@ class DataFilterApp(tk.Tk):
             self.display_data(sorted_data)
         
     def filter_data(self, family_filter, c_range, mass_range, intensity_range, c_ranges, mass_ranges):
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            mass = 'Mass'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            mass = 'Mass'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
-            mass = 'Mass (Average)'
-            
-        else:
-            intensity = 'Relative intensity (Average)'
-            mass = 'Mass (Average)'
-        
         # Family filter
         families = [f.strip() for f in family_filter.split(',')]
-        filtered_data = self.displayed_data[self.displayed_data['Family'].isin(families)]
-
-        # C# filter
-        if c_range:
-            c_filter = (filtered_data['C#'] >= c_range[0]) & (filtered_data['C#'] <= c_range[1])
-        else:
-            c_filter = pd.Series([False] * len(filtered_data), index=filtered_data.index)
-
-        if c_ranges:
-            for c_range in c_ranges:
-                c_filter |= (filtered_data['C#'] >= c_range[0]) & (filtered_data['C#'] <= c_range[1])
-
-        filtered_data = filtered_data[c_filter]
         
-        # Mass filter
-        if mass_range:
-            mass_filter = (filtered_data[mass] >= mass_range[0]) & (filtered_data[mass] <= mass_range[1])
-        else:
-            mass_filter = pd.Series([False] * len(filtered_data), index=filtered_data.index)
-
-        if mass_ranges:
-            for mass_range in mass_ranges:
-                mass_filter |= (filtered_data[mass] >= mass_range[0]) & (filtered_data[mass] <= mass_range[1])
-
-        filtered_data = filtered_data[mass_filter]
+        # Only the masks of the predicates that changed are recomputed
+        data_filter = self.current_filter()
         
-        # Absolute/Relative intensity filter
-        filtered_data = filtered_data[(filtered_data[intensity] >= intensity_range[0]) & (filtered_data[intensity] <= intensity_range[1])]
+        # Keep the rows within the C#, mass and absolute/relative intensity ranges
+        filtered_data = data_filter.apply(families, c_range, mass_range, intensity_range, c_ranges, mass_ranges)
         self.display_data(filtered_data)
+        
+    def current_filter(self):
+        # Keep the filter, its masks and indexes while the displayed data is
+        # its data or its result, start a new one if the data changed otherwise
+        if self.data_filter is None or not (self.displayed_data is self.data_filter.data or 
+                                            self.displayed_data is self.data_filter.result):
+            self.data_filter = DataFilter(self.displayed_data)
+            self.filter_values = None
+            
+        return self.data_filter
     
     def open_filter_dialog(self):
         if self.displayed_data is None:
@@ -432,37 +490,40 @@ class DataFilterApp(tk.Tk):
             return
             
         else:
-            FilterDialog(self, self.displayed_data, self.filter_data)
+            # While a filter is active the dialog works on the unfiltered data
+            # and starts from the previous values, so bounds can also be widened
+            dialog = FilterDialog(self, self.current_filter(), self.filter_data, self.filter_values)
+            
+            if dialog.values is not None:
+                self.filter_values = dialog.values
             
     def make_relative_intensity(self):
-        
-        def calculate_relative_intensity(group):
-            max_value = group.max()
-            return group / max_value * 100
-        
         if self.displayed_data is None:
             messagebox.showerror("Error", "No data, Please load data first.")
             return
             
-        elif not ('Sample' in self.displayed_data) or not ('Description' in self.displayed_data):
-            messagebox.showerror("Error", "Not possible after compare")
-            return
-            
-        else:    
-            # Create the dictionary to hold the original values
-            if not hasattr(self, 'abs_intensity_dict'):
-                self.abs_intensity_dict = self.displayed_data.set_index(['Sample', 'Description', 'Formula'])['Absolute intensity'].to_dict()
+        else:
+            intensity, _ = intensity_columns(self.displayed_data)
             
-            # Calculate the relative intensity
-            if not self.relative_intensity:
-                self.displayed_data['Relative intensity'] = self.displayed_data.groupby(['Sample', 'Description'])['Absolute intensity'].transform(calculate_relative_intensity)
-                self.displayed_data.drop('Absolute intensity', axis=1, inplace=True)
+            # Calculate the relative intensity, per sample or per sample column of compared data
+            if intensity.startswith('Absolute'):
+                number_samples = len(self.unique_samples) or None
+                self.displayed_data, self.absolute_intensities = to_relative(self.displayed_data, number_samples,
+                                                                             self.compared_maxima)
                 self.relative_intensity = True
                     
             else:
-                # Retrieve the original absolute intensity values from the dictionary
-                self.displayed_data['Absolute intensity'] = self.displayed_data.apply(lambda row: self.abs_intensity_dict[(row['Sample'], row['Description'], row['Formula'])], axis=1)
-                self.displayed_data.drop('Relative intensity', axis=1, inplace=True)
+                # Put back the absolute intensities saved when the data was made relative
+                try:
+                    if self.absolute_intensities is None:
+                        raise ValueError("No absolute intensities saved")
+                    
+                    self.displayed_data = to_absolute(self.displayed_data, self.absolute_intensities)
+                    
+                except ValueError:
+                    messagebox.showerror("Error", "Not possible after comparing relative intensities, please clear and reload the data.")
+                    return
+                
                 self.relative_intensity = False
             
             self.display_data(self.displayed_data)
@@ -543,12 +604,6 @@ class DataFilterApp(tk.Tk):
             button_frame.grid_rowconfigure(2, weight=1)
 
     def make_average(self):
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-    
-        else:
-            intensity = 'Relative intensity'
-    
         # Filter data based on the samples selected by the user
         selected_samples = [sample for sample, var in self.sample_vars.items() if var.get()]
         
@@ -558,79 +613,29 @@ class DataFilterApp(tk.Tk):
     
         # Convert each selected sample back into its 'Sample' and 'Description' parts
         selected_samples = [sample.split(" - ") for sample in selected_samples]
-        number_selected_samples = len(selected_samples)
         
-        # Extract samples and descriptions from selected_samples to be used later
-        self.unique_samples, self.unique_descriptions = zip(*selected_samples)
-    
-        # Filter 'displayed_data' to include only the selected samples
-        self.displayed_data = self.displayed_data[self.displayed_data.apply(
-            lambda row: [row['Sample'], row['Description']] in selected_samples, axis=1)]
-    
-        # Calculate the average of the selected samples
-        unique_formulas = self.displayed_data['Formula'].unique()
-        unique_combinations = self.displayed_data.drop_duplicates(subset=['Sample', 'Description'])
-        columns_to_keep = ['C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Formula', 'Mass', 'Theoretical mass', 'Error', 'Family']
-        averaged_data = []
-    
-        for formula in unique_formulas:
-            formula_data = self.displayed_data[self.displayed_data['Formula'] == formula]
-            representative_rows = []
-    
-            for _, combination in unique_combinations.iterrows():
-                temp_data = formula_data[(formula_data['Sample'] == combination['Sample']) & (formula_data['Description'] == combination['Description'])]
-                
-                if not temp_data.empty:
-                    min_error_row = temp_data.loc[temp_data['Error'].abs().idxmin()]
-                    representative_rows.append(min_error_row)
-    
-            if len(representative_rows) > 0:
-                representative_row = pd.concat(representative_rows, axis=1).mean(axis=1, numeric_only=True).to_frame().T
-                representative_row = representative_row.drop(columns=['Sample', 'Description', intensity])
-                representative_row[columns_to_keep] = representative_rows[0].loc[columns_to_keep]
-                representative_row['Mass'] = sum([row['Mass'] for row in representative_rows]) / len(formula_data)
-                representative_row['Error'] = sum([row['Error'] for row in representative_rows]) / len(formula_data)
-    
-                for row in representative_rows:
-                    combination = row['Sample'] + '_' + row['Description']
-                    
-                    if intensity == 'Absolute intensity':
-                        representative_row['Absolute intensity (' + combination + ')'] = row[intensity]
-                        
-                    else:
-                        representative_row['Relative intensity (' + combination + ')'] = row[intensity]
-    
-                averaged_data.append(representative_row)
-    
-        df_averaged = pd.DataFrame(pd.concat(averaged_data, ignore_index=True))
+        data = self.displayed_data
+        
+        def average_job(job):
+            job.report(0, 0, "Averaging the selected samples")
+            return add_derived_columns(average_samples(data, selected_samples)), sample_maxima(data)
         
-        if intensity == 'Absolute intensity':
-            df_averaged['Absolute intensity (Average)'] = df_averaged.filter(regex='^Absolute intensity \(').sum(axis=1) / number_selected_samples
+        def averaged(result):
+            df_averaged, self.compared_maxima = result
             
-        else:
-            df_averaged['Relative intensity (Average)'] = df_averaged.filter(regex='^Relative intensity \(').sum(axis=1) / number_selected_samples
-    
-        # Replace all 'nan' values with 0
-        # We get 'nan' values when a sample does not contain the 'Formula'
-        # Which mean the intensity is 0
-        df_averaged.fillna(0, inplace=True)
-    
-        # Rename 'Mass' and 'Error' to 'Mass (Average)' and 'Error (Average)'
-        df_averaged = df_averaged.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+            # Extract samples and descriptions from selected_samples to be used later
+            self.unique_samples, self.unique_descriptions = zip(*selected_samples)
+            
+            # Display averaged data
+            self.display_data(df_averaged)
     
-        # Display averaged data
-        self.display_data(df_averaged)
+        # Calculate the average of the selected samples
+        self.run_job("Average", averaged, average_job)
             
     def find_common_species(self):
         if self.displayed_data is None:
             messagebox.showerror("Error", "No data to compare. Please load data first.")
             return
-        
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            
-        else:
-            intensity = 'Relative intensity'
     
         # Filter data based on the samples selected by the user
         selected_samples = [sample for sample, var in self.sample_vars.items() if var.get()]
@@ -641,71 +646,35 @@ class DataFilterApp(tk.Tk):
     
         # Convert each selected sample back into its 'Sample' and 'Description' parts
         selected_samples = [sample.split(" - ") for sample in selected_samples]
-        number_selected_samples = len(selected_samples)
         
-        # Extract samples and descriptions from selected_samples to be used later
-        self.unique_samples, self.unique_descriptions = zip(*selected_samples)
+        data = self.displayed_data
         
-        # Filter 'displayed_data' to include only the selected samples
-        self.displayed_data = self.displayed_data[self.displayed_data.apply(lambda row: [row['Sample'], row['Description']] in selected_samples, axis=1)]
-    
-        # Group data by 'Sample' and 'Description' and extract unique 'Formula' for each group
-        grouped_data = self.displayed_data.groupby(['Sample', 'Description'])['Formula'].unique()
-    
-        # Find common 'Formula' across all groups
-        common_species = set(grouped_data[0])
-        
-        for species in grouped_data[1:]:
-            common_species.intersection_update(species)
-    
-        columns_to_keep = [
-            'C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Formula', 'Mass', 
-            'Theoretical mass', 'Error', 'Family'
-            ]
-        averaged_data = []
-        
-        for formula in common_species:
-            formula_data = self.displayed_data[self.displayed_data['Formula'] == formula]
-            representative_rows = []
-        
-            for combination in grouped_data.index:
-                temp_data = formula_data[(formula_data['Sample'] == combination[0]) & (formula_data['Description'] == combination[1])]
-                if not temp_data.empty:
-                    min_error_row = temp_data.loc[temp_data['Error'].abs().idxmin()]  # Find the row with the error closest to 0
-                    representative_rows.append(min_error_row)
-    
-            if len(representative_rows) > 0:
-                representative_row = pd.concat(representative_rows, axis=1).mean(axis=1, numeric_only=True).to_frame().T
-                representative_row = representative_row.drop(columns=['Sample', 'Description', intensity])
-                representative_row[columns_to_keep] = representative_rows[0].loc[columns_to_keep]  # Keep only the desired columns
-                representative_row['Mass'] = sum([row['Mass'] for row in representative_rows]) / len(formula_data)  # New average Mass calculation
-                representative_row['Error'] = sum([row['Error'] for row in representative_rows]) / len(formula_data)  # New average Error calculation
-    
-                for row in representative_rows:
-                    combination = row['Sample'] + '_' + row['Description']
-                    if intensity == 'Absolute intensity':
-                        representative_row['Absolute intensity (' + combination + ')'] = row[intensity]
-                    else:
-                        representative_row['Relative intensity (' + combination + ')'] = row[intensity]
-    
-                averaged_data.append(representative_row)
-    
-        df_common_species = pd.DataFrame(pd.concat(averaged_data, ignore_index=True))
-    
-        # Rename 'Mass' and 'Error' to 'Mass (Average)' and 'Error (Average)'
-        df_common_species = df_common_species.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+        def common_species_job(job):
+            job.report(0, 0, "Finding the common species")
+            df_common_species = common_species(data, selected_samples)
+            
+            if df_common_species is None:
+                return None, None
+            
+            # The relative intensities of the table are relative to the base peak of every sample
+            return add_derived_columns(df_common_species), sample_maxima(data)
         
-        # Add a new column for the average intensity
-        if intensity == 'Absolute intensity':
-            intensity_columns = df_common_species.filter(regex='^Absolute intensity \(').columns
-            df_common_species[intensity + ' (Average)'] = df_common_species[intensity_columns].sum(axis=1) / number_selected_samples
-
-        else:
-            intensity_columns = df_common_species.filter(regex='^Relative intensity \(').columns
-            df_common_species[intensity + ' (Average)'] = df_common_species[intensity_columns].sum(axis=1) / number_selected_samples
+        def compared(result):
+            df_common_species, maxima = result
+            
+            if df_common_species is None:
+                messagebox.showinfo("Info", "The selected samples have no species in common.")
+                return
+            
+            # Extract samples and descriptions from selected_samples to be used later
+            self.unique_samples, self.unique_descriptions = zip(*selected_samples)
+            
+            self.common_species_list = True
+            self.compared_maxima = maxima
+            self.display_data(df_common_species)
         
-        self.common_species_list = True
-        self.display_data(df_common_species)
+        # Keep the formulas that are present in all selected samples
+        self.run_job("Common Species", compared, common_species_job)
             
     def plot_options(self):
         if self.displayed_data is None:
@@ -831,6 +800,9 @@ class DataFilterApp(tk.Tk):
             
         def destroy_and_scale():
             family_selection_window.destroy()
+            
+            # No asymptotes for this plot, forget the ones selected for the previous plot
+            self.asymptote_vars = {}
             self.axis_scale_window()
             
         # Create new window
@@ -860,7 +832,7 @@ class DataFilterApp(tk.Tk):
             ttk.Checkbutton(family_selection_window, text=group, variable=self.group_vars[group]).grid(row=i, column=0, sticky='w')
 
         # Add a "Next" button at the bottom of the window
-        if self.plot_option in ["DBE vs C#", "AI vs C#", "H# vs C#"]:
+        if ASYMPTOTES.get(self.plot_option):
             next_button = ttk.Button(family_selection_window, text="Next", command=destroy_and_select_asymptote)
             
         else:
@@ -890,35 +862,8 @@ class DataFilterApp(tk.Tk):
     
         asymptote_selection_window.geometry(f"+{asymptote_window_x}+{asymptote_window_y}")
     
-        # Define the asymptote names
-        if self.plot_option == "DBE vs C#":
-            asymptote_names = [
-                "DBE = 0.5*C# (Aromatic)", 
-                "DBE = 0.67*C# (Condensed Aromatic)",
-                "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)",
-                "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)",
-                "DBE = 0.9*C# (HC Cluster)", 
-                "DBE = C#+1 (Carbon Clusters)"
-                ]
-        
-        elif self.plot_option == "AI vs C#":
-            asymptote_names = [
-                "AI = 0.5 (Aromatic)", 
-                "AI = 0.67 (Condensed Aromatic)",
-                "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)",
-                "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)",
-                "AI = 0.9 (HC Cluster)", 
-                "AI = 1 + 1/C# (Carbon Clusters)"
-                ]
-            
-        elif self.plot_option == "H# vs C#":
-            asymptote_names = [
-                "H# = sqrt(6*C#) (Peri-condensed PAHs)", 
-                "H# = 0.5*C# + 3 (Cata-condensed PAHs)", 
-                "H# = C#", 
-                "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)",
-                "H# = 2*C# + 2 (Aliphatic)"
-                ]
+        # Built-in and user asymptotes of the plot
+        asymptote_names = [asymptote.name for asymptote in ASYMPTOTES[self.plot_option]]
     
         # Create a dictionary to hold the asymptote selection variables
         self.asymptote_vars = {asymptote: tk.BooleanVar() for asymptote in asymptote_names}
@@ -938,33 +883,21 @@ class DataFilterApp(tk.Tk):
             scale_window.destroy()
             self.plot_selected_groups()
             
-        if 'Sample' and 'Description' in self.displayed_data:
-            
-            # Get 'Sample' and 'Description' from selected samples
-            selected_samples_descriptions = [(sample.split(" - ")[0], sample.split(" - ")[1]) for sample, var in self.sample_vars.items() if var.get()]
-            
-            # Get maximum values from selected samples
-            C_num_max_val = self.displayed_data[(self.displayed_data['Sample'].isin([sd[0] for sd in selected_samples_descriptions])) &
-                                                (self.displayed_data['Description'].isin([sd[1] for sd in selected_samples_descriptions]))]['C#'].max()
-            
-            DBE_max_val = self.displayed_data[(self.displayed_data['Sample'].isin([sd[0] for sd in selected_samples_descriptions])) &
-                                                (self.displayed_data['Description'].isin([sd[1] for sd in selected_samples_descriptions]))]['DBE'].max()
-            
-            H_num_max_val = self.displayed_data[(self.displayed_data['Sample'].isin([sd[0] for sd in selected_samples_descriptions])) &
-                                                (self.displayed_data['Description'].isin([sd[1] for sd in selected_samples_descriptions]))]['H#'].max()
-            
-            H_C_ratio_max_val = self.displayed_data[(self.displayed_data['Sample'].isin([sd[0] for sd in selected_samples_descriptions])) &
-                                                (self.displayed_data['Description'].isin([sd[1] for sd in selected_samples_descriptions]))]['H/C'].max()
-            
-            Mass_max_val = self.displayed_data[(self.displayed_data['Sample'].isin([sd[0] for sd in selected_samples_descriptions])) &
-                                                (self.displayed_data['Description'].isin([sd[1] for sd in selected_samples_descriptions]))]['Mass'].max()
+        # The maxima of the selected samples are read from the per sample statistics
+        if 'Sample' in self.displayed_data and 'Description' in self.displayed_data:
+            selected_samples = [tuple(sample.split(" - ", 1)) for sample, var in self.sample_vars.items() if var.get()]
             
         else:
-            C_num_max_val = self.displayed_data['C#'].max()
-            DBE_max_val = self.displayed_data['DBE'].max()
-            H_num_max_val = self.displayed_data['H#'].max()
-            H_C_ratio_max_val = self.displayed_data['H/C'].max()
-            Mass_max_val = self.displayed_data['Mass (Average)'].max()
+            selected_samples = None
+            
+        stats = self.get_sample_stats()
+        _, mass = intensity_columns(self.displayed_data)
+        
+        C_num_max_val = sample_range(stats, 'C#', selected_samples)[1]
+        DBE_max_val = sample_range(stats, 'DBE', selected_samples)[1]
+        H_num_max_val = sample_range(stats, 'H#', selected_samples)[1]
+        H_C_ratio_max_val = sample_range(stats, 'H/C', selected_samples)[1]
+        Mass_max_val = sample_range(stats, mass, selected_samples)[1]
 
         # Create new window
         scale_window = tk.Toplevel()
@@ -1075,7 +1008,25 @@ class DataFilterApp(tk.Tk):
         
         # Add a plot button at the bottom of the window
         plot_button = ttk.Button(scale_window, text="Plot", command=destroy_and_plot)
-        plot_button.grid(row=6, column=0, columnspan=2)
+        
+        if self.plot_option == "Common Species":
+            plot_button.grid(row=6, column=0, columnspan=2)
+            
+        else:
+            # Large samples are faster to draw as density plots
+            self.display_var = tk.StringVar(value="Scatter")
+            ttk.Label(scale_window, text="Display:").grid(row=6, column=0)
+            ttk.Combobox(scale_window, textvariable=self.display_var, values=["Scatter", "Density (sum)", "Density (max)"],
+                         state='readonly', width=14).grid(row=6, column=1)
+            
+            # The scatter plots can also be saved to a folder at once, optionally combined into one file
+            self.combine_var = tk.StringVar(value="None")
+            ttk.Label(scale_window, text="Combine:").grid(row=7, column=0)
+            ttk.Combobox(scale_window, textvariable=self.combine_var, values=["None", "Grid", "PDF"],
+                         state='readonly', width=14).grid(row=7, column=1)
+            
+            plot_button.grid(row=8, column=0)
+            ttk.Button(scale_window, text="Save All", command=self.save_all_plots).grid(row=8, column=1)
         
     def plot_selected_groups(self):
         # Get the selected groups
@@ -1091,474 +1042,110 @@ class DataFilterApp(tk.Tk):
         else:
             self.make_plot(self.x_col_for_grouped_plot, self.y_col_for_grouped_plot)
         
-    def create_group_column(self):
-        # Define the group conditions
-        conditions = [
-            self.displayed_data['Family'].isin(['Aliphatics', 'Aromatics', 'Condensed Aromatics', 'HC Clusters', 'Carbon Clusters', 'Fullerenes']),
-            self.displayed_data['Family'] == 'Nitrogen Species',
-            self.displayed_data['Family'] == 'Oxygen Species',
-            self.displayed_data['Family'] == 'Nitrogen Oxygen Species'
-        ]
-        
-        # Define the group names
-        group_names = ["CH Species", "CHN Species", "CHO Species", "CHNO Species"]
-        
-        # Apply the conditions and create a new 'Group' column
-        self.displayed_data['Group'] = np.select(conditions, group_names)
+    def group_data(self):
+        # The displayed data with the 'Group' column (CH, CHN, CHO or CHNO Species),
+        # the displayed frame itself is not changed
+        return add_group_column(self.displayed_data)
 
-    def make_plot(self, x_col, y_col):
-        
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
+    def plot_settings(self):
+        # Keyword arguments of scatter_figures and render_figures chosen in the plot windows
+        if 'Sample' in self.displayed_data and 'Description' in self.displayed_data:
+            samples = [tuple(sample.split(" - ", 1)) for sample, var in self.sample_vars.items() if var.get()]
+            compared_title = ''
             
         else:
-            intensity = 'Relative intensity (Average)'
-            
-        # Get the min and max intensity values from the user input
-        intensity_min = self.intensity_min.get()
-        intensity_max = self.intensity_max.get()
+            samples = None
+            compared_title = average_title(self.unique_samples, self.unique_descriptions)
+        
+        # Names of the axis scale variables of every plot
+        x_scale, y_scale = {
+            "DBE vs C#": ('C_num', 'DBE'),
+            "H# vs C#": ('C_num', 'H_num'),
+            "H/C vs Mass": ('Mass', 'HC'),
+            "AI vs C#": ('C_num', 'AI')
+            }[self.plot_option]
+        
+        # Density plots bin the peaks and show the summed or maximum intensity per cell
+        mode, aggregate = {
+            "Scatter": ('scatter', 'sum'),
+            "Density (sum)": ('density', 'sum'),
+            "Density (max)": ('density', 'max')
+            }[self.display_var.get()]
+        
+        return {
+            'groups': [group for group, var in self.group_vars.items() if var.get()],
+            'samples': samples,
+            'selected_asymptotes': [name for name, var in getattr(self, 'asymptote_vars', {}).items() if var.get()],
+            'xlim': (getattr(self, f'{x_scale}_min').get(), getattr(self, f'{x_scale}_max').get()),
+            'ylim': (getattr(self, f'{y_scale}_min').get(), getattr(self, f'{y_scale}_max').get()),
+            'intensity_range': (self.intensity_min.get(), self.intensity_max.get()),
+            'compared_title': compared_title,
+            'mode': mode,
+            'aggregate': aggregate
+            }
+    
+    def show_scatter_plots(self):
+        settings = self.plot_settings()
+        
+        try:
+            norm = intensity_norm(*settings.pop('intensity_range'))
+            
+        except ValueError as error:
+            messagebox.showerror("Error", str(error))
+            return
         
-        # Create a custom logarithmic colormap normalization with the defined min and max values if they are set
-        if intensity_min == 0.0 and intensity_max == 0.0:
-            # default logarithmic scaling without custom min and max values
-            custom_norm = colors.LogNorm()
-              
-        else:
-            if intensity_min == 0.0 or intensity_max == 0.0:
-                messagebox.showerror("Error", "The logarithm of 0 is not defined. Please enter another value")
-            else:
-                custom_norm = colors.LogNorm(vmin=intensity_min, vmax=intensity_max, clip=True)
-            
-        asymptote_colors = {
-            "DBE = 0.5*C# (Aromatic)": 'red',
-            "DBE = 0.67*C# (Condensed Aromatic)": 'blue',
-            "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)": 'green',
-            "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)": 'purple',
-            "DBE = 0.9*C# (HC Cluster)": 'orange',
-            "DBE = C#+1 (Carbon Clusters)": 'brown',
-            "H# = sqrt(6*C#) (Peri-condensed PAHs)": 'purple',
-            "H# = 0.5*C# + 3 (Cata-condensed PAHs)": 'green',
-            "H# = C#": 'cyan',
-            "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)": 'magenta',
-            "H# = 2*C# + 2 (Aliphatic)": 'yellow'
-        }
-
-        # Call the method to create the 'Group' column
-        self.create_group_column()  
-
-        if 'Sample' and 'Description' in self.displayed_data:
-            has_sample_description = 'Sample' in self.displayed_data.columns and 'Description' in self.displayed_data.columns
-            has_group = 'Group' in self.displayed_data.columns
+        data = self.displayed_data
+        plot_type = self.plot_option
+        
+        def show_figures(figures):
+            for title, fig, plot_data in figures:
+                x_col, y_col, intensity = plot_data.columns
+                self.show_plot(plot_func=None, fig=fig, title=title,
+                               x_data=plot_data[x_col], y_data=plot_data[y_col], z_data=plot_data[intensity])
+        
+        # The figures are built on the worker thread and drawn in Tk windows
+        self.run_job("Scatter Plots", show_figures,
+                     lambda job: scatter_figures(data, plot_type, norm=norm, progress=job.report, **settings))
     
-            if has_sample_description and has_group:
-                
-                # Group the data by 'Sample', 'Description', and 'Group'
-                grouped_data = self.displayed_data.groupby(['Sample', 'Description', 'Group'])
-                
-                for (sample, description, group), group_data in grouped_data:
-                    
-                    # Check if the sample and the group are selected to be plotted
-                    if self.sample_vars.get(f"{sample} - {description}", tk.BooleanVar(value=False)).get() and self.group_vars.get(group, tk.BooleanVar(value=False)).get():
-                        fig, ax = plt.subplots()
-                        sc = ax.scatter(group_data[x_col], group_data[y_col], c=group_data[intensity], cmap='viridis', marker='.', norm=custom_norm)
-                        ax.set_xlabel(x_col)
-                        ax.set_ylabel(y_col)
-                        
-                        if self.plot_option == "DBE vs C#":
-                            
-                            # Set the axis limits based on the variables from the scale window
-                            ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                            ax.set_ylim(self.DBE_min.get(), self.DBE_max.get())
-        
-                            # Define the asymptote details
-                            asymptote_details = [
-                                (0.5, 6, "DBE = 0.5*C# (Aromatic)"),
-                                (0.67, 10, "DBE = 0.67*C# (Condensed Aromatic)"),
-                                (0.735, 10, "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)"),
-                                (0.92, 16, "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)"),
-                                (0.9, 6, "DBE = 0.9*C# (HC Cluster)"),
-                                (None, 2, "DBE = C#+1 (Carbon Clusters)")
-                            ]
-        
-                            # Check if the asymptote is selected to be plotted
-                            for asymptote_value, start_point, asymptote in asymptote_details:
-                                if self.asymptote_vars.get(asymptote).get():
-                                    x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                                    color = asymptote_colors[asymptote]
-        
-                                    # Create asymptotes
-                                    if asymptote_value is None:  # This is for AI=(1/C#)+1
-                                        ax.plot(x_values, x_values + 1, label="Carbon Clusters", color=color) 
-                                        
-                                    else:
-                                        if  asymptote == "DBE = 0.5*C# (Aromatic)":
-                                            ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="Aromatic", color=color)
-                                            
-                                        elif  asymptote == "DBE = 0.67*C# (Condensed Aromatic)":
-                                            ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="Condensed Aromatic", color=color)
-                                            
-                                        elif  asymptote == "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)":
-                                            ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) - 0.5, label="Cata-condensed PAHs", color=color)
-                                            
-                                        elif  asymptote == "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)":
-                                            ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) - 3.24, label="Peri-condensed PAHs", color=color)
-                                            
-                                        elif  asymptote == "DBE = 0.9*C# (HC Cluster)":
-                                            ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="HC Cluster", color=color)
-                                    
-                            ax.legend()
-                                
-                        elif self.plot_option == "H# vs C#":
-                            
-                            # Set the axis limits based on the variables from the scale window
-                            ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                            ax.set_ylim(self.H_num_min.get(), self.H_num_max.get())
-                            
-                            # Define the asymptote details
-                            asymptote_details = [
-                                (6, 16, "H# = sqrt(6*C#) (Peri-condensed PAHs)"),
-                                (0.5, 10, "H# = 0.5*C# + 3 (Cata-condensed PAHs)"),
-                                (1, 2, "H# = C#"),
-                                (1.25, 2, "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)"),
-                                (2, 2, "H# = 2*C# + 2 (Aliphatic)")
-                            ]
-                                               
-                            # Check if the asymptote is selected to be plotted
-                            for asymptote_value, start_point, asymptote in asymptote_details:
-                                if self.asymptote_vars.get(asymptote).get():
-                                    x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                                    color = asymptote_colors[asymptote]
-        
-                                    # Create asymptotes
-                                    if  asymptote == "H# = sqrt(6*C#) (Peri-condensed PAHs)":
-                                        ax.plot(x_values, np.sqrt([asymptote_value]*len(x_values)*x_values), label="Peri-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "H# = 0.5*C# + 3 (Cata-condensed PAHs)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 3, label="Cata-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 2.5, label="Aliphatic/Aromatic", color=color)
-                                        
-                                    elif  asymptote == "H# = 2*C# + 2 (Aliphatic)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 2, label="Aliphatic", color=color)
-                                        
-                                    else:
-                                        ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="H# = C#", color=color)             
-                                    
-                            ax.legend()
-                            
-                        else:
-                            # Set the axis limits based on the variables from the scale window
-                            ax.set_xlim(self.Mass_min.get(), self.Mass_max.get())
-                            ax.set_ylim(self.HC_min.get(), self.HC_max.get())
-    
-                        plt.colorbar(sc, ax=ax, label=intensity)
-                        title = f'{sample} {description}, {group}'
-                        self.show_plot(plot_func=None, fig=fig, title=title, x_data=group_data[x_col], y_data=group_data[y_col], z_data=group_data[intensity]) 
-
-        else:
-            grouped_data = self.displayed_data.groupby('Group')
-            for group, group_data in grouped_data:
-                
-                # Check if the group are selected to be plotted
-                if  self.group_vars.get(group, tk.BooleanVar(value=False)).get():
-                    fig, ax = plt.subplots()
-                    sc = ax.scatter(group_data[x_col], group_data[y_col], c=group_data[intensity], cmap='viridis', marker='.', norm=colors.LogNorm())
-                    ax.set_xlabel(x_col)
-                    ax.set_ylabel(y_col)
-            
-                    if self.plot_option == "DBE vs C#":
-                        
-                        # Set the axis limits based on the variables from the scale window
-                        ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                        ax.set_ylim(self.DBE_min.get(), self.DBE_max.get())
-        
-                        # Define the asymptote details
-                        asymptote_details = [
-                            (0.5, 6, "DBE = 0.5*C# (Aromatic)"),
-                            (0.67, 10, "DBE = 0.67*C# (Condensed Aromatic)"),
-                            (0.735, 10, "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)"),
-                            (0.92, 16, "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)"),
-                            (0.9, 6, "DBE = 0.9*C# (HC Cluster)"),
-                            (None, 2, "DBE = C#+1 (Carbon Clusters)")
-                        ]
-                                                 
-                        # Check if the asymptote is selected to be plotted
-                        for asymptote_value, start_point, asymptote in asymptote_details:
-                            if self.asymptote_vars.get(asymptote).get():
-                                x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                                color = asymptote_colors[asymptote]
-    
-                                # Create asymptotes
-                                if asymptote_value is None:  # This is for AI=(1/C#)+1
-                                    ax.plot(x_values, x_values + 1, label="Carbon Clusters", color=color)
-                                    
-                                else:
-                                    if  asymptote == "DBE = 0.5*C# (Aromatic)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="Aromatic", color=color)
-                                        
-                                    elif  asymptote == "DBE = 0.67*C# (Condensed Aromatic)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="Condensed Aromatic", color=color)
-                                        
-                                    elif  asymptote == "DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) - 0.5, label="Cata-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) - 3.24, label="Peri-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "DBE = 0.9*C# (HC Cluster)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="HC Cluster", color=color)
-                                
-                        ax.legend()
-                            
-                    elif self.plot_option == "H# vs C#":
-                        
-                        # Set the axis limits based on the variables from the scale window
-                        ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                        ax.set_ylim(self.H_num_min.get(), self.H_num_max.get())
-                        
-                        # Define the asymptote details
-                        asymptote_details = [
-                            (6, 16, "H# = sqrt(6*C#) (Peri-condensed PAHs)"),
-                            (0.5, 10, "H# = 0.5*C# + 3 (Cata-condensed PAHs)"),
-                            (1, 2, "H# = C#"),
-                            (1.25, 2, "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)"),
-                            (2, 2, "H# = 2*C# + 2 (Aliphatic)")
-                        ]
-                                           
-                        # Check if the asymptote is selected to be plotted
-                        for asymptote_value, start_point, asymptote in asymptote_details:
-                            if self.asymptote_vars.get(asymptote).get():
-                                x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                                color = asymptote_colors[asymptote]
-    
-                                # Create asymptotes
-                                if  asymptote == "H# = sqrt(6*C#) (Peri-condensed PAHs)":
-                                    ax.plot(x_values, np.sqrt([asymptote_value]*len(x_values)*x_values), label="Peri-condensed PAHs", color=color)
-                                    
-                                elif  asymptote == "H# = 0.5*C# + 3 (Cata-condensed PAHs)":
-                                    ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 3, label="Cata-condensed PAHs", color=color)
-                                    
-                                elif  asymptote == "H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)":
-                                    ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 2.5, label="Aliphatic/Aromatic", color=color)
-                                    
-                                elif  asymptote == "H# = 2*C# + 2 (Aliphatic)":
-                                    ax.plot(x_values, ([asymptote_value]*len(x_values)*x_values) + 2, label="Aliphatic", color=color)
-                                    
-                                else:
-                                    ax.plot(x_values, [asymptote_value]*len(x_values)*x_values, label="H# = C#", color=color)             
-                                
-                        ax.legend()
-                        
-                    else:
-                        # Set the axis limits based on the variables from the scale window
-                        ax.set_xlim(self.Mass_min.get(), self.Mass_max.get())
-                        ax.set_ylim(self.HC_min.get(), self.HC_max.get())
-        
-                    if intensity == 'Absolute intensity (Average)':
-                        plt.colorbar(sc, ax=ax, label='Averaged absolute intensity')
-                        
-                    else:
-                        plt.colorbar(sc, ax=ax, label='Averaged relative intensity')
-                                        
-                    # Constructing title parts from the unique_samples and unique_descriptions
-                    title_parts = [f'{sample} {description}' for sample, description in zip(self.unique_samples, self.unique_descriptions)]
-                    
-                    # Constructing the final title
-                    title = f"Average of {', '.join(title_parts[:-1])} & {title_parts[-1]}, {group}"
-                        
-                    self.show_plot(plot_func=None, fig=fig, title=title, x_data=group_data[x_col], y_data=group_data[y_col], z_data=group_data[intensity]) 
+    def make_plot(self, x_col, y_col):
+        # The 'Group' column is added by scatter_figures if the data does not have it yet
+        self.show_scatter_plots()
 
     def make_ai_plots(self, selected_groups):
         if self.displayed_data is None:
             messagebox.showerror("Error", "No data to plot. Please load data first.")
             return
         
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
-            
-        else:
-            intensity = 'Relative intensity (Average)'
+        # The 'Group' and AI columns are added by scatter_figures if the data does not have them yet
+        self.show_scatter_plots()
+    
+    def save_all_plots(self):
+        settings = self.plot_settings()
+        combine = {"None": None, "Grid": 'grid', "PDF": 'pdf'}[self.combine_var.get()]
+        plot_type = self.plot_option
+        data = self.displayed_data
+        
+        try:
+            intensity_norm(*settings['intensity_range'])
             
-        asymptote_colors = {
-            "AI = 0.5 (Aromatic)": 'red',
-            "AI = 0.67 (Condensed Aromatic)": 'blue',
-            "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)": 'green',
-            "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)": 'purple',
-            "AI = 0.9 (HC Cluster)": 'orange',
-            "AI = 1 + 1/C# (Carbon Clusters)": 'brown'
-        }
+        except ValueError as error:
+            messagebox.showerror("Error", str(error))
+            return
         
-        # Get the min and max intensity values from the user input
-        intensity_min = self.intensity_min.get()
-        intensity_max = self.intensity_max.get()
+        out_dir = filedialog.askdirectory(title="Select a folder for the plots")
         
-        # Create a custom logarithmic colormap normalization with the defined min and max values if they are set
-        if intensity_min == 0.0 and intensity_max == 0.0:
-            # default logarithmic scaling without custom min and max values
-            custom_norm = colors.LogNorm()
-              
-        else:
-            if intensity_min == 0.0 or intensity_max == 0.0:
-                messagebox.showerror("Error", "The logarithm of 0 is not defined. Please enter another value")
-            else:
-                custom_norm = colors.LogNorm(vmin=intensity_min, vmax=intensity_max, clip=True)
-
-        # Add new columns for DBE_AI and C#_AI
-        self.displayed_data['DBE_AI'] = 1 + self.displayed_data['C#'] - self.displayed_data['O#'] - (self.displayed_data['H#'] / 2)
-        self.displayed_data['C#_AI'] = self.displayed_data['C#'] - self.displayed_data['O#'] - self.displayed_data['N#']
-
-        # Add AI column, set AI to 0 where DBE_AI or C#_AI are less than or equal to 0
-        self.displayed_data['AI'] = self.displayed_data['DBE_AI'] / self.displayed_data['C#_AI']
-        self.displayed_data.loc[(self.displayed_data['DBE_AI'] <= 0) | (self.displayed_data['C#_AI'] <= 0), 'AI'] = 0     
-
-        self.create_group_column()
+        if not out_dir:
+            messagebox.showerror("Error", "No folder selected. Please select a folder to save the plots.")
+            return
+        
+        def saved(paths):
+            messagebox.showinfo("Info", f"{len(paths)} files saved to {out_dir}.")
+        
+        # The figures are rendered by worker processes straight to the files, no window is opened
+        self.run_job("Saving plots", saved,
+                     lambda job: render_figures(data, plot_type, out_dir=out_dir, combine=combine,
+                                                progress=job.report, **settings))
         
-        if 'Sample' and 'Description' in self.displayed_data:
-            for (sample, description), group_data in self.displayed_data.groupby(['Sample', 'Description']):
-                
-                # Check if the sample is selected to be plotted
-                if self.sample_vars.get(f"{sample} - {description}", tk.BooleanVar(value=False)).get():
-                    for selected_group in selected_groups:
-                        
-                        # Filter data for the selected group
-                        group_data_selected = group_data[group_data['Group'] == selected_group]
-    
-                        # Create plot for selected group
-                        fig, ax = plt.subplots()
-                        sc = ax.scatter(group_data_selected['C#'], group_data_selected['AI'], c=group_data_selected[intensity], cmap='viridis', marker='.', norm=custom_norm)
-                        ax.set_title(selected_group)
-                        ax.set_xlabel('C#')
-                        ax.set_ylabel('AI')
-    
-                        # Set the axis limits based on the variables from the scale window
-                        ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                        ax.set_ylim(self.AI_min.get(), self.AI_max.get())
-    
-                        # Define the asymptote details
-                        asymptote_details = [
-                            (0.5, 6, "AI = 0.5 (Aromatic)"),
-                            (0.67, 10, "AI = 0.67 (Condensed Aromatic)"),
-                            (0.735, 10, "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)"),
-                            (0.92, 16, "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)"),
-                            (0.9, 6, "AI = 0.9 (HC Cluster)"),
-                            (None, 2, "AI = 1 + 1/C# (Carbon Clusters)")
-                        ]
-                        
-                        # Check if the asymptote is selected to be plotted
-                        for asymptote_value, start_point, asymptote in asymptote_details:
-                            if self.asymptote_vars.get(asymptote).get():
-                                x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                                color = asymptote_colors[asymptote]
-    
-                                # Create asymptotes
-                                if asymptote_value is None:  # This is for AI=(1/C#)+1
-                                    ax.plot(x_values, (1 / x_values) + 1, label="Carbon Clusters", color=color)
-                                    
-                                else:
-                                    if  asymptote == "AI = 0.5 (Aromatic)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values), label="Aromatic", color=color)
-                                        
-                                    elif  asymptote == "AI = 0.67 (Condensed Aromatic)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values), label="Condensed Aromatic", color=color)
-                                        
-                                    elif  asymptote == "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)) - (0.5/x_values), label="Cata-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)":
-                                        ax.plot(x_values, ([asymptote_value]*len(x_values)) - (3.24/x_values), label="Peri-condensed PAHs", color=color)
-                                        
-                                    elif  asymptote == "AI = 0.9 (HC Cluster)":
-                                        ax.plot(x_values, [asymptote_value]*len(x_values), label="HC Cluster", color=color)
-                                
-                        ax.legend()
-    
-                        plt.colorbar(sc, ax=ax, label=intensity)
-    
-                        self.show_plot(plot_func=None, fig=fig, title=f"{sample} {description}, {selected_group}", x_data=group_data_selected['C#'], y_data=group_data_selected['AI'], z_data=group_data_selected[intensity])
-                    
-        else:
-            grouped_data = self.displayed_data.groupby('Group')
-            
-            for group, group_data in grouped_data:
-                
-                # Check if the group are selected to be plotted
-                if  self.group_vars.get(group, tk.BooleanVar(value=False)).get():
-                    
-                    # Create plot for selected group
-                    fig, ax = plt.subplots()
-                    sc = ax.scatter(group_data['C#'], group_data['AI'], c=group_data[intensity], cmap='viridis', marker='.', norm=colors.LogNorm())
-                    ax.set_title(group)
-                    ax.set_xlabel('C#')
-                    ax.set_ylabel('AI')
-    
-                    # Set the axis limits based on the variables from the scale window
-                    ax.set_xlim(self.C_num_min.get(), self.C_num_max.get())
-                    ax.set_ylim(self.AI_min.get(), self.AI_max.get())
-    
-                    # Define the asymptote details
-                    asymptote_details = [
-                        (0.5, 6, "AI = 0.5 (Aromatic)"),
-                        (0.67, 10, "AI = 0.67 (Condensed Aromatic)"),
-                        (0.735, 10, "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)"),
-                        (0.92, 16, "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)"),
-                        (0.9, 6, "AI = 0.9 (HC Cluster)"),
-                        (None, 2, "AI = 1 + 1/C# (Carbon Clusters)")
-                    ]
-                    
-                    # Check if the asymptote is selected to be plotted
-                    for asymptote_value, start_point, asymptote in asymptote_details:
-                        if self.asymptote_vars.get(asymptote).get():
-                            x_values = np.linspace(start_point, ax.get_xlim()[1], 100)
-                            color = asymptote_colors[asymptote]
-                            
-                            # Create asymptotes
-                            if asymptote_value is None:  # This is for AI=(1/C#)+1
-                                ax.plot(x_values, (1 / x_values) + 1, label="Carbon Clusters", color=color)
-                                
-                            else:
-                                if  asymptote == "AI = 0.5 (Aromatic)":
-                                    ax.plot(x_values, [asymptote_value]*len(x_values), label="Aromatic", color=color)
-                                    
-                                elif  asymptote == "AI = 0.67 (Condensed Aromatic)":
-                                    ax.plot(x_values, [asymptote_value]*len(x_values), label="Condensed Aromatic", color=color)
-                                    
-                                elif  asymptote == "AI = 0.735 - 0.5/C# (Cata-condensed PAHs)":
-                                    ax.plot(x_values, ([asymptote_value]*len(x_values)) - (0.5/x_values), label="Cata-condensed PAHs", color=color)
-                                    
-                                elif  asymptote == "AI = 0.92 - 3.24/C# (Peri-condensed PAHs)":
-                                    ax.plot(x_values, ([asymptote_value]*len(x_values)) - (3.24/x_values), label="Peri-condensed PAHs", color=color)
-                                    
-                                elif  asymptote == "AI = 0.9 (HC Cluster)":
-                                    ax.plot(x_values, [asymptote_value]*len(x_values), label="HC Cluster", color=color)
-                            
-                    ax.legend()
-                    
-                    if intensity == 'Absolute intensity (Average)':
-                        plt.colorbar(sc, ax=ax, label='Averaged absolute intensity')
-                        
-                    else:
-                        plt.colorbar(sc, ax=ax, label='Averaged relative intensity')
-                    
-                    # Constructing title parts from the unique_samples and unique_descriptions
-                    title_parts = [f'{sample} {description}' for sample, description in zip(self.unique_samples, self.unique_descriptions)]
-                    
-                    # Constructing the final title
-                    title = f"Average of {', '.join(title_parts[:-1])} & {title_parts[-1]}, {group}"    
-                    self.show_plot(plot_func=None, fig=fig, title=title, x_data=group_data['C#'], y_data=group_data['AI'], z_data=group_data[intensity])   
-                
     def family_selection_window(self):
         
         def open_scale_selection_and_destroy():
@@ -1582,16 +1169,11 @@ class DataFilterApp(tk.Tk):
         family_selection_window.geometry(f"+{comparison_window_x}+{comparison_window_y}")
         
         if 'Sample' and 'Description' in self.displayed_data:
-            # Extract selected samples
-            selected_samples = [sample for sample, var in self.sample_vars.items() if var.get()]
-        
-            # Separate sample and description values
-            sample_values = [sample.split(' - ')[0] for sample in selected_samples]
-            description_values = [sample.split(' - ')[1] for sample in selected_samples]
+            # Extract the selected (Sample, Description) pairs
+            selected_samples = [tuple(sample.split(" - ", 1)) for sample, var in self.sample_vars.items() if var.get()]
         
-            # Filter the displayed data to include only the selected samples
-            displayed_samples = self.displayed_data[(self.displayed_data['Sample'].isin(sample_values)) &
-                                                    (self.displayed_data['Description'].isin(description_values))]
+            # Filter the displayed data to include only the selected pairs, not every combination of their parts
+            displayed_samples = select_samples(self.displayed_data, selected_samples)
             
         else:
             # Otherwise the selected samples does not need to be extracted
@@ -1648,158 +1230,23 @@ class DataFilterApp(tk.Tk):
         ttk.Button(scale_selection_window, text="Plot", command=plot_family_analysis_and_destroy).grid(row=i+1, column=0)
     
     def make_family_analysis_plot(self, displayed_samples):
+        selected_families = [family for family, var in self.family_vars.items() if var.get()]
+        log_scale = self.scale_var.get() == "Logarithmic Scale"
         
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
+        if 'Sample' in self.displayed_data and 'Description' in self.displayed_data:
+            data, compared_title = displayed_samples, ''
             
         else:
-            intensity = 'Relative intensity (Average)'
+            data = self.displayed_data
+            compared_title = average_title(self.unique_samples, self.unique_descriptions)
         
-        predefined_order = [
-            'Aliphatics', 'Aromatics', 'Condensed Aromatics', 'HC Clusters', 
-            'Carbon Clusters', 'Fullerenes', 'Nitrogen Species', 
-            'Oxygen Species', 'Nitrogen Oxygen Species', 'Elements', 
-            'Organo-metallics'
-            ]
-    
-        selected_families = [family for family, var in self.family_vars.items() if var.get()]
-    
-        # Arrange selected_families in predefined_order
-        selected_families.sort(key=lambda x: predefined_order.index(x))
-    
-        n_families = len(selected_families)
-    
-        # Define the width of a bar
-        bar_width = 0.8 / n_families
-    
-        # Create a color map for the families
-        color_map = plt.get_cmap('tab10')
-        family_colors = {family: color_map(i) for i, family in enumerate(selected_families)}
-        
-        if 'Sample' and 'Description' in self.displayed_data:
-            sample_groups = displayed_samples.groupby(['Sample', 'Description'])
+        def show_figures(figures):
+            for title, fig in figures:
+                self.show_plot(plot_func=None, fig=fig, title=title)
         
-            for value_column, ylabel, plot_title in zip([intensity, 'Formula'], 
-                                                        ['Sum of ' + intensity, 'Number of species'],
-                                                        ['Family Analysis', 'Family Analysis']):
-                
-                # Track families that have been added to the legend
-                added_to_legend = []
-                
-                # Generate the bar plot for each sample
-                fig, ax = plt.subplots()
-        
-                # Initialize the x position for the first bar
-                x_pos = 0
-        
-                # Create a list to store the x positions of the middle of each bar group
-                group_centers = []
-        
-                for (sample, description), group_data in sample_groups:
-                    # Filter the data to include only the selected families
-                    filtered_data = group_data[group_data['Family'].isin(selected_families)]
-        
-                    if value_column == intensity:
-                        # Group the data by 'Family' and calculate the sum of the absolute intensity for each group
-                        bar_data = filtered_data.groupby('Family')[value_column].sum().reindex(selected_families, fill_value=0)
-                    else:  # 'Formula'
-                        # Group the data by 'Family' and calculate the unique count for each group
-                        bar_data = filtered_data.groupby('Family')[value_column].nunique().reindex(selected_families, fill_value=0)
-        
-                    # Record the start x position of this group
-                    group_start_x = x_pos
-        
-                    for i, (family, value) in enumerate(bar_data.items()):
-                        if value > 0:  # Only plot the bar if the value is greater than 0
-                            label = family if family not in added_to_legend else ""
-                            ax.bar(x_pos, value, width=bar_width, color=family_colors[family], label=label)
-                            x_pos += bar_width
-                
-                            # If the family was added to the legend, mark it as added
-                            if family not in added_to_legend:
-                                added_to_legend.append(family)
-        
-                    # Store the x position of the middle of the group
-                    group_centers.append(group_start_x + (x_pos - group_start_x - bar_width) / 2)
-        
-                    # Define the space between bar groups based on the number of bars
-                    space_between_groups = 0.4 + (x_pos - group_start_x)
-        
-                    # Update the x position for the next bar group
-                    x_pos = group_start_x + space_between_groups
-        
-                # Set the y-axis scale based on the selected option
-                y_scale = self.scale_var.get()
-                ax.set_yscale('log' if y_scale == "Logarithmic Scale" else 'linear')
-        
-                # Set the x-axis ticks to be the sample names
-                sample_names = [f"{sample}, {description}" for sample, description in sample_groups.groups.keys()]
-                ax.set_xticks(group_centers)
-                ax.set_xticklabels(sample_names, rotation=0)
-        
-                ax.set_xlabel('Sample')
-                ax.set_ylabel(ylabel)
-                ax.set_title('Family Analysis')
-                ax.legend(title='Family')
-        
-                self.show_plot(plot_func=None, fig=fig, title=plot_title)
-
-        else:       
-            # Filter the data to include only the selected families
-            filtered_data = self.displayed_data[self.displayed_data['Family'].isin(selected_families)]
-            
-            # Define the bar width. You can adjust this as needed.
-            bar_width = 1
-            
-            # Create an array for the x positions of the bars
-            x_pos = np.arange(len(selected_families))
-            
-            # Create a dictionary mapping families to colors using the color map
-            color_map = plt.get_cmap('tab10')
-            family_colors = {family: color_map(i) for i, family in enumerate(selected_families)}
-            
-            # Constructing title parts from the unique_samples and unique_descriptions
-            title_parts = [f'{sample} {description}' for sample, description in zip(self.unique_samples, self.unique_descriptions)]
-            
-            # Constructing the final title
-            sample_name = f"Average of {', '.join(title_parts[:-1])} & {title_parts[-1]}"
-            
-            # Metrics to be plotted
-            metrics = [
-                {
-                    'value': filtered_data.groupby(['Family'])[intensity].sum().reindex(selected_families, fill_value=0),
-                    'ylabel': 'Sum of average absolute intensity' if intensity == 'Absolute intensity (Average)' else 'Sum of average relative intensity',
-                    'title': 'Family Analysis'
-                },
-                {
-                    'value': filtered_data.groupby('Family')['Formula'].nunique().reindex(selected_families, fill_value=0),
-                    'ylabel': 'Number of species',
-                    'title': 'Family Analysis'
-                }
-            ]
-            
-            # Loop through metrics to create the plots
-            for metric in metrics:
-                fig, ax = plt.subplots()
-                for i, (family, value) in enumerate(metric['value'].items()):
-                    ax.bar(x_pos[i], value, width=bar_width, color=family_colors[family], label=family)
-            
-                y_scale = self.scale_var.get()
-                ax.set_yscale('log' if y_scale == "Logarithmic Scale" and metric['title'] == 'Family Analysis' else 'linear')
-                ax.set_xticks([])
-                ax.set_ylabel(metric['ylabel'])
-                ax.set_title(metric['title'])
-                ax.legend(title='Family')
-            
-                plt.text(0.5, -0.05, sample_name, ha='center', va='center', transform=ax.transAxes)
-            
-                self.show_plot(plot_func=None, fig=fig, title=metric['title'])
+        # The figures are built on the worker thread and drawn in Tk windows
+        self.run_job("Family Analysis", show_figures,
+                     lambda job: family_figures(data, selected_families, log_scale, compared_title))
             
     def plot_common_species(self, selected_groups):
         
@@ -1824,13 +1271,13 @@ class DataFilterApp(tk.Tk):
             else:
                 custom_norm = colors.LogNorm(vmin=intensity_min, vmax=intensity_max, clip=True)
         
-        # Create group column
-        self.create_group_column()
+        # Data with the group column
+        data = self.group_data()
         
         filtered_data = {group: pd.DataFrame() for group in selected_groups}
         
         # Filter data based os selected groups
-        for (sample, description), group_data in self.displayed_data.groupby(['Sample', 'Description']):
+        for (sample, description), group_data in data.groupby(['Sample', 'Description'], observed=True):
             if self.sample_vars.get(f"{sample} - {description}", tk.BooleanVar(value=False)).get():
                 for selected_group in selected_groups:
                     group_data_filtered = group_data[group_data['Group'] == selected_group]                   
@@ -1838,7 +1285,7 @@ class DataFilterApp(tk.Tk):
         
         # Generated the plot for each selected group
         for selected_group in selected_groups:
-            sample_counts = filtered_data[selected_group].groupby(['Sample', 'Description'])['Formula'].count()
+            sample_counts = filtered_data[selected_group].groupby(['Sample', 'Description'], observed=True)['Formula'].count()
         
             most_data_sample = sample_counts.idxmax()
             least_data_sample = sample_counts.idxmin() if len(sample_counts) > 1 else most_data_sample
@@ -2002,7 +1449,7 @@ class DataFilterApp(tk.Tk):
     
             if file_path:
                 # Export as CSV for both CSV and TXT extensions
-                self.displayed_data.to_csv(file_path, index=False, sep=',')
+                drop_derived_columns(self.displayed_data).to_csv(file_path, index=False, sep=',')
     
                 messagebox.showinfo("Info", "Data exported successfully.")
                 
@@ -2012,6 +1459,144 @@ class DataFilterApp(tk.Tk):
         else:
             messagebox.showerror("Error", "No data to export. Please load data first.")
             
+class VirtualTable(ttk.Frame):
+    
+    def __init__(self, parent, height=25, padding=20, sample_size=500):
+        super().__init__(parent)
+        self.data = None
+        self.offset = 0
+        self.visible_rows = height
+        self.padding = padding
+        self.sample_size = sample_size
+        
+        # Widest content seen per column, so widths do not jump between views
+        self.column_widths = {}
+        self.font = tkfont.Font()
+        
+        # The Treeview only ever holds the rows of the visible window
+        self.treeview = ttk.Treeview(self, height=height)
+        self.treeview.grid(row=0, column=0, padx=(0, 10), sticky="nsew")
+        
+        # Create scrollbars, the vertical one scrolls through the DataFrame instead of the Treeview
+        self.y_scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.y_scrollbar.grid(row=0, column=1, sticky="ns")
+        
+        x_scrollbar = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.treeview.xview)
+        x_scrollbar.grid(row=1, column=0, sticky="ew")
+        self.treeview.configure(xscrollcommand=x_scrollbar.set)
+        
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.treeview.bind(sequence, self.on_mousewheel)
+            
+        self.treeview.bind("<Configure>", self.on_resize)
+        
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        
+    def set_data(self, data):
+        self.data = data
+    
+        # Add an empty first column for the Treeview widget
+        self.treeview['columns'] = ('',) + tuple(data.columns)
+    
+        # Configure the first column
+        self.treeview.column('', width=0, stretch=tk.NO)
+        
+        for col in data.columns:
+            self.treeview.heading(col, text=col, anchor=tk.W)
+    
+            # Use minwidth instead of width to allow resizing
+            self.treeview.column(col, anchor=tk.W, minwidth=self.column_width(data, col))
+            
+        self.render(0)
+        
+    def column_width(self, data, col):
+        values = data[col]
+        
+        # Estimate the content width from the first and last rows and a random sample
+        if len(values) > self.sample_size:
+            n = self.sample_size // 3
+            values = pd.concat([values.head(n), values.tail(n), values.sample(n, random_state=0)])
+        
+        max_width = max((self.font.measure(str(val)) for val in values.astype(object).fillna('')), default=0)
+        header_width = self.font.measure(col.title())
+        
+        self.column_widths[col] = max(self.column_widths.get(col, 0), header_width, max_width)
+        
+        return self.column_widths[col] + self.padding
+        
+    def render(self, offset):
+        if self.data is None:
+            return
+        
+        n_rows = len(self.data)
+        self.offset = min(max(0, offset), max(0, n_rows - self.visible_rows))
+        
+        window = self.data.iloc[self.offset:self.offset + self.visible_rows]
+        items = self.treeview.get_children()
+        
+        # Remove the rows that are not needed anymore
+        if len(items) > len(window):
+            self.treeview.delete(*items[len(window):])
+        
+        # Reuse the existing rows and only insert the missing ones
+        for i, (index, row) in enumerate(zip(window.index, window.itertuples(index=False, name=None))):
+            values = (index,) + row
+            
+            if i < len(items):
+                self.treeview.item(items[i], values=values)
+                
+            else:
+                self.treeview.insert("", "end", values=values)
+                
+        if n_rows:
+            self.y_scrollbar.set(self.offset / n_rows, (self.offset + len(window)) / n_rows)
+            
+        else:
+            self.y_scrollbar.set(0, 1)
+        
+    def yview(self, *args):
+        if self.data is None:
+            return
+        
+        if args[0] == 'moveto':
+            self.render(int(float(args[1]) * len(self.data)))
+            
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.render(self.offset + int(args[1]) * step)
+            
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview('scroll', -3, 'units')
+            
+        else:
+            self.yview('scroll', 3, 'units')
+            
+        return "break"
+    
+    def on_resize(self, event):
+        # Fit the number of rendered rows to the height of the widget
+        row_height = int(float(ttk.Style().lookup("Treeview", "rowheight") or self.font.metrics("linespace") + 4))
+        heading_height = row_height + 4
+        visible_rows = max(1, (event.height - heading_height) // row_height)
+        
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render(self.offset)
+            
+    def clear(self):
+        for col in self.treeview["columns"]:
+            self.treeview.heading(col, text="")
+            self.treeview.column(col, width=0)
+            
+        self.treeview["columns"] = ()
+        self.treeview.delete(*self.treeview.get_children())
+        
+        self.data = None
+        self.offset = 0
+        self.y_scrollbar.set(0, 1)
+
 class FamiliesDialog(simpledialog.Dialog):
     
     def __init__(self, parent, all_families, selected_families):
@@ -2034,10 +1619,16 @@ class FamiliesDialog(simpledialog.Dialog):
 
 class FilterDialog(simpledialog.Dialog):
     
-    def __init__(self, parent, displayed_data, filter_callback):
-        self.displayed_data = displayed_data
+    def __init__(self, parent, data_filter, filter_callback, values=None):
+        # The family statistics of the filter answer the "All" and "Update" buttons
+        self.data_filter = data_filter
+        self.displayed_data = data_filter.data
         self.filter_callback = filter_callback
         self.vars = []
+        
+        # Entry values shown when the dialog opens, and the ones that were applied
+        self.initial_values = values
+        self.values = None
         super().__init__(parent, title="Filter Data")
 
     def body(self, parent):
@@ -2061,6 +1652,10 @@ class FilterDialog(simpledialog.Dialog):
         
         self.vars = [tk.StringVar() for _ in range(len(labels))]
         entries = []
+        
+        if self.initial_values is not None:
+            for var, value in zip(self.vars, self.initial_values):
+                var.set(value)
 
         # Handling Family line
         ttk.Label(parent, text=labels[0]).grid(row=0, column=0, padx=5, pady=5)
@@ -2131,6 +1726,7 @@ class FilterDialog(simpledialog.Dialog):
     
         if family_filter:
             self.filter_callback(family_filter, c_min_max, mass_min_max, intensity_min_max, c_ranges, mass_ranges)
+            self.values = [var.get() for var in self.vars]
             
         else:
             messagebox.showwarning("Warning", "Please enter a valid Family filter.")
@@ -2145,7 +1741,7 @@ class FilterDialog(simpledialog.Dialog):
 
     # Select families
     def select_families(self):
-        all_families = set(self.displayed_data['Family'])
+        all_families = set(self.data_filter.families())
         selected_families = self.vars[0].get().split(',')
         dialog = FamiliesDialog(self, all_families, selected_families)
         selected_families = dialog.result
@@ -2154,88 +1750,37 @@ class FilterDialog(simpledialog.Dialog):
             self.vars[0].set(','.join(selected_families))
 
     def set_all_families(self):
-        all_families = set(self.displayed_data['Family'])
+        all_families = set(self.data_filter.families())
         self.vars[0].set(','.join(all_families))
 
     # Update entry fields based on selected families
     def update_ranges(self):
+        for i in range(3):
+            self.update_range(i)
+
+    def update_range(self, index):
+        # Set the min and max entries of C# (0), mass (1) or intensity (2) to the range of the selected families
         selected_families = self.vars[0].get().split(',')
-        selected_data = self.displayed_data[self.displayed_data['Family'].isin(selected_families)]
-            
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            mass = 'Mass'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            mass = 'Mass'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
-            mass = 'Mass (Average)'
-            
-        else:
-            intensity = 'Relative intensity (Average)'
-            mass = 'Mass (Average)'
+        ranges = self.data_filter.family_ranges(selected_families)
+        column = ['C#', self.data_filter.mass, self.data_filter.intensity][index]
         
-        for i, column in enumerate(['C#', mass, intensity]):
+        if column in ranges:
+            min_val, max_val = ranges[column]
+            self.vars[index*3+1].set(min_val)
+            self.vars[index*3+2].set(max_val)
             
-            if not selected_data[column].empty:
-                min_val = min(selected_data[column])
-                max_val = max(selected_data[column])
-                self.vars[i*3+1].set(min_val)
-                self.vars[i*3+2].set(max_val)
-                
-            else:
-                self.vars[i*3+1].set("")
-                self.vars[i*3+2].set("")
+        else:
+            self.vars[index*3+1].set("")
+            self.vars[index*3+2].set("")
 
     def update_c(self):
-        selected_families = self.vars[0].get().split(',')
-        selected_data = self.displayed_data[self.displayed_data['Family'].isin(selected_families)]
-        
-        self.vars[1].set(min(selected_data['C#']))
-        self.vars[2].set(max(selected_data['C#']))
+        self.update_range(0)
 
     def update_mass(self):
-        
-        if 'Absolute intensity' in self.displayed_data:
-            mass = 'Mass'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            mass = 'Mass'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            mass = 'Mass (Average)'
-            
-        else:
-            mass = 'Mass (Average)'
-            
-        selected_families = self.vars[0].get().split(',')
-        selected_data = self.displayed_data[self.displayed_data['Family'].isin(selected_families)]
-        
-        self.vars[4].set(min(selected_data[mass]))
-        self.vars[5].set(max(selected_data[mass]))
+        self.update_range(1)
 
     def update_abs_intensity(self):
-        
-        if 'Absolute intensity' in self.displayed_data:
-            intensity = 'Absolute intensity'
-            
-        elif 'Relative intensity' in self.displayed_data:
-            intensity = 'Relative intensity'
-            
-        elif 'Absolute intensity (Average)' in self.displayed_data:
-            intensity = 'Absolute intensity (Average)'
-            
-        else:
-            intensity = 'Relative intensity (Average)'
-            
-        selected_families = self.vars[0].get().split(',')
-        selected_data = self.displayed_data[self.displayed_data['Family'].isin(selected_families)]
-        
-        self.vars[7].set(min(selected_data[intensity]))
-        self.vars[8].set(max(selected_data[intensity]))
+        self.update_range(2)
 
     def buttonbox(self):
         # Override the default buttonbox method to create ttk buttons
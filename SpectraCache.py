@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraCache
+@author: Sebastian Mehmed
+
+Description:
+    On-disk columnar cache of parsed sample files. Every data file of a
+    folder (export or .msd) is stored once, after parsing and
+    post-processing, as an uncompressed Arrow (Feather) file in a
+    ".spectrac_cache" folder inside the data folder. Entries are keyed by
+    file name, size, modification time and a content hash, so reopening a
+    folder only parses the files that changed and memory-maps the rest.
+    The cache files are named after the full file name, so "X.txt" and
+    "X.msd" get their own entries.
+
+    The cache needs pyarrow. Without it FolderCache.enabled is False and
+    every file is parsed as before.
+
+"""
+
+
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import pyarrow.feather as feather
+
+except ImportError:
+    feather = None
+
+
+CACHE_DIR = ".spectrac_cache"
+MANIFEST = "manifest.json"
+
+# Increase when the layout of the cached frames changes to drop old entries
+CACHE_VERSION = 2
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """Return the BLAKE2 hash of a file's content."""
+
+    digest = hashlib.blake2b(digest_size=20)
+
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _write_atomic(path, write):
+    # Write to a temporary file in the same folder and move it in place
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class FolderCache:
+
+    def __init__(self, folder_path):
+        self.cache_path = os.path.join(folder_path, CACHE_DIR)
+        self.manifest_path = os.path.join(self.cache_path, MANIFEST)
+        self.enabled = feather is not None
+        self.entries = {}
+        self.changed = False
+
+        if not self.enabled:
+            return
+
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+
+            if manifest.get('version') == CACHE_VERSION:
+                self.entries = manifest['entries']
+
+            else:
+                self.remove_cache_files()
+
+        except FileNotFoundError:
+            pass
+
+        except (OSError, ValueError, KeyError):
+            # Unwritable folder or broken manifest, start without cache
+            self.enabled = os.access(self.cache_path, os.W_OK)
+            self.entries = {}
+
+    def remove_cache_files(self):
+        # Drop the cached frames of an older cache version, their entries are not read
+        for cache_file in os.listdir(self.cache_path):
+            if cache_file.endswith('.feather'):
+                try:
+                    os.remove(os.path.join(self.cache_path, cache_file))
+
+                except OSError:
+                    pass
+
+        self.changed = True
+
+    def get(self, file_path):
+        """Return the cached frame of a file, or None if it is missing or stale."""
+
+        if not self.enabled:
+            return None
+
+        name = os.path.basename(file_path)
+        entry = self.entries.get(name)
+
+        if entry is None:
+            return None
+
+        stat = os.stat(file_path)
+
+        if stat.st_size != entry['size']:
+            return None
+
+        if stat.st_mtime_ns != entry['mtime']:
+            # The file was touched, only reuse the entry if the content is the same
+            if file_hash(file_path) != entry['hash']:
+                return None
+
+            entry['mtime'] = stat.st_mtime_ns
+            self.changed = True
+
+        try:
+            return feather.read_feather(os.path.join(self.cache_path, entry['cache_file']), memory_map=True)
+
+        except (OSError, ValueError):
+            return None
+
+    def put(self, file_path, df):
+        """Store the parsed frame of a file."""
+
+        if not self.enabled:
+            return
+
+        name = os.path.basename(file_path)
+        cache_file = name + '.feather'
+        stat = os.stat(file_path)
+
+        try:
+            _write_atomic(os.path.join(self.cache_path, cache_file),
+                          lambda path: feather.write_feather(df, path, compression='uncompressed'))
+
+        except OSError:
+            return
+
+        self.entries[name] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': file_hash(file_path),
+            'cache_file': cache_file
+            }
+        self.changed = True
+
+    def save(self, file_paths):
+        """Write the manifest, dropping entries of files that no longer exist."""
+
+        if not self.enabled:
+            return
+
+        names = {os.path.basename(file_path) for file_path in file_paths}
+
+        for name in list(self.entries):
+            if name not in names:
+                cache_file = os.path.join(self.cache_path, self.entries.pop(name)['cache_file'])
+                self.changed = True
+
+                try:
+                    os.remove(cache_file)
+
+                except OSError:
+                    pass
+
+        if not self.changed:
+            return
+
+        manifest = {'version': CACHE_VERSION, 'entries': self.entries}
+
+        def write_manifest(path):
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(manifest, file, indent=1)
+
+        try:
+            _write_atomic(self.manifest_path, write_manifest)
+            self.changed = False
+
+        except OSError:
+            pass
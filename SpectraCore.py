@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraCore
+@author: Sebastian Mehmed
+
+Description:
+    Analysis core of SpectraC: filtering, relative intensity, comparisons
+    (average and common species), group of species, aromaticity index and
+    family sums. The functions take plain DataFrames and explicit arguments
+    instead of Tk variables and return new frames, so they can be used,
+    benchmarked and run in worker processes without the Tk interface.
+    Loading is done by SpectraIO.load_folder.
+
+"""
+
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+# Columns taken from the representative row of a formula in comparisons
+COMPARE_COLUMNS = [
+    'C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Formula', 'Mass',
+    'Theoretical mass', 'Error', 'Family'
+    ]
+
+
+def sample_index(data):
+    """Return the (Sample, Description) pair of every row as a MultiIndex."""
+
+    return pd.MultiIndex.from_arrays([data['Sample'], data['Description']])
+
+
+def select_samples(data, selected_samples):
+    """Return the rows that belong to the selected (Sample, Description) pairs."""
+
+    return data[sample_index(data).isin([tuple(sample) for sample in selected_samples])]
+
+
+# Statistics of sample_stats
+SAMPLE_STATS = ['min', 'max', 'sum', 'count']
+
+
+def sample_stats(data, columns=None):
+    """Return min, max, sum and count of the numeric columns per (Sample, Description).
+
+    The table is computed in one grouped pass, its columns are (column,
+    statistic) pairs. Compared data has no samples and gives a single row.
+    """
+
+    if columns is None:
+        columns = [column for column in data.columns if pd.api.types.is_numeric_dtype(data[column])]
+
+    if 'Sample' in data and 'Description' in data:
+        return data.groupby(['Sample', 'Description'], observed=True, sort=False)[columns].agg(SAMPLE_STATS)
+
+    return data[columns].agg(SAMPLE_STATS).unstack().to_frame().T
+
+
+def sample_range(stats, column, selected_samples=None):
+    """Return the (min, max) of a column over the selected (Sample, Description) pairs of sample_stats.
+
+    All rows of the table are used if no samples are given.
+    """
+
+    if selected_samples is not None:
+        stats = stats[stats.index.isin([tuple(sample) for sample in selected_samples])]
+
+    return stats[(column, 'min')].min(), stats[(column, 'max')].max()
+
+
+def representative_rows(data):
+    """Return the row with the smallest |Error| per (Formula, Sample, Description).
+
+    The stable sort keeps the data order between equal errors, so the first
+    of them is picked like with idxmin.
+    """
+
+    order = np.argsort(data['Error'].abs().to_numpy(), kind='stable')
+
+    return data.iloc[order].drop_duplicates(['Formula', 'Sample', 'Description'])
+
+
+def per_sample_table(data, intensity, combinations, number_selected_samples):
+    """Build the wide per-sample intensity table of a comparison.
+
+    One row per formula, in order of first appearance in 'data', holding the
+    columns of the representative row of the first sample (in the order of
+    'combinations') that contains it. 'Mass' and 'Error' are the sums over
+    the representative rows divided by the number of rows of the formula.
+    The intensity of every sample goes into an "<intensity> (<Sample>_<Description>)"
+    column and their sum divided by 'number_selected_samples' into
+    "<intensity> (Average)".
+    """
+
+    best = representative_rows(data)
+
+    # Rank every representative row by formula and by sample
+    formulas = pd.Index(pd.unique(data['Formula']))
+    formula_rank = formulas.get_indexer(best['Formula'])
+    combination_rank = pd.MultiIndex.from_tuples(combinations).get_indexer(sample_index(best))
+
+    best = best.assign(formula_rank=formula_rank, combination_rank=combination_rank)
+    best = best.sort_values(['formula_rank', 'combination_rank'], kind='stable')
+
+    # The representative row of the first sample holding each formula
+    first_rows = best.drop_duplicates('formula_rank')
+    table = first_rows[COMPARE_COLUMNS].reset_index(drop=True)
+
+    # Mass and Error sums over the samples, divided by all rows of the formula
+    row_counts = data['Formula'].value_counts().reindex(first_rows['Formula']).to_numpy()
+    sums = best.groupby('formula_rank')[['Mass', 'Error']].sum()
+    table['Mass'] = sums['Mass'].to_numpy() / row_counts
+    table['Error'] = sums['Error'].to_numpy() / row_counts
+
+    # Pivot the intensities into one column per sample
+    wide = best.pivot(index='formula_rank', columns='combination_rank', values=intensity)
+
+    # Order the sample columns by the first formula they contain, like the
+    # columns appeared when the rows were concatenated one formula at a time
+    first_formula = best.groupby('combination_rank')['formula_rank'].min()
+    column_order = sorted(first_formula.index, key=lambda rank: (first_formula[rank], rank))
+    wide = wide[column_order]
+    wide.columns = [f"{intensity} ({combinations[rank][0]}_{combinations[rank][1]})" for rank in column_order]
+    wide = wide.reset_index(drop=True)
+
+    table = pd.concat([table, wide], axis=1)
+    table[intensity + ' (Average)'] = wide.sum(axis=1) / number_selected_samples
+
+    return table
+
+
+def average_samples(data, selected_samples):
+    """Average the selected samples into one row per formula.
+
+    Formulas missing from a sample get an intensity of 0 for that sample.
+    """
+
+    if 'Absolute intensity' in data:
+        intensity = 'Absolute intensity'
+
+    else:
+        intensity = 'Relative intensity'
+
+    data = select_samples(data, selected_samples)
+
+    # Samples in order of first appearance
+    combinations = list(sample_index(data).drop_duplicates())
+
+    df_averaged = per_sample_table(data, intensity, combinations, len(selected_samples))
+
+    # Replace all 'nan' values with 0
+    # We get 'nan' values when a sample does not contain the 'Formula'
+    # Which mean the intensity is 0
+    numeric_columns = df_averaged.select_dtypes(include='number').columns
+    df_averaged[numeric_columns] = df_averaged[numeric_columns].fillna(0)
+
+    # Rename 'Mass' and 'Error' to 'Mass (Average)' and 'Error (Average)'
+    return df_averaged.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+
+
+def common_species(data, selected_samples):
+    """Keep the formulas present in every selected sample, one row per formula.
+
+    The table has the same layout as the one of average_samples, with the
+    sample columns in sorted (Sample, Description) order. Returns None if the
+    samples have no formula in common.
+    """
+
+    if 'Absolute intensity' in data:
+        intensity = 'Absolute intensity'
+
+    else:
+        intensity = 'Relative intensity'
+
+    data = select_samples(data, selected_samples)
+
+    # Count in how many samples every formula is present
+    presence = data.drop_duplicates(['Formula', 'Sample', 'Description'])
+    combinations = sorted(sample_index(presence).unique())
+    sample_counts = presence['Formula'].value_counts()
+
+    common_formulas = sample_counts.index[sample_counts == len(combinations)]
+    data = data[data['Formula'].isin(common_formulas)]
+
+    if data.empty:
+        return None
+
+    df_common_species = per_sample_table(data, intensity, combinations, len(selected_samples))
+
+    # Rename 'Mass' and 'Error' to 'Mass (Average)' and 'Error (Average)'
+    return df_common_species.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+
+
+def intensity_columns(data):
+    """Return the names of the intensity and mass columns of the data."""
+
+    if 'Absolute intensity' in data:
+        return 'Absolute intensity', 'Mass'
+
+    elif 'Relative intensity' in data:
+        return 'Relative intensity', 'Mass'
+
+    elif 'Absolute intensity (Average)' in data:
+        return 'Absolute intensity (Average)', 'Mass (Average)'
+
+    else:
+        return 'Relative intensity (Average)', 'Mass (Average)'
+
+
+def range_mask(values, value_range, value_ranges):
+    """Return the rows within 'value_range' or any of 'value_ranges' (inclusive)."""
+
+    if value_range:
+        mask = (values >= value_range[0]) & (values <= value_range[1])
+
+    else:
+        mask = pd.Series(False, index=values.index)
+
+    for low, high in value_ranges or []:
+        mask |= (values >= low) & (values <= high)
+
+    return mask
+
+
+def filter_data(data, families, c_range, mass_range, intensity_range, c_ranges=None, mass_ranges=None):
+    """Keep the rows of the given families within the C#, mass and intensity ranges.
+
+    Like in the filter dialog, a C# or mass filter without a min/max range
+    and without extra ranges removes every row.
+    """
+
+    intensity, mass = intensity_columns(data)
+
+    # Family filter
+    filtered_data = data[data['Family'].isin(families)]
+
+    # C# filter
+    filtered_data = filtered_data[range_mask(filtered_data['C#'], c_range, c_ranges)]
+
+    # Mass filter
+    filtered_data = filtered_data[range_mask(filtered_data[mass], mass_range, mass_ranges)]
+
+    # Absolute/Relative intensity filter
+    return filtered_data[(filtered_data[intensity] >= intensity_range[0]) & (filtered_data[intensity] <= intensity_range[1])]
+
+
+def row_predicate(families=None, c_range=None, c_ranges=None, mass_range=None, mass_ranges=None,
+                  intensity_range=None):
+    """Return a function that gives the filter mask of a chunk of loaded rows.
+
+    The predicates are the ones of filter_data on the 'Absolute intensity'
+    and 'Mass' columns, but a missing predicate keeps every row, so the mask
+    can be evaluated on any part of a file while it is read.
+    """
+
+    def predicate(chunk):
+        mask = pd.Series(True, index=chunk.index)
+
+        if families is not None:
+            mask &= chunk['Family'].isin(families)
+
+        if c_range or c_ranges:
+            mask &= range_mask(chunk['C#'], c_range, c_ranges)
+
+        if mass_range or mass_ranges:
+            mask &= range_mask(chunk['Mass'], mass_range, mass_ranges)
+
+        if intensity_range:
+            mask &= range_mask(chunk['Absolute intensity'], intensity_range, None)
+
+        return mask
+
+    return predicate
+
+
+def relative_intensity(data):
+    """Replace 'Absolute intensity' by the intensity relative to the maximum of each sample, in %."""
+
+    max_intensity = data.groupby(['Sample', 'Description'])['Absolute intensity'].transform('max')
+
+    data = data.assign(**{'Relative intensity': data['Absolute intensity'] / max_intensity * 100})
+
+    return data.drop(columns='Absolute intensity')
+
+
+def intensity_column_names(data, kind='Absolute intensity'):
+    """Return the 'Absolute intensity' (or 'Relative intensity') columns of sample or compared data."""
+
+    return [column for column in data.columns if column == kind or column.startswith(kind + ' (')]
+
+
+def sample_maxima(data, intensity=None):
+    """Return {per-sample column of a comparison of 'data': maximum intensity of that sample}.
+
+    The maxima come from sample_stats, the columns are named like in
+    per_sample_table.
+    """
+
+    intensity = intensity or intensity_columns(data)[0]
+    maxima = sample_stats(data, [intensity])[(intensity, 'max')]
+
+    return {f"{intensity} ({sample}_{description})": value for (sample, description), value in maxima.items()}
+
+
+def to_relative(data, number_samples=None, maxima=None):
+    """Return the data with relative intensities and the absolute intensity columns it replaced.
+
+    Sample data is normalized by the maximum of each (Sample, Description).
+    Compared data has every per-sample column normalized by the maximum of
+    its sample in 'maxima' (see sample_maxima), so the values are the same
+    as when the samples are made relative before comparing. A column without
+    a known maximum is normalized by its largest value in the table, which
+    for common species is the largest common peak, not the base peak of the
+    sample. The average is recomputed from them, divided by 'number_samples'
+    (default the number of sample columns) like in average_samples. The
+    absolute columns keep the index of the data, so to_absolute can restore
+    them exactly after the rows were filtered or sorted.
+    """
+
+    columns = intensity_column_names(data)
+    absolute = data[columns]
+
+    if 'Sample' in data and 'Description' in data:
+        return relative_intensity(data), absolute
+
+    sample_columns = [column for column in columns if column != 'Absolute intensity (Average)']
+    maxima = maxima or {}
+    column_maxima = pd.Series({column: maxima.get(column, data[column].max()) for column in sample_columns})
+    relative = data[sample_columns] / column_maxima * 100
+    relative.columns = [column.replace('Absolute', 'Relative', 1) for column in sample_columns]
+
+    relative['Relative intensity (Average)'] = relative.sum(axis=1) / (number_samples or len(sample_columns))
+
+    return data.drop(columns=columns).join(relative), absolute
+
+
+def to_absolute(data, absolute):
+    """Put the absolute intensity columns saved by to_relative back in place of the relative ones.
+
+    Raises ValueError if the data has other relative columns or rows than
+    the ones that were made relative, e.g. after comparing relative data.
+    """
+
+    relative_columns = [column.replace('Absolute', 'Relative', 1) for column in absolute.columns]
+
+    if set(relative_columns) != set(intensity_column_names(data, 'Relative intensity')) or not data.index.isin(absolute.index).all():
+        raise ValueError("The absolute intensities of the displayed data are not known.")
+
+    restored = absolute.reindex(data.index)
+
+    return data.drop(columns=relative_columns).join(restored)
+
+
+# Families that make up every group of species
+GROUP_FAMILIES = {
+    "CH Species": ['Aliphatics', 'Aromatics', 'Condensed Aromatics', 'HC Clusters', 'Carbon Clusters', 'Fullerenes'],
+    "CHN Species": ['Nitrogen Species'],
+    "CHO Species": ['Oxygen Species'],
+    "CHNO Species": ['Nitrogen Oxygen Species']
+    }
+
+
+# Mass of CH2 for the Kendrick mass scale
+CH2_MASS = 14.01565
+
+
+def group_of_species(families):
+    """Return the group of species of every family as a categorical Series.
+
+    Rows that belong to no group (Elements, Organo-metallics, ...) get '0'.
+    """
+
+    conditions = [families.isin(group_families) for group_families in GROUP_FAMILIES.values()]
+    groups = np.select(conditions, list(GROUP_FAMILIES), default='0')
+
+    return pd.Series(pd.Categorical(groups, categories=list(GROUP_FAMILIES) + ['0']), index=families.index)
+
+
+def aromaticity_index(dbe_ai, c_ai):
+    # AI is set to 0 where DBE_AI or C#_AI are less than or equal to 0
+    return (dbe_ai / c_ai).where((dbe_ai > 0) & (c_ai > 0), 0)
+
+
+def per_carbon(count, carbons):
+    # Element ratio, 0 for formulas without carbon like H/C
+    return (count / carbons).where(carbons > 0, 0)
+
+
+# Derived chemistry columns: name -> function of a column getter. The getter
+# returns the columns of the data and the other derived columns, 'Mass' is
+# 'Mass (Average)' for compared data
+DERIVED_COLUMNS = {
+    'Group': lambda column: group_of_species(column('Family')),
+    'DBE_AI': lambda column: 1 + column('C#') - column('O#') - column('H#') / 2,
+    'C#_AI': lambda column: column('C#') - column('O#') - column('N#'),
+    'AI': lambda column: aromaticity_index(column('DBE_AI'), column('C#_AI')),
+    # Modified aromaticity index of Koch & Dittmar, without sulfur
+    'AI_mod': lambda column: aromaticity_index(1 + column('C#') - column('O#') / 2 - (column('N#') + column('H#')) / 2,
+                                               column('C#') - column('O#') / 2 - column('N#')),
+    'O/C': lambda column: per_carbon(column('O#'), column('C#')),
+    'N/C': lambda column: per_carbon(column('N#'), column('C#')),
+    'Nominal mass': lambda column: column('Mass').round().astype('int32'),
+    'Kendrick mass': lambda column: column('Mass') * 14 / CH2_MASS,
+    'KMD': lambda column: column('Kendrick mass').round() - column('Kendrick mass')
+    }
+
+
+def add_derived_columns(data, names=None):
+    """Return the data with the derived columns 'names' (default all of DERIVED_COLUMNS).
+
+    Columns the data already has are not computed again, so columns added
+    when the data was loaded are kept through filters and relative
+    intensity, and new frames like averaged data get them on first use.
+    The data itself is not changed.
+    """
+
+    names = [name for name in (names or DERIVED_COLUMNS) if name not in data]
+
+    if not names:
+        return data
+
+    _, mass = intensity_columns(data)
+    values = {}
+
+    def column(name):
+        if name in data:
+            return data[name]
+
+        if name == 'Mass':
+            return data[mass]
+
+        if name not in values:
+            values[name] = DERIVED_COLUMNS[name](column)
+
+        return values[name]
+
+    return data.assign(**{name: column(name) for name in names})
+
+
+def drop_derived_columns(data):
+    """Return the data without the DERIVED_COLUMNS, as the files were loaded."""
+
+    return data.drop(columns=[name for name in DERIVED_COLUMNS if name in data])
+
+
+def add_group_column(data):
+    """Return the data with a 'Group' column holding the group of species of each row."""
+
+    return add_derived_columns(data, ['Group'])
+
+
+def add_ai_columns(data):
+    """Return the data with the 'DBE_AI', 'C#_AI' and aromaticity index 'AI' columns."""
+
+    return add_derived_columns(data, ['DBE_AI', 'C#_AI', 'AI'])
+
+
+# Order in which the families are shown in the family analysis
+FAMILY_ORDER = [
+    'Aliphatics', 'Aromatics', 'Condensed Aromatics', 'HC Clusters',
+    'Carbon Clusters', 'Fullerenes', 'Nitrogen Species',
+    'Oxygen Species', 'Nitrogen Oxygen Species', 'Elements',
+    'Organo-metallics'
+    ]
+
+
+class FamilySums(NamedTuple):
+    # Summed intensity and number of unique formulas, indexed by family
+    intensity: pd.DataFrame
+    species: pd.DataFrame
+
+
+def family_sums(data, families):
+    """Return the summed intensity and number of species per family as FamilySums.
+
+    Both are DataFrames indexed by family in FAMILY_ORDER, with one column
+    per "<Sample>, <Description>", or a single 'Average' column for compared
+    data.
+    """
+
+    intensity, _ = intensity_columns(data)
+    families = sorted(families, key=lambda family: FAMILY_ORDER.index(family) if family in FAMILY_ORDER else len(FAMILY_ORDER))
+
+    data = data[data['Family'].isin(families)]
+
+    if 'Sample' in data and 'Description' in data:
+        labels = data['Sample'].astype(str) + ', ' + data['Description'].astype(str)
+
+    else:
+        labels = 'Average'
+
+    grouped = data.assign(Label=labels).groupby(['Family', 'Label'], observed=True)
+    sums = grouped[intensity].sum().unstack('Label', fill_value=0)
+    counts = grouped['Formula'].nunique().unstack('Label', fill_value=0)
+
+    return FamilySums(sums.reindex(families, fill_value=0), counts.reindex(families, fill_value=0))
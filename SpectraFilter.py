@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraFilter
+@author: Sebastian Mehmed
+
+Description:
+    Incremental version of SpectraCore.filter_data for the filter dialog. A
+    DataFilter belongs to one DataFrame and keeps the boolean mask of every
+    predicate (Family, C#, mass and intensity) with the values it was built
+    from. When the filter is applied again only the masks of the predicates
+    that changed are recomputed, and the result is the AND of the cached
+    masks, so tweaking one bound does not scan the other columns again.
+
+    The C#, mass and intensity columns are sorted once, so every min-max
+    range is answered with two binary searches, and the min/max of every
+    column per family is computed once for the "All" and "Update" buttons
+    of the dialog.
+
+"""
+
+
+import numpy as np
+
+from SpectraCore import intensity_columns
+
+
+def as_key(value_range):
+    # Ranges come as lists or tuples, compare them as tuples
+    return tuple(value_range) if value_range else None
+
+
+class DataFilter:
+
+    def __init__(self, data):
+        self.data = data
+        self.intensity, self.mass = intensity_columns(data)
+
+        # Predicate values and mask of every filtered column
+        self.keys = {}
+        self.masks = {}
+
+        self._values = {}
+        self._sorted = {}
+        self._family_stats = None
+        self.result = None
+
+    def values(self, column):
+        # The column as a numpy array, converted once
+        if column not in self._values:
+            self._values[column] = self.data[column].to_numpy()
+
+        return self._values[column]
+
+    def sorted_index(self, column):
+        """Return the row order that sorts a column and the sorted values, built once."""
+
+        if column not in self._sorted:
+            values = self.values(column)
+            order = np.argsort(values, kind='stable')
+            self._sorted[column] = (order, values[order])
+
+        return self._sorted[column]
+
+    def range_mask(self, column, value_range, value_ranges):
+        """Return the rows within 'value_range' or any of 'value_ranges' (inclusive).
+
+        Without any range no row is selected, like in filter_data.
+        """
+
+        order, sorted_values = self.sorted_index(column)
+        mask = np.zeros(len(order), dtype=bool)
+        ranges = ([value_range] if value_range else []) + list(value_ranges or [])
+
+        for low, high in ranges:
+            start = np.searchsorted(sorted_values, low, side='left')
+            end = np.searchsorted(sorted_values, high, side='right')
+            mask[order[start:end]] = True
+
+        return mask
+
+    def family_stats(self):
+        """Return the min and max of C#, mass and intensity of every family, computed once."""
+
+        if self._family_stats is None:
+            columns = ['C#', self.mass, self.intensity]
+            self._family_stats = self.data.groupby('Family', observed=True)[columns].agg(['min', 'max'])
+
+        return self._family_stats
+
+    def families(self):
+        """Return the families that have rows."""
+
+        return list(self.family_stats().index)
+
+    def family_ranges(self, families):
+        """Return {column: (min, max)} of the rows of the given families, {} if there are none."""
+
+        stats = self.family_stats()
+        stats = stats[stats.index.isin(families)]
+
+        if stats.empty:
+            return {}
+
+        return {column: (stats[(column, 'min')].min(), stats[(column, 'max')].max())
+                for column in ['C#', self.mass, self.intensity]}
+
+    def family_mask(self, families):
+        return self.data['Family'].isin(families).to_numpy()
+
+    def cached_mask(self, name, key, compute):
+        # Recompute the mask of a predicate only if its values changed
+        if name not in self.masks or self.keys[name] != key:
+            self.masks[name] = compute()
+            self.keys[name] = key
+
+        return self.masks[name]
+
+    def apply(self, families, c_range, mass_range, intensity_range, c_ranges=None, mass_ranges=None):
+        """Return the rows that pass all predicates, with the arguments of filter_data."""
+
+        family_key = tuple(sorted(set(families)))
+        c_key = (as_key(c_range), tuple(map(as_key, c_ranges or [])))
+        mass_key = (as_key(mass_range), tuple(map(as_key, mass_ranges or [])))
+        intensity_key = (as_key(intensity_range), ())
+
+        mask = self.cached_mask('Family', family_key, lambda: self.family_mask(families))
+        mask = mask & self.cached_mask('C#', c_key, lambda: self.range_mask('C#', c_range, c_ranges))
+        mask &= self.cached_mask('Mass', mass_key, lambda: self.range_mask(self.mass, mass_range, mass_ranges))
+        mask &= self.cached_mask('Intensity', intensity_key, lambda: self.range_mask(self.intensity, intensity_range, None))
+
+        self.result = self.data[mask]
+
+        return self.result
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraIO
+@author: Sebastian Mehmed
+
+Description:
+    Readers for the semicolon separated peak list exports that SpectraC
+    loads. The exports start with a 2-line header and end with a 4-line
+    "Structure" footer, which previously forced pandas onto the slow Python
+    parser through 'skipfooter'. Here the header and footer are cut off the
+    raw bytes so the body can be parsed by the C engine straight into typed
+    columns. A data folder is read file by file in a process pool, and the
+    post-processed frames are kept in a SpectraCache.FolderCache so that
+    unchanged files are not parsed again.
+
+    The annotations of .msd files in the folder are read by SpectraMSD into
+    the same columns, so they are loaded next to the exports.
+
+"""
+
+
+import glob
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pandas as pd
+from pandas.api.types import union_categoricals
+from SpectraCache import FolderCache
+from SpectraMSD import read_annotations, msd_files, sample_file_name
+
+
+# Column layout of the export files
+EXPORT_COLUMNS = [
+    'Name', 'Formula', 'Mass', 'Theoretical mass', 'Error', 'C#',
+    'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Element 1',
+    'Element 2', 'Element 3', 'Element 4', 'Family',
+    'Absolute intensity'
+    ]
+
+# Columns SpectraC keeps, in the order they are displayed
+DATA_COLUMNS = [
+    'C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Sample',
+    'Description', 'Formula', 'Mass', 'Theoretical mass', 'Error',
+    'Family', 'Absolute intensity'
+    ]
+
+# Types of the columns that are parsed ('Name' and 'Element 1-4' are skipped)
+EXPORT_DTYPES = {
+    'Formula': 'str',
+    'Mass': 'float64',
+    'Theoretical mass': 'float64',
+    'Error': 'float64',
+    'C#': 'int16',
+    'H#': 'int16',
+    'N#': 'int16',
+    'O#': 'int16',
+    'DBE': 'float64',
+    'DBE/C#': 'float64',
+    'H/C': 'float64',
+    'Family': 'category',
+    'Absolute intensity': 'float64'
+    }
+
+# Optional compact schema: dictionary-encoded strings, int16 element counts
+# and float32 for the values that are printed with few digits. The masses,
+# the mass error and the intensities stay float64. The derived columns of
+# SpectraCore.DERIVED_COLUMNS are included, except the Kendrick mass.
+COMPACT_DTYPES = {
+    'Sample': 'category',
+    'Description': 'category',
+    'Family': 'category',
+    'Formula': 'category',
+    'C#': 'int16',
+    'H#': 'int16',
+    'N#': 'int16',
+    'O#': 'int16',
+    'DBE': 'float32',
+    'DBE/C#': 'float32',
+    'H/C': 'float32',
+    'Group': 'category',
+    'DBE_AI': 'float32',
+    'C#_AI': 'int16',
+    'AI': 'float32',
+    'AI_mod': 'float32',
+    'O/C': 'float32',
+    'N/C': 'float32',
+    'Nominal mass': 'int16',
+    'KMD': 'float32'
+    }
+
+HEADER_LINES = 2
+FOOTER_LINES = 4
+
+
+def export_body(raw):
+    """Return the data rows of an export file without its header and footer."""
+
+    # Drop the header lines
+    body = raw.split(b'\n', HEADER_LINES)[-1]
+
+    # Drop the footer lines, ignoring a trailing newline at the end of the file
+    return body.rstrip(b'\r\n').rsplit(b'\n', FOOTER_LINES)[0]
+
+
+def sample_names(file_path):
+    """Return the (Sample, Description) of a "<Sample>_<Description>.txt" file name."""
+
+    file_name = os.path.splitext(os.path.basename(file_path))[0]
+    first_word, second_word = file_name.split('_')
+
+    return first_word, second_word
+
+
+def read_export_file(file_path):
+    """Parse one semicolon export file into a typed DataFrame.
+
+    The 'Sample' and 'Description' columns are taken from the
+    "<Sample>_<Description>.txt" file name, like in SpectraC.
+    """
+
+    with open(file_path, 'rb') as file:
+        body = export_body(file.read())
+
+    return parse_export_body(body, *sample_names(file_path))
+
+
+def parse_export_body(body, sample, description):
+    """Parse data rows of an export file and add the 'Sample' and 'Description' columns."""
+
+    usecols = [EXPORT_COLUMNS.index(col) for col in EXPORT_DTYPES]
+
+    df = pd.read_csv(io.BytesIO(body), sep=';', header=None, engine='c',
+                     names=EXPORT_COLUMNS, usecols=usecols, dtype=EXPORT_DTYPES)
+
+    # The fields are padded with spaces around the separator
+    df['Formula'] = df['Formula'].str.strip()
+    df['Family'] = df['Family'].cat.rename_categories(lambda family: family.strip())
+
+    # Add Columns for "sample" and "description" from the file name
+    df['Sample'] = sample
+    df['Description'] = description
+
+    return df[DATA_COLUMNS]
+
+
+def iter_export_chunks(file_path, chunk_rows=100_000):
+    """Yield the data rows of an export file as bytes blocks of at most 'chunk_rows' lines.
+
+    The file is read line by line and the last FOOTER_LINES lines are held
+    back until the end of the file, so only one block is in memory at a time.
+    Blank lines are skipped, like the C parser does.
+    """
+
+    with open(file_path, 'rb') as file:
+        for _ in range(HEADER_LINES):
+            file.readline()
+
+        held_back = deque()
+        block = []
+
+        for line in file:
+            if not line.strip():
+                continue
+
+            held_back.append(line)
+
+            if len(held_back) > FOOTER_LINES:
+                block.append(held_back.popleft())
+
+                if len(block) >= chunk_rows:
+                    yield b''.join(block)
+                    block = []
+
+        if block:
+            yield b''.join(block)
+
+
+def read_msd_file(file_path):
+    """Read the annotations of an .msd file into the columns of read_export_file.
+
+    The 'Sample' and 'Description' come from the "<Sample>_<Description>.msd"
+    file name, also for the "_cleaned.msd" outputs of SpectrumCleaner.
+    """
+
+    df = read_annotations(file_path).astype(EXPORT_DTYPES)
+
+    df['Sample'], df['Description'] = sample_names(sample_file_name(file_path))
+
+    return df[DATA_COLUMNS]
+
+
+def data_files(folder_path):
+    """Return the export files of a folder, followed by its .msd files (see SpectraMSD.msd_files)."""
+
+    return glob.glob(os.path.join(folder_path, "*.txt")) + msd_files(folder_path)
+
+
+def split_aromatics(df):
+    """Move the Aromatics with DBE/C# >= 0.67 into a "Condensed Aromatics" family."""
+
+    if "Condensed Aromatics" not in df['Family'].cat.categories:
+        df['Family'] = df['Family'].cat.add_categories(["Condensed Aromatics"])
+
+    aromatics_mask = (df['Family'] == "Aromatics")
+    value_mask = (df['DBE/C#'] >= 0.67)
+
+    # Create new family (Condensed Aromatics)
+    df.loc[aromatics_mask & value_mask, 'Family'] = "Condensed Aromatics"
+
+    return df
+
+
+def read_sample_file(file_path):
+    """Parse an export or .msd file and apply the SpectraC post-processing."""
+
+    if file_path.endswith('.msd'):
+        return split_aromatics(read_msd_file(file_path))
+
+    return split_aromatics(read_export_file(file_path))
+
+
+def _read_file_safe(file_path):
+    # Worker entry point, errors are sent back instead of stopping the whole load
+    try:
+        return read_sample_file(file_path), None
+
+    except Exception as error:
+        return None, f"{type(error).__name__}: {error}"
+
+
+def combine_frames(data_frames):
+    """Concatenate per-file frames, keeping 'Family' categorical."""
+
+    data = pd.concat(data_frames, ignore_index=True)
+
+    # pd.concat falls back to object when the files contain different families
+    data['Family'] = union_categoricals([df['Family'] for df in data_frames])
+
+    return data
+
+
+def compact_frame(data):
+    """Return the data converted to COMPACT_DTYPES, for the columns it has."""
+
+    return data.astype({column: dtype for column, dtype in COMPACT_DTYPES.items() if column in data})
+
+
+def memory_report(before, after):
+    """Return the memory in bytes of every column of two versions of the data.
+
+    The last row ('Total') holds the sums, the index is counted as a column.
+    """
+
+    before_bytes = before.memory_usage(deep=True)
+
+    report = pd.DataFrame({
+        'Before (bytes)': before_bytes,
+        'After (bytes)': after.memory_usage(deep=True),
+        'Before dtype': before.dtypes.astype(str),
+        'After dtype': after.dtypes.astype(str)
+        }, index=before_bytes.index)
+
+    report.loc['Total', ['Before (bytes)', 'After (bytes)']] = report[['Before (bytes)', 'After (bytes)']].sum()
+    report['Ratio'] = report['After (bytes)'] / report['Before (bytes)']
+
+    return report
+
+
+def load_folder(folder_path, workers=None, use_processes=True, use_cache=True, progress=None, compact=False):
+    """Read every export file of a folder in a process or thread pool.
+
+    Files that are unchanged since the last load are taken from the folder
+    cache instead of being parsed. Returns the combined DataFrame (None if no
+    file could be read) and a list of (file name, error message) for the
+    files that failed. Rows keep the order of data_files, as when the files
+    are read one by one.
+
+    'progress' is called as progress(files done, number of files, message)
+    after every parsed file. An exception raised by it (e.g. a cancelled
+    job) stops the load and cancels the files that were not started yet.
+    With 'compact' the combined data is converted to COMPACT_DTYPES.
+    """
+
+    files = data_files(folder_path)
+
+    cache = FolderCache(folder_path) if use_cache else None
+    frames = {file: cache.get(file) for file in files} if cache else {}
+    to_parse = [file for file in files if frames.get(file) is None]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    workers = max(1, min(workers, len(to_parse)))
+    cached = len(files) - len(to_parse)
+
+    def report(done):
+        if progress:
+            progress(cached + done, len(files), f"Reading files ({cached} from cache)")
+
+    report(0)
+    results = []
+
+    if workers == 1:
+        for file in to_parse:
+            results.append(_read_file_safe(file))
+            report(len(results))
+
+    else:
+        if use_processes:
+            # The GUI loads from a worker thread, forked children would inherit
+            # a copy of the multithreaded Tk process, so they are spawned
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+
+        # map() yields the results in submission order, so the row order is deterministic
+        try:
+            for result in executor.map(_read_file_safe, to_parse):
+                results.append(result)
+                report(len(results))
+
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    errors = []
+
+    for file, (df, error) in zip(to_parse, results):
+        if error is None:
+            frames[file] = df
+
+            if cache:
+                cache.put(file, df)
+
+        else:
+            errors.append((os.path.basename(file), error))
+
+    if cache:
+        cache.save(files)
+
+    data_frames = [frames[file] for file in files if frames.get(file) is not None]
+    data = combine_frames(data_frames) if data_frames else None
+
+    if compact and data is not None:
+        data = compact_frame(data)
+
+    return data, errors
+
+
+def stream_folder(folder_path, predicate=None, chunk_rows=100_000, use_cache=True, progress=None, compact=False):
+    """Read a folder chunk by chunk and keep only the rows selected by 'predicate'.
+
+    'predicate' takes a chunk (already post-processed, so "Condensed
+    Aromatics" exist) and returns a boolean mask, see
+    SpectraCore.row_predicate. The files are read one after the other and
+    only the surviving rows are kept, so the peak memory is about one chunk
+    plus the result. Files that are in the folder cache are filtered from
+    the memory-mapped cache file instead; the cache is not written. The
+    .msd files are read whole and filtered like one chunk.
+
+    Returns the combined DataFrame (None if no row is left), the list of
+    (file name, error message) of the files that failed and a list of
+    (file name, rows read, rows kept) for the others. 'progress' and
+    'compact' work like in load_folder.
+    """
+
+    files = data_files(folder_path)
+    cache = FolderCache(folder_path) if use_cache else None
+
+    kept_frames = []
+    errors = []
+    row_counts = []
+
+    def keep(df):
+        return df if predicate is None else df[predicate(df).to_numpy()]
+
+    for i, file in enumerate(files):
+        if progress:
+            progress(i, len(files), "Streaming files")
+
+        name = os.path.basename(file)
+
+        try:
+            sample, description = sample_names(sample_file_name(file))
+            cached = cache.get(file) if cache else None
+
+            if cached is not None:
+                rows_in = len(cached)
+                file_frames = [keep(cached).copy()]
+
+            elif file.endswith('.msd'):
+                df = read_sample_file(file)
+                rows_in = len(df)
+                file_frames = [keep(df)]
+
+            else:
+                rows_in = 0
+                file_frames = []
+
+                for body in iter_export_chunks(file, chunk_rows):
+                    chunk = split_aromatics(parse_export_body(body, sample, description))
+                    rows_in += len(chunk)
+                    file_frames.append(keep(chunk))
+
+        except Exception as error:
+            errors.append((name, f"{type(error).__name__}: {error}"))
+            continue
+
+        file_frames = [df for df in file_frames if len(df)]
+        rows_out = sum(len(df) for df in file_frames)
+        row_counts.append((name, rows_in, rows_out))
+
+        if file_frames:
+            kept_frames.append(combine_frames(file_frames))
+
+    if progress:
+        progress(len(files), len(files), "Streaming files")
+
+    data = combine_frames(kept_frames) if kept_frames else None
+
+    if compact and data is not None:
+        data = compact_frame(data)
+
+    return data, errors, row_counts
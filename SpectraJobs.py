@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraJobs
+@author: Sebastian Mehmed
+
+Description:
+    Runs long SpectraC operations (loading, comparisons, figure building) on
+    a worker thread so the Tk main loop stays responsive. A job function gets
+    the Job as its first argument and calls job.report() to publish progress;
+    report() is also the cancellation point and raises JobCancelled once
+    cancel() was requested. The GUI polls the job with after() and only
+    publishes the result when the job finished, so the displayed data is
+    never seen half updated.
+
+"""
+
+
+import threading
+import traceback
+
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next progress report after cancel()."""
+
+
+class Job:
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.cancelled = False
+
+        # Progress as (done, total, message), total 0 means unknown
+        self._progress = (0, 0, '')
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.result = self.func(self, *self.args, **self.kwargs)
+
+        except JobCancelled:
+            self.cancelled = True
+
+        except Exception as error:
+            self.error = error
+            self.traceback = traceback.format_exc()
+
+    def report(self, done, total=0, message=''):
+        """Publish the progress of the job, raises JobCancelled if it was cancelled."""
+
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+        with self._lock:
+            self._progress = (done, total, message)
+
+    def cancel(self):
+        """Ask the job to stop at its next progress report."""
+
+        self._cancel_event.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def progress(self):
+        with self._lock:
+            return self._progress
+
+    def done(self):
+        return not self._thread.is_alive()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraMSD
+@author: Sebastian Mehmed
+
+Description:
+    Reader for the annotations of .msd files, the XML files that
+    SpectrumCleaner cleans, so that they can be loaded like the semicolon
+    exports without exporting them first. The file is parsed incrementally
+    with expat and only the attributes of the <annotation> elements and of
+    the <peak> elements are kept, in lists that become the columns.
+
+    Every annotation gives the mass (peakMZ), the theoretical mass (calcMZ)
+    and the formula. The intensity is the 'intensity' attribute of the
+    annotation, or the one of the <peak> with the same 'mz', wherever the
+    peaks are in the file. The element counts, DBE, DBE/C#, H/C and family
+    are derived from the formula by parse_formula, which is cached, so
+    every distinct formula is parsed once. The families follow the
+    classification of the exports, the "Condensed Aromatics" are split off
+    later by SpectraIO.split_aromatics.
+
+"""
+
+
+import functools
+import glob
+import os
+import re
+from xml.parsers import expat
+
+import numpy as np
+import pandas as pd
+
+from SpectrumCleaner import CHUNK_SIZE, CLEANED_SUFFIX
+
+
+ELEMENT_PATTERN = re.compile(r'([A-Z][a-z]?)(\d*)')
+FORMULA_PATTERN = re.compile(r'(?:[A-Z][a-z]?\d*)+')
+
+# Elements that are not metals, other elements next to C, H, N and O make organo-metallics
+NON_METALS = {
+    'H', 'He', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Si', 'P', 'S', 'Cl', 'Ar',
+    'As', 'Se', 'Br', 'Kr', 'Te', 'I', 'Xe', 'At', 'Rn'
+    }
+
+# Limits of the hydrocarbon families
+FULLERENE_MIN_CARBON = 30
+AROMATIC_MIN_CARBON = 6
+AROMATIC_MIN_DBE_C = 0.5
+HC_CLUSTER_MIN_DBE_C = 0.9
+
+# Columns derived from the formula, as in the exports
+FORMULA_COLUMNS = ['C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Family']
+
+
+def formula_family(counts, dbe_c):
+    """Return the family of a formula from its element counts and unrounded DBE/C#."""
+
+    carbon = counts.get('C', 0)
+
+    if not carbon:
+        return "Elements"
+
+    others = set(counts) - {'C', 'H', 'N', 'O'}
+
+    if others:
+        return "Unidentified" if others & NON_METALS else "Organo-metallics"
+
+    if counts.get('N') and counts.get('O'):
+        return "Nitrogen Oxygen Species"
+
+    if counts.get('N'):
+        return "Nitrogen Species"
+
+    if counts.get('O'):
+        return "Oxygen Species"
+
+    if not counts.get('H'):
+        return "Fullerenes" if carbon >= FULLERENE_MIN_CARBON else "Carbon Clusters"
+
+    if dbe_c > HC_CLUSTER_MIN_DBE_C:
+        return "HC Clusters"
+
+    if dbe_c < AROMATIC_MIN_DBE_C:
+        return "Aliphatics"
+
+    return "HC Clusters" if carbon < AROMATIC_MIN_CARBON else "Aromatics"
+
+
+@functools.lru_cache(maxsize=None)
+def parse_formula(formula):
+    """Return the FORMULA_COLUMNS values of a formula like "C6H5Fe", in any element order.
+
+    Formulas without carbon have a DBE and ratios of 0, like in the exports,
+    and the ratios are rounded to 2 decimals. A formula that is not made of
+    element symbols and counts is "Unidentified".
+    """
+
+    counts = {}
+
+    for element, count in ELEMENT_PATTERN.findall(formula):
+        counts[element] = counts.get(element, 0) + int(count or 1)
+
+    carbon, hydrogen, nitrogen, oxygen = (counts.get(element, 0) for element in 'CHNO')
+
+    if carbon:
+        dbe = carbon - hydrogen / 2 + nitrogen / 2 + 1
+        dbe_c = dbe / carbon
+        h_c = hydrogen / carbon
+
+    else:
+        dbe = dbe_c = h_c = 0.0
+
+    family = formula_family(counts, dbe_c) if FORMULA_PATTERN.fullmatch(formula) else "Unidentified"
+
+    return carbon, hydrogen, nitrogen, oxygen, dbe, round(dbe_c, 2), round(h_c, 2), family
+
+
+class MsdReader:
+    """Incremental parser that collects the annotations and peaks of an .msd file.
+
+    Only the first <annotations> element is read. The parsing stops at its
+    end, unless annotations without intensity need the peaks, which can
+    also come after the annotations.
+    """
+
+    def __init__(self):
+        self.parser = expat.ParserCreate()
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+
+        self.in_annotations = False
+        self.done = False
+
+        # Annotations without their own intensity
+        self.missing = 0
+
+        self.mass = []
+        self.theoretical_mass = []
+        self.formulas = []
+        self.intensity = []
+        self.peak_mz = []
+        self.peak_intensity = []
+
+    def start(self, tag, attrib):
+        if self.in_annotations:
+            if tag == 'annotation':
+                self.mass.append(attrib['peakMZ'])
+                self.theoretical_mass.append(attrib['calcMZ'])
+                self.formulas.append(attrib['formula'].strip())
+                self.intensity.append(attrib.get('intensity', 'nan'))
+                self.missing += 'intensity' not in attrib
+
+        elif tag == 'annotations' and not self.done:
+            self.in_annotations = True
+
+        elif tag == 'peak' and 'mz' in attrib and 'intensity' in attrib:
+            self.peak_mz.append(attrib['mz'])
+            self.peak_intensity.append(attrib['intensity'])
+
+    def end(self, tag):
+        if tag == 'annotations' and self.in_annotations:
+            self.in_annotations = False
+            self.done = True
+
+    def read(self, file):
+        while not self.done or self.missing:
+            chunk = file.read(CHUNK_SIZE)
+            self.parser.Parse(chunk, not chunk)
+
+            if not chunk:
+                break
+
+
+def peak_intensity(mass, peak_mz, peak_intensity):
+    """Return the intensity of the peak at every mass, NaN where there is no such peak."""
+
+    intensity = np.full(len(mass), np.nan)
+
+    if not len(peak_mz):
+        return intensity
+
+    order = np.argsort(peak_mz, kind='stable')
+    sorted_mz = peak_mz[order]
+    position = np.minimum(np.searchsorted(sorted_mz, mass), len(sorted_mz) - 1)
+    found = sorted_mz[position] == mass
+    intensity[found] = peak_intensity[order[position[found]]]
+
+    return intensity
+
+
+def read_annotations(file_path):
+    """Read the annotations of an .msd file into a DataFrame with the columns of the exports.
+
+    The columns are Formula, Mass, Theoretical mass, Error (theoretical
+    mass - mass), FORMULA_COLUMNS and Absolute intensity, in file order.
+    Raises ValueError if an annotation has no intensity, neither its own
+    nor one of a peak.
+    """
+
+    reader = MsdReader()
+
+    with open(file_path, 'rb') as file:
+        reader.read(file)
+
+    mass = np.array(reader.mass, dtype=float)
+    theoretical_mass = np.array(reader.theoretical_mass, dtype=float)
+    intensity = np.array(reader.intensity, dtype=float)
+
+    # Annotations without intensity take the one of their peak
+    missing = np.isnan(intensity)
+
+    if missing.any():
+        intensity[missing] = peak_intensity(mass[missing], np.array(reader.peak_mz, dtype=float),
+                                            np.array(reader.peak_intensity, dtype=float))
+        unresolved = np.isnan(intensity)
+
+        if unresolved.any():
+            first = int(np.argmax(unresolved))
+            raise ValueError(f"{int(unresolved.sum())} annotations have no intensity and no <peak> with their mz, "
+                             f"the first at peakMZ {reader.mass[first]}")
+
+    # Parse every distinct formula once
+    codes, formulas = pd.factorize(np.array(reader.formulas, dtype=object))
+    properties = pd.DataFrame([parse_formula(formula) for formula in formulas], columns=FORMULA_COLUMNS,
+                              index=range(len(formulas)))
+
+    df = properties.take(codes).reset_index(drop=True)
+    df.insert(0, 'Formula', np.asarray(formulas, dtype=object)[codes])
+    df.insert(1, 'Mass', mass)
+    df.insert(2, 'Theoretical mass', theoretical_mass)
+    df.insert(3, 'Error', theoretical_mass - mass)
+    df['Absolute intensity'] = intensity
+
+    return df
+
+
+def msd_files(folder_path):
+    """Return the .msd files of a folder, the cleaned version instead of the original if both exist."""
+
+    files = glob.glob(os.path.join(folder_path, "*.msd"))
+    cleaned = {file for file in files if file.endswith(CLEANED_SUFFIX)}
+
+    return [file for file in files
+            if file in cleaned or os.path.splitext(file)[0] + CLEANED_SUFFIX not in cleaned]
+
+
+def sample_file_name(file_path):
+    """Return the file name the sample names come from, without the suffix of SpectrumCleaner."""
+
+    file_name = os.path.basename(file_path)
+
+    if file_name.endswith(CLEANED_SUFFIX):
+        file_name = file_name[:-len(CLEANED_SUFFIX)] + '.msd'
+
+    return file_name
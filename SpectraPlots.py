@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraPlots
+@author: Sebastian Mehmed
+
+Description:
+    Figure builders for the SpectraC plots. The figures are created with
+    matplotlib.figure.Figure instead of pyplot, so they open no window and
+    can be drawn on a Tk canvas, saved by the Agg backend or rendered in
+    worker processes.
+
+    Besides one marker per peak, the scatter plots have a density mode: the
+    peaks are binned on a grid (one cell per integer C# and H#, per half
+    integer DBE, DENSITY_BINS cells over the axis range of the other
+    columns) and the summed or maximum intensity of every cell is drawn as
+    one image, so drawing does not depend on the number of peaks.
+
+    The asymptotes of the plots are declared once in ASYMPTOTES as
+    vectorized curves. User curves can be added from a JSON or YAML file
+    with load_asymptotes. The lines are evaluated once per axis range and
+    shared by all figures of a plot.
+
+"""
+
+
+import ast
+import functools
+import json
+import re
+from typing import Callable, NamedTuple
+
+import numpy as np
+from matplotlib import colors, colormaps
+from matplotlib.figure import Figure
+import matplotlib.ticker as ticker
+
+from SpectraCore import (intensity_columns, select_samples, add_group_column,
+                         add_ai_columns, family_sums)
+
+
+# x and y columns of the scatter plots
+PLOT_AXES = {
+    "DBE vs C#": ('C#', 'DBE'),
+    "H# vs C#": ('C#', 'H#'),
+    "H/C vs Mass": ('Mass', 'H/C'),
+    "AI vs C#": ('C#', 'AI')
+    }
+
+
+class Asymptote(NamedTuple):
+    # Reference curve y = curve(x) of a plot, drawn from 'start' to the right end of the x axis
+    name: str
+    start: float
+    curve: Callable
+    label: str
+    color: str
+
+
+# Built-in asymptotes of every plot, more can be added with register_asymptote
+# or load_asymptotes
+ASYMPTOTES = {
+    "DBE vs C#": [
+        Asymptote("DBE = 0.5*C# (Aromatic)", 6, lambda x: 0.5 * x, "Aromatic", 'red'),
+        Asymptote("DBE = 0.67*C# (Condensed Aromatic)", 10, lambda x: 0.67 * x, "Condensed Aromatic", 'blue'),
+        Asymptote("DBE = 0.735*C# - 0.5 (Cata-condensed PAHs)", 10, lambda x: 0.735 * x - 0.5, "Cata-condensed PAHs", 'green'),
+        Asymptote("DBE = 0.92*C# - 3.24 (Peri-condensed PAHs)", 16, lambda x: 0.92 * x - 3.24, "Peri-condensed PAHs", 'purple'),
+        Asymptote("DBE = 0.9*C# (HC Cluster)", 6, lambda x: 0.9 * x, "HC Cluster", 'orange'),
+        Asymptote("DBE = C#+1 (Carbon Clusters)", 2, lambda x: x + 1, "Carbon Clusters", 'brown')
+        ],
+    "H# vs C#": [
+        Asymptote("H# = sqrt(6*C#) (Peri-condensed PAHs)", 16, lambda x: np.sqrt(6 * x), "Peri-condensed PAHs", 'purple'),
+        Asymptote("H# = 0.5*C# + 3 (Cata-condensed PAHs)", 10, lambda x: 0.5 * x + 3, "Cata-condensed PAHs", 'green'),
+        Asymptote("H# = C#", 2, lambda x: x, "H# = C#", 'cyan'),
+        Asymptote("H# = 1.25*C# + 2.5 (Aliphatic/Aromatic)", 2, lambda x: 1.25 * x + 2.5, "Aliphatic/Aromatic", 'magenta'),
+        Asymptote("H# = 2*C# + 2 (Aliphatic)", 2, lambda x: 2 * x + 2, "Aliphatic", 'yellow')
+        ],
+    "AI vs C#": [
+        Asymptote("AI = 0.5 (Aromatic)", 6, lambda x: np.full_like(x, 0.5), "Aromatic", 'red'),
+        Asymptote("AI = 0.67 (Condensed Aromatic)", 10, lambda x: np.full_like(x, 0.67), "Condensed Aromatic", 'blue'),
+        Asymptote("AI = 0.735 - 0.5/C# (Cata-condensed PAHs)", 10, lambda x: 0.735 - 0.5 / x, "Cata-condensed PAHs", 'green'),
+        Asymptote("AI = 0.92 - 3.24/C# (Peri-condensed PAHs)", 16, lambda x: 0.92 - 3.24 / x, "Peri-condensed PAHs", 'purple'),
+        Asymptote("AI = 0.9 (HC Cluster)", 6, lambda x: np.full_like(x, 0.9), "HC Cluster", 'orange'),
+        Asymptote("AI = 1 + 1/C# (Carbon Clusters)", 2, lambda x: 1 / x + 1, "Carbon Clusters", 'brown')
+        ]
+    }
+
+
+# Functions and constants that can be used in the expressions of user asymptotes
+EXPRESSION_NAMES = {
+    'sqrt': np.sqrt, 'log': np.log, 'log10': np.log10, 'exp': np.exp, 'abs': np.abs, 'pi': np.pi
+    }
+
+EXPRESSION_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load,
+                    ast.Constant, ast.operator, ast.unaryop)
+
+
+# Lattice step of the columns with integer or half integer values, the
+# other columns are split into DENSITY_BINS cells over the axis range
+LATTICE_STEPS = {'C#': 1, 'H#': 1, 'DBE': 0.5}
+DENSITY_BINS = 200
+
+# Reduction of the intensities that fall into one cell
+DENSITY_AGGREGATES = ('sum', 'max')
+
+
+def file_name(text):
+    # Make a plot title usable as a file name
+    return re.sub(r'[^\w\-]+', '_', text).strip('_')
+
+
+def intensity_norm(intensity_min=0.0, intensity_max=0.0):
+    """Return the logarithmic color normalization for the intensity range.
+
+    0 for both values means automatic scaling. Raises ValueError if only one
+    of them is 0, as the logarithm of 0 is not defined.
+    """
+
+    if intensity_min == 0.0 and intensity_max == 0.0:
+        # default logarithmic scaling without custom min and max values
+        return colors.LogNorm()
+
+    if intensity_min == 0.0 or intensity_max == 0.0:
+        raise ValueError("The logarithm of 0 is not defined. Please enter another value")
+
+    return colors.LogNorm(vmin=intensity_min, vmax=intensity_max, clip=True)
+
+
+def average_title(unique_samples, unique_descriptions):
+    """Return the "Average of ..." title of compared data."""
+
+    title_parts = [f'{sample} {description}' for sample, description in zip(unique_samples, unique_descriptions)]
+
+    return f"Average of {', '.join(title_parts[:-1])} & {title_parts[-1]}"
+
+
+def add_minor_ticks(ax, y_only=False):
+    if not y_only:
+        ax.xaxis.set_minor_locator(ticker.AutoMinorLocator())
+
+    ax.yaxis.set_minor_locator(ticker.AutoMinorLocator())
+
+
+def expression_curve(expression):
+    """Return the vectorized curve of an expression of x, like "0.5*x + 3" or "sqrt(6*x)".
+
+    Only numbers, x, arithmetic operators and EXPRESSION_NAMES are allowed.
+    """
+
+    try:
+        tree = ast.parse(expression, mode='eval')
+
+    except SyntaxError:
+        raise ValueError(f"Invalid asymptote expression '{expression}'.")
+
+    for node in ast.walk(tree):
+        if (not isinstance(node, EXPRESSION_NODES)
+                or isinstance(node, ast.Name) and node.id != 'x' and node.id not in EXPRESSION_NAMES
+                or isinstance(node, ast.Constant) and not isinstance(node.value, (int, float))):
+            raise ValueError(f"Invalid asymptote expression '{expression}', only x, numbers, "
+                             f"+ - * / ** and {', '.join(EXPRESSION_NAMES)} are allowed.")
+
+    code = compile(tree, '<asymptote>', 'eval')
+
+    def curve(x):
+        # Constant expressions are broadcast to the shape of x
+        return np.zeros_like(x, dtype=float) + eval(code, {'__builtins__': {}}, {**EXPRESSION_NAMES, 'x': x})
+
+    return curve
+
+
+def register_asymptote(plot_type, name, start, curve, label=None, color='black'):
+    """Add an asymptote to a plot, or replace the one with the same name."""
+
+    if plot_type not in PLOT_AXES:
+        raise ValueError(f"Unknown plot '{plot_type}', use one of {', '.join(PLOT_AXES)}.")
+
+    asymptote = Asymptote(name, start, curve, label or name, color)
+    asymptotes = [existing for existing in ASYMPTOTES.get(plot_type, []) if existing.name != name]
+    ASYMPTOTES[plot_type] = asymptotes + [asymptote]
+
+    # The evaluated lines of the plot are out of date
+    _asymptote_lines.cache_clear()
+
+    return asymptote
+
+
+def load_asymptotes(file_path):
+    """Register the user asymptotes of a JSON or YAML file and return their names.
+
+    The file holds a list of curves (or {"asymptotes": [...]}), for example
+        [{"plot": "DBE vs C#", "name": "DBE = 0.4*C#", "expression": "0.4*x",
+          "start": 4, "label": "My reference", "color": "black"}]
+    "start" defaults to 0, "label" to the name and "color" to black.
+    """
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        if file_path.endswith(('.yml', '.yaml')):
+            try:
+                import yaml
+
+            except ImportError:
+                raise ValueError("YAML asymptote files need PyYAML (pip install pyyaml), or use a JSON file.")
+
+            config = yaml.safe_load(file)
+
+        else:
+            config = json.load(file)
+
+    if isinstance(config, dict):
+        config = config.get('asymptotes', [])
+
+    names = []
+
+    for entry in config:
+        try:
+            plot_type, name, expression = entry['plot'], entry['name'], entry['expression']
+
+        except KeyError as error:
+            raise ValueError(f"Asymptote {entry} has no {error} key.")
+
+        register_asymptote(plot_type, name, entry.get('start', 0), expression_curve(expression),
+                           entry.get('label'), entry.get('color', 'black'))
+        names.append(name)
+
+    return names
+
+
+@functools.lru_cache(maxsize=64)
+def _asymptote_lines(plot_type, selected_asymptotes, x_max):
+    lines = []
+
+    for asymptote in ASYMPTOTES.get(plot_type, []):
+        if asymptote.name in selected_asymptotes:
+            x_values = np.linspace(asymptote.start, x_max, 100)
+
+            # Curves like 0.735 - 0.5/x are not defined at x = 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                y_values = np.asarray(asymptote.curve(x_values), dtype=float)
+
+            # The arrays are shared by every figure of the axis range
+            x_values.flags.writeable = False
+            y_values.flags.writeable = False
+            lines.append((x_values, y_values, asymptote.label, asymptote.color))
+
+    return tuple(lines)
+
+
+def asymptote_lines(plot_type, selected_asymptotes, x_max):
+    """Return (x, y, label, color) of the selected asymptotes from their start point to x_max.
+
+    The lines are evaluated once per plot, selection and axis range and
+    reused for every figure with the same axis range.
+    """
+
+    return _asymptote_lines(plot_type, tuple(selected_asymptotes), float(x_max))
+
+
+def draw_asymptotes(ax, lines):
+    """Draw the lines of asymptote_lines with a legend."""
+
+    for x_values, y_values, label, color in lines:
+        ax.plot(x_values, y_values, label=label, color=color)
+
+    if lines:
+        ax.legend()
+
+
+def grid_edges(column, limits):
+    # Left edge, cell size and number of cells of one axis of the density grid
+    low, high = limits
+
+    if column in LATTICE_STEPS:
+        # Every lattice value is the center of its own cell
+        step = LATTICE_STEPS[column]
+        left = low - step / 2
+        return left, step, int(np.floor((high - left) / step)) + 1
+
+    step = (high - low) / DENSITY_BINS or 1.0
+    return low, step, DENSITY_BINS
+
+
+def density_grid(x_data, y_data, z_data, x_col, y_col, xlim, ylim, aggregate='sum'):
+    """Bin the peaks within the axis limits and reduce their intensities per cell.
+
+    Returns the masked (rows = y, columns = x) grid, empty cells masked, and
+    its (left, right, bottom, top) extent for imshow.
+    """
+
+    if aggregate not in DENSITY_AGGREGATES:
+        raise ValueError(f"Unknown density aggregate '{aggregate}', use one of {', '.join(DENSITY_AGGREGATES)}.")
+
+    x_left, x_step, nx = grid_edges(x_col, xlim)
+    y_left, y_step, ny = grid_edges(y_col, ylim)
+
+    x_bins = np.floor((np.asarray(x_data, dtype=float) - x_left) / x_step)
+    y_bins = np.floor((np.asarray(y_data, dtype=float) - y_left) / y_step)
+    z_values = np.asarray(z_data, dtype=float)
+
+    # The upper limit belongs to the last cell, peaks outside the limits are dropped
+    x_bins[np.asarray(x_data) == xlim[1]] = nx - 1
+    y_bins[np.asarray(y_data) == ylim[1]] = ny - 1
+    inside = (x_bins >= 0) & (x_bins < nx) & (y_bins >= 0) & (y_bins < ny) & np.isfinite(z_values)
+
+    cells = y_bins[inside].astype(np.intp) * nx + x_bins[inside].astype(np.intp)
+    z_values = z_values[inside]
+    counts = np.bincount(cells, minlength=nx * ny)
+
+    if aggregate == 'sum':
+        grid = np.bincount(cells, weights=z_values, minlength=nx * ny)
+
+    else:
+        grid = np.zeros(nx * ny)
+        np.maximum.at(grid, cells, z_values)
+
+    grid = np.ma.masked_array(grid, mask=counts == 0).reshape(ny, nx)
+    extent = (x_left, x_left + nx * x_step, y_left, y_left + ny * y_step)
+
+    return grid, extent
+
+
+def scatter_figure(x_data, y_data, z_data, x_label, y_label, title, xlim, ylim, norm,
+                   colorbar_label, lines=(), mode='scatter', aggregate='sum'):
+    """Return a scatter plot colored by intensity on a logarithmic scale.
+
+    In 'density' mode the peaks are drawn as a density_grid image instead.
+    """
+
+    fig = Figure()
+    ax = fig.add_subplot()
+
+    if mode == 'density':
+        grid, extent = density_grid(x_data, y_data, z_data, x_label, y_label, xlim, ylim, aggregate)
+        sc = ax.imshow(grid, extent=extent, origin='lower', aspect='auto', interpolation='nearest',
+                       cmap='viridis', norm=norm)
+        colorbar_label = f"{colorbar_label} ({aggregate} per cell)"
+
+    else:
+        sc = ax.scatter(x_data, y_data, c=z_data, cmap='viridis', marker='.', norm=norm)
+
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+
+    # Set the axis limits
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+
+    draw_asymptotes(ax, lines)
+
+    fig.colorbar(sc, ax=ax, label=colorbar_label)
+    add_minor_ticks(ax)
+    ax.set_title(title)
+
+    return fig
+
+
+def default_limits(data, plot_type):
+    """Return the default (x limits, y limits) of a plot: 0 to the maximum value, 0 to 1.3 for AI."""
+
+    x_col, y_col = plot_columns(data, plot_type)
+
+    xlim = (0, data[x_col].max())
+    ylim = (0, 1.3) if y_col == 'AI' else (0, data[y_col].max())
+
+    return xlim, ylim
+
+
+def plot_columns(data, plot_type):
+    # Compared data has the average mass instead of the mass
+    x_col, y_col = PLOT_AXES[plot_type]
+    _, mass = intensity_columns(data)
+
+    return (mass if x_col == 'Mass' else x_col), y_col
+
+
+def scatter_figures(data, plot_type, groups, samples=None, selected_asymptotes=(),
+                    xlim=None, ylim=None, norm=None, compared_title='', mode='scatter', aggregate='sum', lines=None,
+                    progress=None):
+    """Return (title, figure, plotted data) for every sample and group of species.
+
+    Sample data gives one figure per selected (Sample, Description) and
+    group, compared data one figure per group titled with 'compared_title'.
+    Missing axis limits default to default_limits over the selected samples.
+    'mode' and 'aggregate' are passed to scatter_figure. The asymptotes are
+    evaluated once for all figures, or taken from 'lines' (asymptote_lines).
+    'progress' is called like in SpectraIO.load_folder before every figure,
+    an exception raised by it stops the building.
+    """
+
+    intensity, _ = intensity_columns(data)
+    x_col, y_col = plot_columns(data, plot_type)
+    has_samples = 'Sample' in data and 'Description' in data
+
+    data = add_group_column(data)
+
+    if plot_type == "AI vs C#":
+        data = add_ai_columns(data)
+
+    if has_samples and samples is not None:
+        data = select_samples(data, samples)
+
+    default_xlim, default_ylim = default_limits(data, plot_type)
+    xlim = xlim or default_xlim
+    ylim = ylim or default_ylim
+    norm = norm or intensity_norm()
+
+    if lines is None:
+        lines = asymptote_lines(plot_type, selected_asymptotes, xlim[1])
+
+    if has_samples:
+        keys = ['Sample', 'Description', 'Group']
+        colorbar_label = intensity
+
+    else:
+        keys = ['Group']
+        colorbar_label = 'Averaged absolute intensity' if intensity == 'Absolute intensity (Average)' else 'Averaged relative intensity'
+
+    data = data[data['Group'].isin(groups)]
+    figures = []
+    grouped = list(data.groupby(keys, observed=True))
+
+    for i, (key, group_data) in enumerate(grouped):
+        if progress:
+            progress(i, len(grouped), "Building figures")
+
+        if has_samples:
+            sample, description, group = key
+            title = f'{sample} {description}, {group}'
+
+        else:
+            group = key[0] if isinstance(key, tuple) else key
+            title = f"{compared_title}, {group}"
+
+        # Every figure gets its own copy of the norm, autoscaling changes it
+        fig = scatter_figure(group_data[x_col], group_data[y_col], group_data[intensity], x_col, y_col, title,
+                             xlim, ylim, colors.LogNorm(norm.vmin, norm.vmax, norm.clip), colorbar_label,
+                             lines, mode, aggregate)
+
+        figures.append((title, fig, group_data[[x_col, y_col, intensity]]))
+
+    return figures
+
+
+def family_figures(data, families, log_scale=False, compared_title=''):
+    """Return (title, figure) of the family analysis: summed intensity and number of species."""
+
+    intensity, _ = intensity_columns(data)
+    sums, counts = family_sums(data, families)
+    families = list(sums.index)
+
+    # Create a color map for the families
+    color_map = colormaps['tab10']
+    family_colors = {family: color_map(i) for i, family in enumerate(families)}
+    figures = []
+
+    if 'Sample' in data and 'Description' in data:
+        # Define the width of a bar
+        bar_width = 0.8 / len(families)
+
+        for values, ylabel in zip([sums, counts], ['Sum of ' + intensity, 'Number of species']):
+            fig = Figure()
+            ax = fig.add_subplot()
+
+            # Track families that have been added to the legend
+            added_to_legend = []
+
+            # Initialize the x position for the first bar
+            x_pos = 0
+
+            # Create a list to store the x positions of the middle of each bar group
+            group_centers = []
+
+            for sample_name in values.columns:
+                # Record the start x position of this group
+                group_start_x = x_pos
+
+                for family, value in values[sample_name].items():
+                    if value > 0:  # Only plot the bar if the value is greater than 0
+                        label = family if family not in added_to_legend else ""
+                        ax.bar(x_pos, value, width=bar_width, color=family_colors[family], label=label)
+                        x_pos += bar_width
+
+                        if family not in added_to_legend:
+                            added_to_legend.append(family)
+
+                # Store the x position of the middle of the group
+                group_centers.append(group_start_x + (x_pos - group_start_x - bar_width) / 2)
+
+                # Update the x position for the next bar group, the space depends on the number of bars
+                x_pos = group_start_x + 0.4 + (x_pos - group_start_x)
+
+            ax.set_yscale('log' if log_scale else 'linear')
+
+            # Set the x-axis ticks to be the sample names
+            ax.set_xticks(group_centers)
+            ax.set_xticklabels(list(values.columns), rotation=0)
+
+            ax.set_xlabel('Sample')
+            ax.set_ylabel(ylabel)
+            ax.legend(title='Family')
+            ax.set_title('Family Analysis')
+
+            if not log_scale:
+                add_minor_ticks(ax, y_only=True)
+
+            figures.append(('Family Analysis', fig))
+
+    else:
+        if intensity == 'Absolute intensity (Average)':
+            sum_label = 'Sum of average absolute intensity'
+
+        else:
+            sum_label = 'Sum of average relative intensity'
+
+        # Create an array for the x positions of the bars
+        x_pos = np.arange(len(families))
+
+        for values, ylabel in zip([sums.iloc[:, 0], counts.iloc[:, 0]], [sum_label, 'Number of species']):
+            fig = Figure()
+            ax = fig.add_subplot()
+
+            for i, (family, value) in enumerate(values.items()):
+                ax.bar(x_pos[i], value, width=1, color=family_colors[family], label=family)
+
+            ax.set_yscale('log' if log_scale else 'linear')
+            ax.set_xticks([])
+            ax.set_ylabel(ylabel)
+            ax.legend(title='Family')
+            ax.text(0.5, -0.05, compared_title, ha='center', va='center', transform=ax.transAxes)
+
+            if not log_scale:
+                add_minor_ticks(ax, y_only=True)
+
+            ax.set_title('Family Analysis')
+
+            figures.append(('Family Analysis', fig))
+
+    return figures
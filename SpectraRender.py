@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraRender
+@author: Sebastian Mehmed
+
+Description:
+    Renders the scatter plots of SpectraPlots straight to files instead of
+    opening a window per figure. The selected samples (or, for compared
+    data, the groups of species) are split over a process pool; every worker
+    builds its figures with the Agg renderer of matplotlib.figure.Figure and
+    saves them. The figures can also be combined into one grid image, built
+    from PNG renders of the figures, or one multi-page PDF. For the PDF the
+    workers send the figures themselves back and the parent draws them into
+    the pages, so the pages stay vector graphics.
+
+"""
+
+
+import io
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib import image
+from matplotlib.backends.backend_pdf import PdfPages
+
+from SpectraCore import add_ai_columns, add_group_column, select_samples, sample_index
+from SpectraPlots import scatter_figures, default_limits, intensity_norm, asymptote_lines, file_name
+
+
+def _render_part(args):
+    # Worker entry point: build the figures of one part of the data and save them
+    (data, plot_type, groups, lines, xlim, ylim, intensity_range,
+     compared_title, mode, aggregate, out_dir, figure_format, dpi, combine, keep_dpi) = args
+
+    saved = []
+
+    for title, fig, _ in scatter_figures(data, plot_type, groups, None, (), xlim, ylim, intensity_norm(*intensity_range),
+                                         compared_title, mode, aggregate, lines):
+        path = os.path.join(out_dir, f"{file_name(plot_type)}_{file_name(title)}.{figure_format}")
+        fig.savefig(path, dpi=dpi)
+
+        # The combined grid is made of PNG renders of the figures, the PDF of the figures
+        kept = None
+
+        if combine == 'grid':
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=keep_dpi)
+            kept = buffer.getvalue()
+
+        elif combine == 'pdf':
+            kept = fig
+
+        saved.append((title, path, kept))
+
+    return saved
+
+
+def split_parts(data, groups):
+    """Split the data into the parts rendered by one worker: one per sample, or per group for compared data."""
+
+    if 'Sample' in data and 'Description' in data:
+        index = sample_index(data)
+        return [data[index == sample] for sample in index.unique()]
+
+    data = add_group_column(data)
+    return [data[data['Group'] == group] for group in groups if (data['Group'] == group).any()]
+
+
+def read_png(png):
+    # Decode PNG bytes into an 8-bit RGBA array
+    img = image.imread(io.BytesIO(png), format='png')
+    return (img * 255).round().astype(np.uint8)
+
+
+def combine_grid(pngs, path, columns=None):
+    """Tile PNG images of the same size into one image, row by row.
+
+    Only the grid and one decoded image are in memory at a time.
+    """
+
+    columns = columns or math.ceil(math.sqrt(len(pngs)))
+    height, width = read_png(pngs[0]).shape[:2]
+    rows = math.ceil(len(pngs) / columns)
+
+    grid = np.full((rows * height, columns * width, 4), 255, dtype=np.uint8)
+
+    for i, png in enumerate(pngs):
+        img = read_png(png)[:height, :width]
+        row, column = divmod(i, columns)
+        grid[row * height:row * height + img.shape[0], column * width:column * width + img.shape[1]] = img
+
+    image.imsave(path, grid)
+
+
+def render_figures(data, plot_type, groups, out_dir, samples=None, selected_asymptotes=(), xlim=None, ylim=None,
+                   intensity_range=(0.0, 0.0), compared_title='', mode='scatter', aggregate='sum', figure_format='png',
+                   dpi=100, combine=None, combine_dpi=None, workers=None, progress=None):
+    """Save the scatter plots of scatter_figures to 'out_dir' without opening any window.
+
+    The axis limits default to the ones of the whole selection, so every
+    figure has the same scale. 'combine' is None, 'grid' (one PNG with all
+    figures) or 'pdf' (one page per figure). Returns the paths of the saved
+    figures in plot order, followed by the combined file if any. The
+    figures of the grid are rendered at 'combine_dpi' (default 'dpi', lower
+    it for large grids). The PDF pages are written while the parts come in,
+    so only the figures of one part are kept at a time. 'progress' is
+    called like in SpectraIO.load_folder after every rendered part.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    if samples is not None and 'Sample' in data and 'Description' in data:
+        data = select_samples(data, samples)
+
+    if xlim is None or ylim is None:
+        limits_data = add_ai_columns(data) if plot_type == "AI vs C#" else data
+        default_xlim, default_ylim = default_limits(limits_data, plot_type)
+        xlim = xlim or default_xlim
+        ylim = ylim or default_ylim
+
+    # Check the color scale before starting the workers
+    intensity_norm(*intensity_range)
+
+    # The asymptotes are evaluated here, the workers only draw them. This also
+    # passes the user asymptotes to workers that do not inherit the registry
+    lines = asymptote_lines(plot_type, selected_asymptotes, xlim[1])
+
+    parts = split_parts(data, groups)
+    keep_dpi = combine_dpi or dpi
+    jobs = [(part, plot_type, groups, lines, xlim, ylim, intensity_range, compared_title, mode, aggregate,
+             out_dir, figure_format, dpi, combine, keep_dpi) for part in parts]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    combined_path = os.path.join(out_dir, f"{file_name(plot_type)}_all.{'png' if combine == 'grid' else 'pdf'}")
+    pdf = PdfPages(combined_path) if combine == 'pdf' and jobs else None
+    done = 0
+    saved = []
+
+    def collect(result):
+        nonlocal done
+
+        for title, path, kept in result:
+            if pdf:
+                pdf.savefig(kept, dpi=dpi)
+                kept = None
+
+            saved.append((title, path, kept))
+
+        done += 1
+
+        if progress:
+            progress(done, len(jobs), "Rendering figures")
+
+    if progress:
+        progress(0, len(jobs), "Rendering figures")
+
+    try:
+        if workers == 1:
+            for job in jobs:
+                collect(_render_part(job))
+
+        else:
+            # Spawned, not forked: SpectraC starts the rendering from a job thread
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+            try:
+                for result in executor.map(_render_part, jobs):
+                    collect(result)
+
+            finally:
+                executor.shutdown(cancel_futures=True)
+
+    except BaseException:
+        # Do not leave a partial PDF behind
+        if pdf:
+            pdf.close()
+
+            if os.path.exists(combined_path):
+                os.remove(combined_path)
+
+        raise
+
+    paths = [path for _, path, _ in saved]
+
+    if pdf:
+        pdf.close()
+
+    if combine and saved:
+        if combine == 'grid':
+            combine_grid([png for _, _, png in saved], combined_path)
+
+        paths.append(combined_path)
+
+    return paths
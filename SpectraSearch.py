@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+SpectraSearch
+@author: Sebastian Mehmed
+
+Description:
+    Formula index for the search bar. The formulas of a DataFrame are
+    factorized once into integer codes, with a hash table and a sorted array
+    of the unique formulas and their C#, H#, N# and O# counts. A query is
+    then resolved on the unique formulas and mapped back to the rows with a
+    single array lookup, instead of scanning the Formula strings every time.
+
+    A query is a comma separated list of terms, a row matches if it matches
+    any of them:
+        C10H8            exact formula
+        C10H*            formulas starting with C10H ('*' and '?' wildcards)
+        C10-20 H* N1 O0-2
+                         element counts, a number, a min-max range or '*'
+                         for C, H, N and O (other elements are not checked)
+
+"""
+
+
+import fnmatch
+import re
+
+import numpy as np
+import pandas as pd
+
+
+ELEMENT_COLUMNS = {'C': 'C#', 'H': 'H#', 'N': 'N#', 'O': 'O#'}
+
+# One element constraint: element followed by a count, a min-max range or '*'
+CONSTRAINT = re.compile(r'([A-Z][a-z]?)(\*|(\d+)(?:-(\d+))?)$')
+
+
+def parse_constraints(term):
+    """Return {count column: (min, max)} of an element constraint term, None if it is not one.
+
+    A single token is only a constraint if it holds a range (C10-20), so
+    that a term like "C60" still searches the exact formula.
+    """
+
+    tokens = term.split()
+
+    if len(tokens) == 1 and '-' not in term:
+        return None
+
+    constraints = {}
+
+    for token in tokens:
+        match = CONSTRAINT.match(token)
+
+        if match is None:
+            return None
+
+        element, count, low, high = match.groups()
+
+        if element not in ELEMENT_COLUMNS:
+            raise ValueError(f"Element constraints are only possible for C, H, N and O, not '{element}'.")
+
+        if count == '*':
+            continue
+
+        constraints[ELEMENT_COLUMNS[element]] = (int(low), int(high if high is not None else low))
+
+    return constraints
+
+
+class FormulaIndex:
+
+    def __init__(self, data):
+        self.data = data
+
+        # Integer code of every row and the unique formulas in order of first appearance
+        self.codes, uniques = pd.factorize(data['Formula'], sort=False)
+        self.formulas = pd.Index(uniques)
+
+        # Unique formulas in sorted order for the prefix searches
+        self.sort_order = np.argsort(np.asarray(uniques, dtype=object), kind='stable')
+        self.sorted_formulas = np.asarray(uniques, dtype=object)[self.sort_order]
+
+        # Element counts of every unique formula, taken from its first row
+        rows = np.flatnonzero(self.codes >= 0)
+        first_rows = rows[np.unique(self.codes[rows], return_index=True)[1]]
+        self.counts = {column: data[column].to_numpy()[first_rows] for column in ELEMENT_COLUMNS.values() if column in data}
+
+    def exact(self, formulas):
+        """Return the codes of the formulas that are in the data."""
+
+        codes = self.formulas.get_indexer(formulas)
+
+        return codes[codes >= 0]
+
+    def prefix(self, prefix):
+        """Return the codes of the formulas starting with 'prefix'."""
+
+        start = np.searchsorted(self.sorted_formulas, prefix, side='left')
+        end = np.searchsorted(self.sorted_formulas, prefix + '\uffff', side='left')
+
+        return self.sort_order[start:end]
+
+    def wildcard(self, pattern):
+        """Return the codes of the formulas matching a pattern with '*' and '?' wildcards."""
+
+        literal = re.split(r'[*?\[]', pattern, maxsplit=1)[0]
+
+        if pattern == literal + '*':
+            return self.prefix(literal)
+
+        # Only the formulas sharing the literal start are matched against the pattern
+        candidates = self.prefix(literal)
+        regex = re.compile(fnmatch.translate(pattern))
+        matches = [regex.match(formula) is not None for formula in self.formulas[candidates]]
+
+        return candidates[np.asarray(matches, dtype=bool)]
+
+    def constrained(self, constraints):
+        """Return the codes of the formulas whose element counts are within the (min, max) ranges."""
+
+        mask = np.ones(len(self.formulas), dtype=bool)
+
+        for column, (low, high) in constraints.items():
+            if column not in self.counts:
+                raise ValueError(f"The data has no '{column}' column.")
+
+            mask &= (self.counts[column] >= low) & (self.counts[column] <= high)
+
+        return np.flatnonzero(mask)
+
+    def query_codes(self, terms):
+        """Return the codes of the formulas matching any of the query terms."""
+
+        exact_formulas = []
+        selected = [np.empty(0, dtype=np.intp)]
+
+        for term in terms:
+            term = term.strip()
+
+            if not term:
+                continue
+
+            constraints = parse_constraints(term)
+
+            if constraints is not None:
+                selected.append(self.constrained(constraints))
+
+            elif '*' in term or '?' in term:
+                selected.append(self.wildcard(term))
+
+            else:
+                exact_formulas.append(term)
+
+        if exact_formulas:
+            selected.append(self.exact(exact_formulas))
+
+        return np.concatenate(selected)
+
+    def mask(self, terms):
+        """Return the boolean row mask of the rows matching any of the query terms."""
+
+        selected = np.zeros(len(self.formulas) + 1, dtype=bool)
+        selected[self.query_codes(terms)] = True
+
+        # Missing formulas have the code -1, which points to the last (False) element
+        return selected[self.codes]
+
+    def search(self, terms):
+        """Return the rows matching any of the query terms, in data order."""
+
+        return self.data[self.mask(terms)]
+
+
+def split_query(query):
+    """Split a search bar query into its comma separated terms."""
+
+    return [term.strip() for term in query.split(',') if term.strip()]
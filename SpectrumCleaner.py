@@ -4,108 +4,457 @@
 Created on Sun Jul 23 03:15:13 2023
 
 @author: aroma
+
+Description:
+    Removes the duplicate annotations of an .msd file: one annotation per
+    peakMZ (the least complex formula, then the smallest error), then one
+    annotation per formula (the smallest error).
+
+    Peaks are the same if their peakMZ is equal, or with a tolerance in ppm
+    or in m/z, if they are within the tolerance of the lowest peak of their
+    group, so no group is wider than the tolerance. The tolerance is
+    recorded in the peakTolerance and peakToleranceUnit attributes of the
+    cleaned <annotations> element.
+
+    The file is never loaded as a whole. A first pass parses it
+    incrementally with expat and only keeps the <annotations> element and
+    its byte offsets. A second pass copies the bytes before and after the
+    element unchanged and writes the cleaned annotations in between, so
+    the memory does not depend on the size of the spectrum.
+
+    The output is written to "<name>_cleaned.msd" through a temporary file
+    that is renamed when it is complete, so an interrupted run never
+    leaves a partial output and the input is never changed.
+
+Usage:
+    python SpectrumCleaner.py "campaign/*.msd" other_folder [--workers N] [--output DIR]
+                              [--tolerance 2 --unit ppm]
+
+    Folders are searched for .msd files. Files ending with _cleaned.msd
+    are skipped, they are the outputs of an earlier run.
+
 """
 
 import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
 import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Bytes read at a time
+CHUNK_SIZE = 1 << 20
+
+CLEANED_SUFFIX = '_cleaned.msd'
+
+# Units of the peak tolerance: parts per million of the m/z, or m/z
+TOLERANCE_UNITS = ('ppm', 'mz')
+
+
+class AnnotationReader:
+    """Incremental parser that keeps the first <annotations> element and where it is in the file."""
+
+    def __init__(self):
+        self.parser = expat.ParserCreate()
+        self.parser.XmlDeclHandler = self.xml_declaration
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+
+        self.encoding = 'utf-8'
+        self.builder = None
+        self.depth = 0
+
+        # Byte offset of the start and end tags of the annotations, and the element
+        self.start_offset = None
+        self.end_offset = None
+        self.annotations = None
+
+    def xml_declaration(self, version, encoding, standalone):
+        if encoding:
+            self.encoding = encoding
+
+    def start(self, tag, attrib):
+        if self.builder is not None:
+            self.depth += 1
+            self.builder.start(tag, attrib)
+
+        elif tag == 'annotations' and self.annotations is None:
+            self.start_offset = self.parser.CurrentByteIndex
+            self.builder = ET.TreeBuilder()
+            self.builder.start(tag, {})
+
+    def end(self, tag):
+        if self.builder is None:
+            return
+
+        if self.depth:
+            self.depth -= 1
+            self.builder.end(tag)
+            return
+
+        # End of the annotations, the rest of the file is only copied
+        self.end_offset = self.parser.CurrentByteIndex
+        self.annotations = self.builder.end(tag)
+        self.builder = None
+
+    def data(self, text):
+        if self.builder is not None:
+            self.builder.data(text)
+
+    def read(self, file):
+        """Parse the file until the end of the annotations, return the annotations element or None."""
+
+        while self.annotations is None:
+            chunk = file.read(CHUNK_SIZE)
+            self.parser.Parse(chunk, not chunk)
+
+            if not chunk:
+                break
+
+        return self.annotations
+
+
+def element_end(file, offset, tag):
+    # Return the offset after the end of an element, from the offset of its end
+    # event: expat reports the start of the end tag, or the end of an empty
+    # element tag like <annotations/>
+    end_tag = b'</' + tag.encode()
+    file.seek(offset)
+
+    if file.read(len(end_tag)) != end_tag:
+        return offset
+
+    # End tags have no attributes, they end at the first '>'
+    file.seek(offset)
+    position = offset
+
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+
+        if not chunk:
+            raise ValueError(f"Unterminated end tag at byte {offset}")
+
+        if b'>' in chunk:
+            return position + chunk.index(b'>') + 1
+
+        position += len(chunk)
+
+
+def best_per_group(codes, groups, *keys):
+    """Return the row of every group with the smallest keys, compared in order, the first row on ties.
+
+    'codes' numbers the group of every row from 0 to 'groups' - 1. Every key
+    only narrows the rows that are still the smallest of their group, so the
+    selection is a few linear passes. Groups without rows are left out.
+    """
+
+    rows = np.arange(len(codes))
+
+    for key in keys:
+        values = key[rows]
+        best = np.full(groups, np.inf)
+        np.minimum.at(best, codes[rows], values)
+        rows = rows[values == best[codes[rows]]]
+
+    first = np.full(groups, len(codes))
+    np.minimum.at(first, codes[rows], rows)
+
+    return first[first < len(codes)]
+
+
+def check_tolerance(tolerance, unit):
+    # Raise a ValueError for a tolerance that cannot group peaks
+    if unit not in TOLERANCE_UNITS:
+        raise ValueError(f"Unknown tolerance unit '{unit}', use one of {', '.join(TOLERANCE_UNITS)}")
+
+    if not tolerance >= 0:
+        raise ValueError(f"The peak tolerance must be positive or 0, got {tolerance}")
+
+
+def peak_groups(peak_mz, tolerance=0.0, unit='ppm'):
+    """Return the peak group of every annotation and the number of groups.
+
+    Without tolerance every distinct peakMZ is a group. Otherwise the peaks
+    are swept once in m/z order and a new group starts at the first peak
+    that is further than the tolerance (in ppm of the first peak of the
+    group, or in m/z) from the first peak of the current group, so a group
+    never spans more than the tolerance, even if its peaks are closer than
+    it to their neighbours.
+    """
+
+    check_tolerance(tolerance, unit)
+
+    if not tolerance or not len(peak_mz):
+        codes, peaks = pd.factorize(peak_mz)
+        return codes, len(peaks)
+
+    order = np.argsort(peak_mz, kind='stable')
+    sorted_mz = peak_mz[order]
+    relative = unit == 'ppm'
+
+    group = 0
+    start = sorted_mz[0]
+    limit = tolerance * 1e-6 * start if relative else tolerance
+    sorted_codes = []
+
+    for mz in sorted_mz.tolist():
+        if mz - start > limit:
+            group += 1
+            start = mz
+            limit = tolerance * 1e-6 * start if relative else tolerance
+
+        sorted_codes.append(group)
+
+    sorted_codes = np.array(sorted_codes, dtype=np.intp)
+
+    codes = np.empty(len(peak_mz), dtype=np.intp)
+    codes[order] = sorted_codes
+
+    return codes, int(sorted_codes[-1]) + 1
+
+
+def tolerance_attributes(tolerance, unit):
+    """Return the attributes that record the peak tolerance in the cleaned <annotations>, {} without tolerance."""
+
+    return {'peakTolerance': f"{tolerance:g}", 'peakToleranceUnit': unit} if tolerance else {}
+
+
+def clean_annotations(annotations, tolerance=0.0, unit='ppm'):
+    """Return the annotation elements without duplicates in peakMZ or formula, sorted by peakMZ.
+
+    For every peakMZ the annotation with the least complex formula (number of
+    elements), then the smallest error is kept. Of those, the one with the
+    smallest error, then the smallest peakMZ is kept for every formula. Ties
+    keep the annotation that comes first in the file. Peaks are grouped
+    with peak_groups.
+    """
+
+    annotations = list(annotations)
+
+    if not annotations:
+        return []
+
+    # Attributes of all annotations as arrays
+    peak_mz = np.array([annotation.attrib['peakMZ'] for annotation in annotations], dtype=float)
+    calc_mz = np.array([annotation.attrib['calcMZ'] for annotation in annotations], dtype=float)
+    formula_codes, formulas = pd.factorize(np.array([annotation.attrib['formula'] for annotation in annotations], dtype=object))
+    peak_codes, peaks = peak_groups(peak_mz, tolerance, unit)
+
+    error = np.abs(peak_mz - calc_mz)
+
+    # The molecular complexity is the number of capital letters, counted once per formula
+    complexity = np.array([sum(map(str.isupper, formula)) for formula in formulas], dtype=float)[formula_codes]
+
+    # One annotation per peakMZ, then one per formula among those
+    kept = best_per_group(peak_codes, peaks, complexity, error)
+    kept = kept[best_per_group(formula_codes[kept], len(formulas), error[kept], peak_mz[kept])]
+
+    kept = kept[np.argsort(peak_mz[kept], kind='stable')]
+
+    return [annotations[i] for i in kept]
+
+
+def annotations_block(annotations, encoding, attrib=None):
+    # Serialize the cleaned annotations into a new annotations element
+    new_annotations_xml = ET.Element('annotations', attrib or {})
+    new_annotations_xml.extend(annotations)
+
+    return ET.tostring(new_annotations_xml, encoding='unicode').encode(encoding, 'xmlcharrefreplace')
+
+
+def copy_bytes(source, target, size=None):
+    # Copy 'size' bytes (all remaining bytes if None) in chunks
+    while size is None or size > 0:
+        chunk = source.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size))
+
+        if not chunk:
+            break
+
+        target.write(chunk)
+
+        if size is not None:
+            size -= len(chunk)
+
+
+def cleaned_path(file_path, output_dir=None):
+    """Return the "<name>_cleaned.msd" path of a file, in 'output_dir' or next to the file."""
+
+    # Extract the base filename without the extension and append '_cleaned'
+    base_filename = os.path.splitext(os.path.basename(file_path))[0]
+
+    return os.path.join(output_dir or os.path.dirname(file_path), base_filename + CLEANED_SUFFIX)
+
+
+def clean_file(file_path, output_path=None, tolerance=0.0, unit='ppm'):
+    """Write the file with cleaned annotations to 'output_path' (default: cleaned_path).
+
+    'tolerance' and 'unit' group the peaks like in peak_groups.
+
+    Returns the number of annotations before and after cleaning, (0, 0) if
+    the file has no annotations, in which case it is copied unchanged.
+    """
+
+    check_tolerance(tolerance, unit)
+    output_path = output_path or cleaned_path(file_path)
+    reader = AnnotationReader()
+
+    # The output is written next to its final path and moved there at the end,
+    # so that the input can also be the output
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.tmp')
+
+    try:
+        with open(file_path, 'rb') as source, os.fdopen(handle, 'wb') as target:
+            annotations = reader.read(source)
+            source.seek(0)
+
+            if annotations is None:
+                before = after = []
+                copy_bytes(source, target)
+
+            else:
+                before = list(annotations)
+                after = clean_annotations(before, tolerance, unit)
+                end_offset = element_end(source, reader.end_offset, 'annotations')
+
+                source.seek(0)
+                copy_bytes(source, target, reader.start_offset)
+                target.write(annotations_block(after, reader.encoding, tolerance_attributes(tolerance, unit)))
+                source.seek(end_offset)
+                copy_bytes(source, target)
+
+        os.replace(tmp_path, output_path)
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        raise
+
+    return len(before), len(after)
+
+
+def find_files(patterns):
+    """Return the .msd files matching the glob patterns or inside the folders, in sorted order."""
+
+    files = []
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.msd')
+
+        files.extend(path for path in sorted(glob.glob(pattern)) if os.path.isfile(path))
+
+    # Skip the outputs of earlier runs and duplicates, but keep the order
+    files = [os.path.normpath(file) for file in files if not file.endswith(CLEANED_SUFFIX)]
+
+    return list(dict.fromkeys(files))
+
+
+def _clean_file_safe(args):
+    # Worker entry point, a failing file does not stop the batch
+    file_path, output_dir, tolerance, unit = args
+    start = time.perf_counter()
+    summary = {'file': file_path, 'output': cleaned_path(file_path, output_dir), 'annotations_in': 0,
+               'annotations_out': 0, 'error': None}
+
+    try:
+        summary['annotations_in'], summary['annotations_out'] = clean_file(file_path, summary['output'], tolerance, unit)
+
+    except Exception as error:
+        summary['error'] = f"{type(error).__name__}: {error}"
+
+    summary['time'] = time.perf_counter() - start
+
+    return summary
+
+
+def clean_files(patterns, workers=None, output_dir=None, tolerance=0.0, unit='ppm'):
+    """Clean all matching files in a process pool and return a summary per file.
+
+    Raises ValueError before cleaning anything if two files would be written
+    to the same output, e.g. files with the same name in different folders
+    and one 'output_dir'.
+    """
+
+    # Check the tolerance before starting the workers
+    check_tolerance(tolerance, unit)
+
+    files = find_files(patterns)
+    outputs = {}
+
+    for file in files:
+        outputs.setdefault(os.path.abspath(cleaned_path(file, output_dir)), []).append(file)
+
+    clashes = [inputs for inputs in outputs.values() if len(inputs) > 1]
+
+    if clashes:
+        raise ValueError("These files would be written to the same output: "
+                         + "; ".join(", ".join(inputs) for inputs in clashes))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(files)))
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    jobs = [(file, output_dir, tolerance, unit) for file in files]
+
+    if workers == 1:
+        return [_clean_file_safe(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_clean_file_safe, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remove the duplicate annotations of .msd files.")
+    parser.add_argument('paths', nargs='+', help=".msd files, glob patterns or folders")
+    parser.add_argument('--workers', type=int, default=None, help="Number of files cleaned in parallel")
+    parser.add_argument('--output', default=None, help="Output folder, default: next to every input file")
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help="Peaks closer than this are the same peak, default: equal peakMZ only")
+    parser.add_argument('--unit', choices=TOLERANCE_UNITS, default='ppm', help="Unit of the tolerance")
+    args = parser.parse_args(argv)
+
+    if not args.tolerance >= 0:
+        parser.error("--tolerance must be positive or 0")
+
+    try:
+        summaries = clean_files(args.paths, args.workers, args.output, args.tolerance, args.unit)
+
+    except ValueError as error:
+        print(f"Error: {error}")
+        return 1
+
+    if not summaries:
+        print("No .msd file matches the given paths.")
+        return 1
+
+    failed = 0
+
+    for summary in summaries:
+        if summary['error']:
+            print(f"{summary['file']}: error: {summary['error']}")
+            failed += 1
+
+        else:
+            print(f"{summary['file']}: {summary['annotations_in']} annotations in, "
+                  f"{summary['annotations_out']} out, {summary['time']:.2f} s -> {summary['output']}")
+
+    total_in = sum(summary['annotations_in'] for summary in summaries)
+    total_out = sum(summary['annotations_out'] for summary in summaries)
+    tolerance = f", peak tolerance {args.tolerance:g} {args.unit}" if args.tolerance else ""
+    print(f"{len(summaries) - failed} of {len(summaries)} files cleaned, {total_in} annotations in, "
+          f"{total_out} out{tolerance}")
+
+    return 1 if failed else 0
+
 
-# Define your file path
-file_path = "Wisconsin_Bulk.msd"
-
-# Extract the base filename without the extension
-base_filename = os.path.splitext(os.path.basename(file_path))[0]
-
-# Append '_cleaned' to the filename and add back the extension
-new_filename = base_filename + '_cleaned.msd'
-
-# Open the file as a text file
-with open(file_path, 'r') as file:
-    file_content = file.read()
-
-# Parse the XML content from the file
-root = ET.fromstring(file_content)
-
-# Find the annotations in the XML tree
-annotations_xml = root.find('.//annotations')
-
-# Create a list to hold the annotations
-annotations_list = []
-
-# Iterate over the annotation elements in the XML
-for annotation in annotations_xml:
-    # Get the attributes of the annotation
-    peak_mz = float(annotation.attrib['peakMZ'])
-    calc_mz = float(annotation.attrib['calcMZ'])
-    formula = annotation.attrib['formula']
-    
-    # Calculate the error as the absolute difference between peakMZ and calcMZ
-    error = abs(peak_mz - calc_mz)
-    
-    # Calculate the molecular complexity as the number of distinct atoms in the formula
-    # We assume that each capital letter represents a new type of atom
-    molecular_complexity = len([char for char in formula if char.isupper()])
-    
-    # Add the annotation to the list
-    annotations_list.append((peak_mz, formula, molecular_complexity, error, annotation))
-
-# Sort the annotations by peakMZ, then by molecular complexity, then by error
-annotations_list.sort(key=lambda x: (x[0], x[2], x[3]))
-
-annotations_list[:5]  # Show the first 5 annotations for verification
-
-# Create a new list to hold the non-duplicate annotations
-non_duplicate_annotations = []
-
-# Initialize variables to track the current peakMZ and formula
-current_peak_mz = None
-current_formula = None
-
-# Iterate over the sorted annotations
-for peak_mz, formula, molecular_complexity, error, annotation in annotations_list:
-    # If the peakMZ has changed, we add the annotation to the non-duplicate list
-    # This works because we sorted the annotations by peakMZ, molecular complexity, and error
-    # So, the first annotation we see for each peakMZ will have the lowest molecular complexity
-    if peak_mz != current_peak_mz:
-        non_duplicate_annotations.append((peak_mz, formula, molecular_complexity, error, annotation))
-        current_peak_mz = peak_mz
-
-# Now we have removed duplicates based on peakMZ. Next, we remove duplicates based on formula
-# We sort the non-duplicate annotations by formula, then by error
-non_duplicate_annotations.sort(key=lambda x: (x[1], x[3]))
-
-# Create a final list to hold the annotations with no duplicates in peakMZ or formula
-final_annotations = []
-
-# Iterate over the sorted non-duplicate annotations
-for peak_mz, formula, molecular_complexity, error, annotation in non_duplicate_annotations:
-    # If the formula has changed, we add the annotation to the final list
-    # This works because we sorted the annotations by formula, then by error
-    # So, the first annotation we see for each formula will have the lowest error
-    if formula != current_formula:
-        final_annotations.append((peak_mz, formula, molecular_complexity, error, annotation))
-        current_formula = formula
-
-final_annotations[:5]  # Show the first 5 final annotations for verification
-
-# Create a new annotations element
-new_annotations_xml = ET.Element('annotations')
-
-# Sort the final annotations by peakMZ
-final_annotations.sort(key=lambda x: x[0])
-
-# Add the final annotations to the new annotations element
-for peak_mz, formula, molecular_complexity, error, annotation in final_annotations:
-    new_annotations_xml.append(annotation)
-
-# Replace the old annotations element with the new one in the root of the XML tree
-for i, child in enumerate(root):
-    if child.tag == 'annotations':
-        root[i] = new_annotations_xml
-        break
-
-# Convert the updated XML tree back into a string
-new_file_content = ET.tostring(root, encoding='unicode')
-
-# Write the new file content to a new file
-with open(file_path, 'w') as file:
-    file.write(new_file_content)
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
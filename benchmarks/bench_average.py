@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the sample averaging.
+
+Compares the original per-formula loop of DataFilterApp.make_average with
+SpectraCore.average_samples on synthetic samples drawn from the formulas of
+'Training Data.zip', and checks that both give the same table.
+
+Usage:
+    python benchmarks/bench_average.py --samples 8 --formulas 2000
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import load_folder
+from SpectraCore import average_samples
+
+
+ZIP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Training Data.zip')
+
+
+def make_samples(n_samples, n_formulas, seed=0):
+    # Draw every sample from a pool of formulas, with a few repeated peaks per sample
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(ZIP_PATH) as archive:
+            archive.extractall(tmp_dir)
+
+        data, _ = load_folder(os.path.join(tmp_dir, 'Training Data'), use_cache=False)
+
+    rng = np.random.default_rng(seed)
+    pool = data.drop_duplicates('Formula')
+    pool = pool.iloc[rng.integers(0, len(pool), n_formulas)].reset_index(drop=True)
+    pool['Formula'] = pool['Formula'] + '_' + pool.index.astype(str)
+
+    samples = []
+    for i in range(n_samples):
+        sample = pool.sample(frac=0.7, random_state=seed + i)
+        sample = pd.concat([sample, sample.sample(frac=0.05, random_state=seed + i)])
+        sample = sample.assign(
+            Sample=f"Sample{i}", Description="Bulk",
+            Error=sample['Error'].to_numpy() * rng.uniform(0.5, 1.5, len(sample)),
+            **{'Absolute intensity': sample['Absolute intensity'].to_numpy() * rng.uniform(0.5, 1.5, len(sample))})
+        samples.append(sample)
+
+    return pd.concat(samples, ignore_index=True)
+
+
+def make_average_loop(displayed_data, selected_samples):
+    # The original DataFilterApp.make_average, without the Tk selection
+    if 'Absolute intensity' in displayed_data:
+        intensity = 'Absolute intensity'
+    else:
+        intensity = 'Relative intensity'
+
+    selected_samples = [list(sample) for sample in selected_samples]
+    number_selected_samples = len(selected_samples)
+
+    displayed_data = displayed_data[displayed_data.apply(
+        lambda row: [row['Sample'], row['Description']] in selected_samples, axis=1)]
+
+    unique_formulas = displayed_data['Formula'].unique()
+    unique_combinations = displayed_data.drop_duplicates(subset=['Sample', 'Description'])
+    columns_to_keep = ['C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Formula', 'Mass', 'Theoretical mass', 'Error', 'Family']
+    averaged_data = []
+
+    for formula in unique_formulas:
+        formula_data = displayed_data[displayed_data['Formula'] == formula]
+        representative_rows = []
+
+        for _, combination in unique_combinations.iterrows():
+            temp_data = formula_data[(formula_data['Sample'] == combination['Sample']) & (formula_data['Description'] == combination['Description'])]
+
+            if not temp_data.empty:
+                representative_rows.append(temp_data.loc[temp_data['Error'].abs().idxmin()])
+
+        if len(representative_rows) > 0:
+            representative_row = pd.concat(representative_rows, axis=1).mean(axis=1, numeric_only=True).to_frame().T
+            representative_row = representative_row.drop(columns=['Sample', 'Description', intensity])
+            for col in columns_to_keep:
+                representative_row[col] = representative_rows[0][col]
+            representative_row['Mass'] = sum([row['Mass'] for row in representative_rows]) / len(formula_data)
+            representative_row['Error'] = sum([row['Error'] for row in representative_rows]) / len(formula_data)
+
+            for row in representative_rows:
+                representative_row[intensity + ' (' + row['Sample'] + '_' + row['Description'] + ')'] = row[intensity]
+
+            averaged_data.append(representative_row)
+
+    df_averaged = pd.DataFrame(pd.concat(averaged_data, ignore_index=True))
+    df_averaged[intensity + ' (Average)'] = df_averaged.filter(regex='^' + intensity + r' \(').sum(axis=1) / number_selected_samples
+    df_averaged.fillna(0, inplace=True)
+
+    return df_averaged.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=8, help="Number of samples to average")
+    parser.add_argument('--formulas', type=int, default=2000, help="Number of distinct formulas")
+    parser.add_argument('--skip-loop', action='store_true', help="Only time the vectorized version")
+    args = parser.parse_args()
+
+    data = make_samples(args.samples, args.formulas)
+    selected_samples = [(f"Sample{i}", "Bulk") for i in range(args.samples)]
+    print(f"{args.samples} samples, {len(data)} rows, {data['Formula'].nunique()} formulas")
+
+    start = time.perf_counter()
+    vectorized = average_samples(data, selected_samples)
+    vectorized_time = time.perf_counter() - start
+    print(f"average_samples: {vectorized_time:.3f} s")
+
+    if not args.skip_loop:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            start = time.perf_counter()
+            loop = make_average_loop(data, selected_samples)
+            loop_time = time.perf_counter() - start
+
+        print(f"original loop:   {loop_time:.3f} s")
+        print(f"speedup: {loop_time / vectorized_time:.0f}x")
+
+        pd.testing.assert_frame_equal(loop.astype({'Family': str}), vectorized.astype({'Family': str}), check_dtype=False)
+        print("results are identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the annotation deduplication of SpectrumCleaner.
+
+Builds a synthetic list of annotation elements with many duplicated peaks
+and formulas, and times SpectrumCleaner.clean_annotations against the
+original three-sort version, checking that the serialized annotations are
+byte-identical.
+
+Usage:
+    python benchmarks/bench_cleaner.py --annotations 1000000
+
+"""
+
+
+import argparse
+import os
+import random
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectrumCleaner import clean_annotations, annotations_block
+
+
+FORMULAS = ['C6H6', 'C7H8O', 'C10H8', 'C5H5N', 'C12H10N2O', 'C8H10', 'C9H7NO2', 'C20H12', 'CH4', 'C2H6OS']
+
+
+def make_annotations(count, seed=0):
+    # Every peak has about 4 annotations and every formula about 3, with rounded
+    # errors so that the tie-breaking is exercised
+    rnd = random.Random(seed)
+    annotations = []
+
+    for _ in range(count):
+        peak_mz = round(100 + rnd.randrange(count // 4 + 1) * 0.001, 4)
+        formula = rnd.choice(FORMULAS) + str(rnd.randrange(count // 30 + 1))
+        calc_mz = round(peak_mz + rnd.randrange(-5, 6) * 0.001, 4)
+        annotations.append(ET.Element('annotation', {'peakMZ': str(peak_mz), 'calcMZ': str(calc_mz),
+                                                     'formula': formula}))
+
+    return annotations
+
+
+def clean_annotations_sort(annotations):
+    # The original clean_annotations: sort by peakMZ, complexity and error, keep the first
+    # of every peakMZ, sort by formula and error, keep the first of every formula, sort by peakMZ
+    annotations_list = []
+
+    for annotation in annotations:
+        peak_mz = float(annotation.attrib['peakMZ'])
+        calc_mz = float(annotation.attrib['calcMZ'])
+        formula = annotation.attrib['formula']
+        error = abs(peak_mz - calc_mz)
+        molecular_complexity = len([char for char in formula if char.isupper()])
+        annotations_list.append((peak_mz, formula, molecular_complexity, error, annotation))
+
+    annotations_list.sort(key=lambda x: (x[0], x[2], x[3]))
+
+    non_duplicate_annotations = []
+    current_peak_mz = None
+    current_formula = None
+
+    for peak_mz, formula, molecular_complexity, error, annotation in annotations_list:
+        if peak_mz != current_peak_mz:
+            non_duplicate_annotations.append((peak_mz, formula, molecular_complexity, error, annotation))
+            current_peak_mz = peak_mz
+
+    non_duplicate_annotations.sort(key=lambda x: (x[1], x[3]))
+
+    final_annotations = []
+
+    for peak_mz, formula, molecular_complexity, error, annotation in non_duplicate_annotations:
+        if formula != current_formula:
+            final_annotations.append((peak_mz, formula, molecular_complexity, error, annotation))
+            current_formula = formula
+
+    final_annotations.sort(key=lambda x: x[0])
+
+    return [annotation for peak_mz, formula, molecular_complexity, error, annotation in final_annotations]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--annotations', type=int, default=1000000, help="Number of annotations")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic annotations")
+    args = parser.parse_args()
+
+    annotations = make_annotations(args.annotations, args.seed)
+
+    start = time.perf_counter()
+    expected = clean_annotations_sort(annotations)
+    sort_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = clean_annotations(annotations)
+    hash_time = time.perf_counter() - start
+
+    if annotations_block(result, 'utf-8') != annotations_block(expected, 'utf-8'):
+        raise RuntimeError("clean_annotations does not match the original output")
+
+    print(f"{len(annotations)} annotations, {len(result)} kept")
+    print(f"sort-based: {sort_time:.2f} s")
+    print(f"hash-based: {hash_time:.2f} s, speedup {sort_time / hash_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
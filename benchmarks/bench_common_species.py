@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the common species search.
+
+Times SpectraCore.common_species on synthetic samples and, unless
+--skip-loop is given, compares it with the original per-formula loop of
+DataFilterApp.find_common_species. The original iterated over a set, so the
+rows are compared after sorting by formula.
+
+Usage:
+    python benchmarks/bench_common_species.py --samples 6 --formulas 2000
+    python benchmarks/bench_common_species.py --samples 300 --formulas 30000 --skip-loop
+
+"""
+
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraCore import common_species
+from bench_average import make_samples
+
+
+def find_common_species_loop(displayed_data, selected_samples):
+    # The original DataFilterApp.find_common_species, without the Tk selection
+    if 'Absolute intensity' in displayed_data:
+        intensity = 'Absolute intensity'
+    else:
+        intensity = 'Relative intensity'
+
+    selected_samples = [list(sample) for sample in selected_samples]
+    number_selected_samples = len(selected_samples)
+
+    displayed_data = displayed_data[displayed_data.apply(lambda row: [row['Sample'], row['Description']] in selected_samples, axis=1)]
+
+    grouped_data = displayed_data.groupby(['Sample', 'Description'])['Formula'].unique()
+    common = set(grouped_data.iloc[0])
+
+    for species in grouped_data.iloc[1:]:
+        common.intersection_update(species)
+
+    columns_to_keep = ['C#', 'H#', 'N#', 'O#', 'DBE', 'DBE/C#', 'H/C', 'Formula', 'Mass', 'Theoretical mass', 'Error', 'Family']
+    averaged_data = []
+
+    for formula in common:
+        formula_data = displayed_data[displayed_data['Formula'] == formula]
+        representative_rows = []
+
+        for combination in grouped_data.index:
+            temp_data = formula_data[(formula_data['Sample'] == combination[0]) & (formula_data['Description'] == combination[1])]
+
+            if not temp_data.empty:
+                representative_rows.append(temp_data.loc[temp_data['Error'].abs().idxmin()])
+
+        representative_row = pd.concat(representative_rows, axis=1).mean(axis=1, numeric_only=True).to_frame().T
+        representative_row = representative_row.drop(columns=['Sample', 'Description', intensity])
+        for col in columns_to_keep:
+            representative_row[col] = representative_rows[0][col]
+        representative_row['Mass'] = sum([row['Mass'] for row in representative_rows]) / len(formula_data)
+        representative_row['Error'] = sum([row['Error'] for row in representative_rows]) / len(formula_data)
+
+        for row in representative_rows:
+            representative_row[intensity + ' (' + row['Sample'] + '_' + row['Description'] + ')'] = row[intensity]
+
+        averaged_data.append(representative_row)
+
+    df_common_species = pd.DataFrame(pd.concat(averaged_data, ignore_index=True))
+    df_common_species = df_common_species.rename(columns={'Mass': 'Mass (Average)', 'Error': 'Error (Average)'})
+    intensity_columns = df_common_species.filter(regex='^' + intensity + r' \(').columns
+    df_common_species[intensity + ' (Average)'] = df_common_species[intensity_columns].sum(axis=1) / number_selected_samples
+
+    return df_common_species
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=6, help="Number of samples to compare")
+    parser.add_argument('--formulas', type=int, default=2000, help="Number of distinct formulas")
+    parser.add_argument('--skip-loop', action='store_true', help="Only time the vectorized version")
+    args = parser.parse_args()
+
+    data = make_samples(args.samples, args.formulas)
+    selected_samples = [(f"Sample{i}", "Bulk") for i in range(args.samples)]
+    print(f"{args.samples} samples, {len(data)} rows, {data['Formula'].nunique()} formulas")
+
+    start = time.perf_counter()
+    vectorized = common_species(data, selected_samples)
+    vectorized_time = time.perf_counter() - start
+    n_common = 0 if vectorized is None else len(vectorized)
+    print(f"common_species: {vectorized_time:.3f} s, {n_common} common formulas")
+
+    if not args.skip_loop and vectorized is not None:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            start = time.perf_counter()
+            loop = find_common_species_loop(data, selected_samples)
+            loop_time = time.perf_counter() - start
+
+        print(f"original loop:  {loop_time:.3f} s")
+        print(f"speedup: {loop_time / vectorized_time:.0f}x")
+
+        loop = loop.astype({'Family': str}).sort_values('Formula').reset_index(drop=True)
+        vectorized = vectorized.astype({'Family': str}).sort_values('Formula').reset_index(drop=True)
+        pd.testing.assert_frame_equal(loop, vectorized, check_dtype=False)
+        print("results are identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Memory report of the compact schema.
+
+Builds a folder of synthetic export files from 'Training Data.zip', loads it
+with the default and with the compact schema (SpectraIO.COMPACT_DTYPES) and
+prints the bytes per column of both.
+
+Usage:
+    python benchmarks/bench_memory.py --files 64 --scale 20
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import load_folder, compact_frame, memory_report
+from bench_parallel_load import make_folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=64, help="Number of files in the folder")
+    parser.add_argument('--scale', type=int, default=20, help="Number of times the data rows of each file are repeated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_folder(tmp_dir, args.files, args.scale)
+        data, _ = load_folder(tmp_dir, use_cache=False)
+
+    compact = compact_frame(data)
+
+    print(f"{args.files} files, {len(data)} rows")
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(memory_report(data, compact))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the .msd annotation reader.
+
+Writes the files from 'Training Data.zip', scaled up synthetically by
+repeating their data rows, both as exports and as .msd files with the same
+masses, formulas and intensities (on the <peak> elements), then times
+SpectraIO.read_msd_file against SpectraIO.read_export_file and checks that
+both give the same element counts, DBE, ratios and families.
+
+Usage:
+    python benchmarks/bench_msd.py --scale 200
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from xml.sax.saxutils import quoteattr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import read_export_file, read_msd_file, export_body
+from SpectraMSD import FORMULA_COLUMNS, parse_formula
+from bench_reader import make_scaled_files
+
+
+def write_msd(export_path, msd_path):
+    # Write the rows of an export file as the peaks and annotations of an .msd file
+    with open(export_path, 'rb') as file:
+        lines = export_body(file.read()).decode('utf-8').splitlines()
+
+    rows = [[field.strip() for field in line.split(';')] for line in lines if line.strip()]
+
+    with open(msd_path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<msd>\n  <spectrum>\n')
+
+        for row in rows:
+            file.write(f'    <peak mz="{row[2]}" intensity="{row[17]}"/>\n')
+
+        file.write('  </spectrum>\n  <annotations>\n')
+
+        for row in rows:
+            file.write(f'    <annotation peakMZ="{row[2]}" calcMZ="{row[3]}" formula={quoteattr(row[1])}/>\n')
+
+        file.write('  </annotations>\n</msd>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=200, help="Number of times the data rows of each file are repeated")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for export_path in make_scaled_files(tmp_dir, args.scale):
+            msd_path = os.path.splitext(export_path)[0] + '.msd'
+            write_msd(export_path, msd_path)
+
+            start = time.perf_counter()
+            expected = read_export_file(export_path)
+            export_time = time.perf_counter() - start
+
+            parse_formula.cache_clear()
+            start = time.perf_counter()
+            result = read_msd_file(msd_path)
+            msd_time = time.perf_counter() - start
+
+            for column in FORMULA_COLUMNS:
+                if not (result[column].astype(object) == expected[column].astype(object)).all():
+                    raise RuntimeError(f"{column} of {os.path.basename(msd_path)} does not match the export")
+
+            print(f"{os.path.basename(msd_path)}: {len(result)} annotations, {parse_formula.cache_info().currsize} "
+                  f"formulas, .msd {msd_time:.2f} s, export {export_time:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
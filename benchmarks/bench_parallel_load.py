@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the parallel folder loader.
+
+Builds a folder of synthetic export files from 'Training Data.zip' and times
+SpectraIO.load_folder with an increasing number of worker processes, checking
+that the result is identical to the serial load.
+
+Usage:
+    python benchmarks/bench_parallel_load.py --files 64 --scale 20
+
+"""
+
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import load_folder
+from bench_reader import make_scaled_files
+
+
+def make_folder(out_dir, files, scale):
+    # Copy the scaled training files under new sample names until there are enough files
+    templates = make_scaled_files(out_dir, scale)
+
+    for i in range(files):
+        template = templates[i % len(templates)]
+        description = os.path.splitext(os.path.basename(template))[0].split('_')[1]
+        shutil.copy(template, os.path.join(out_dir, f"Sample{i:04d}_{description}.txt"))
+
+    for template in templates:
+        os.remove(template)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=64, help="Number of files in the folder")
+    parser.add_argument('--scale', type=int, default=20, help="Number of times the data rows of each file are repeated")
+    parser.add_argument('--threads', action='store_true', help="Use a thread pool instead of a process pool")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_folder(tmp_dir, args.files, args.scale)
+
+        reference = None
+        serial_time = None
+
+        for workers in worker_counts:
+            start = time.perf_counter()
+            data, errors = load_folder(tmp_dir, workers=workers, use_processes=not args.threads)
+            elapsed = time.perf_counter() - start
+
+            if reference is None:
+                reference = data
+                serial_time = elapsed
+                print(f"{args.files} files, {len(data)} rows")
+
+            elif not data.equals(reference):
+                raise RuntimeError(f"Result with {workers} workers differs from the serial load")
+
+            print(f"{workers:3d} workers: {elapsed:.3f} s  (speedup {serial_time / elapsed:.1f}x, {len(errors)} errors)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the export file readers.
+
+Compares the original pd.read_csv(..., skipfooter=4, engine='python') path of
+DataFilterApp.load_data with SpectraIO.read_export_file on the files from
+'Training Data.zip', scaled up synthetically by repeating their data rows.
+
+Usage:
+    python benchmarks/bench_reader.py --scale 200 --repeat 3
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import EXPORT_COLUMNS, HEADER_LINES, FOOTER_LINES, read_export_file
+
+
+ZIP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Training Data.zip')
+
+
+def make_scaled_files(out_dir, scale):
+    # Write every training file with its data rows repeated 'scale' times
+    paths = []
+
+    with zipfile.ZipFile(ZIP_PATH) as archive:
+        for name in archive.namelist():
+            if not name.endswith('.txt'):
+                continue
+
+            lines = archive.read(name).decode('utf-8').splitlines(keepends=True)
+            header = lines[:HEADER_LINES]
+            footer = lines[-FOOTER_LINES:]
+            rows = [line for line in lines[HEADER_LINES:-FOOTER_LINES] if line.strip()]
+            rows[-1] = rows[-1].rstrip('\r\n') + '\n'
+
+            path = os.path.join(out_dir, os.path.basename(name))
+            with open(path, 'w', encoding='utf-8') as file:
+                file.writelines(header)
+                file.writelines(rows * scale)
+                file.write('\n')
+                file.writelines(footer)
+
+            paths.append(path)
+
+    return paths
+
+
+def read_python_engine(path):
+    # The original load_data parsing step
+    df = pd.read_csv(path, delimiter=';', header=None, skiprows=2, skipfooter=4, engine='python')
+    df.columns = EXPORT_COLUMNS
+    df['Formula'] = df['Formula'].str.strip()
+    df['Family'] = df['Family'].str.strip()
+    return df
+
+
+def best_time(func, paths, repeat):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=100, help="Number of times the data rows are repeated")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = make_scaled_files(tmp_dir, args.scale)
+        size = sum(os.path.getsize(path) for path in paths) / 1e6
+        rows = sum(len(read_export_file(path)) for path in paths)
+
+        python_time = best_time(read_python_engine, paths, args.repeat)
+        c_time = best_time(read_export_file, paths, args.repeat)
+
+    print(f"{len(paths)} files, {rows} rows, {size:.1f} MB")
+    print(f"python engine (skipfooter): {python_time:.3f} s")
+    print(f"read_export_file (C engine): {c_time:.3f} s")
+    print(f"speedup: {python_time / c_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
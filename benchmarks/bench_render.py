@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the batch figure rendering.
+
+Builds a folder of synthetic export files from 'Training Data.zip' and times
+SpectraRender.render_figures of one scatter plot for every sample and group
+with an increasing number of worker processes, checking that the same
+files are written.
+
+Usage:
+    python benchmarks/bench_render.py --files 40 --combine grid
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import load_folder
+from SpectraCore import GROUP_FAMILIES
+from SpectraRender import render_figures
+from bench_parallel_load import make_folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=40, help="Number of files in the folder")
+    parser.add_argument('--plot', default="DBE vs C#", help="Plot type")
+    parser.add_argument('--combine', choices=['grid', 'pdf'], help="Combine the figures into one file")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, 'data')
+        os.makedirs(data_dir)
+        make_folder(data_dir, args.files, 1)
+        data, _ = load_folder(data_dir, use_cache=False)
+
+        reference = None
+        serial_time = None
+
+        for workers in worker_counts:
+            out_dir = os.path.join(tmp_dir, f"plots_{workers}")
+
+            start = time.perf_counter()
+            paths = render_figures(data, args.plot, list(GROUP_FAMILIES), out_dir, combine=args.combine,
+                                   combine_dpi=50, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            names = [os.path.basename(path) for path in paths]
+            serial_time = serial_time or elapsed
+
+            if reference is None:
+                reference = names
+
+            elif names != reference:
+                raise RuntimeError(f"{workers} workers wrote other files than 1 worker")
+
+            print(f"{workers:3d} workers: {len(paths)} files, {elapsed:.2f} s, speedup {serial_time / elapsed:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the streaming folder loader.
+
+Builds a folder of synthetic export files from 'Training Data.zip' and
+compares the peak Python memory (tracemalloc) and time of loading the whole
+folder and filtering it afterwards with reading it through
+SpectraIO.stream_folder with the same filter, checking that both give the
+same rows.
+
+Usage:
+    python benchmarks/bench_stream_load.py --files 16 --scale 50 --chunk-rows 10000
+
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from SpectraIO import load_folder, stream_folder
+from SpectraCore import filter_data, row_predicate
+from bench_parallel_load import make_folder
+
+
+FAMILIES = ['Aromatics', 'Condensed Aromatics']
+C_RANGE = (10, 30)
+MASS_RANGE = (150, 500)
+INTENSITY_RANGE = (1e3, 1e12)
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=16, help="Number of files in the folder")
+    parser.add_argument('--scale', type=int, default=50, help="Number of times the data rows of each file are repeated")
+    parser.add_argument('--chunk-rows', type=int, default=10_000, help="Lines parsed at a time when streaming")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_folder(tmp_dir, args.files, args.scale)
+
+        def load_then_filter():
+            data, _ = load_folder(tmp_dir, workers=1, use_cache=False)
+            return filter_data(data, FAMILIES, C_RANGE, MASS_RANGE, INTENSITY_RANGE).reset_index(drop=True)
+
+        predicate = row_predicate(FAMILIES, C_RANGE, None, MASS_RANGE, None, INTENSITY_RANGE)
+
+        def stream():
+            data, _, row_counts = stream_folder(tmp_dir, predicate, args.chunk_rows, use_cache=False)
+            return data, row_counts
+
+        reference, load_time, load_peak = measure(load_then_filter)
+        (streamed, row_counts), stream_time, stream_peak = measure(stream)
+
+        rows_in = sum(rows for _, rows, _ in row_counts)
+        print(f"{args.files} files, {rows_in} rows read, {len(streamed)} kept")
+        print(f"load + filter: {load_time:.3f} s, peak {load_peak:.1f} MiB")
+        print(f"stream:        {stream_time:.3f} s, peak {stream_peak:.1f} MiB")
+
+        if not streamed.astype({'Family': str}).equals(reference.astype({'Family': str})):
+            raise RuntimeError("The streamed rows differ from the filtered load")
+
+
+if __name__ == '__main__':
+    main()
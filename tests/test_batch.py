@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from SpectraBatch import main, run_batch
+
+
+def test_same_folder_names_fail(tmp_path):
+    for campaign in ('a', 'b'):
+        os.makedirs(tmp_path / campaign / 'IOM')
+
+    output = tmp_path / 'out'
+    recipe = {'folders': [str(tmp_path / '*' / 'IOM')]}
+
+    with pytest.raises(ValueError, match='same output'):
+        run_batch(recipe, workers=1, output_path=str(output))
+
+    assert not output.exists()
+
+
+def test_same_folder_names_exit_code(tmp_path, capsys):
+    for campaign in ('a', 'b'):
+        os.makedirs(tmp_path / campaign / 'IOM')
+
+    recipe_path = tmp_path / 'recipe.json'
+    recipe_path.write_text('{"folders": ["%s"]}' % str(tmp_path / '*' / 'IOM').replace('\\', '/'))
+
+    assert main([str(recipe_path), '--output', str(tmp_path / 'out')]) == 1
+    assert 'same output' in capsys.readouterr().out
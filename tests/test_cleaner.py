@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pytest
+
+from SpectrumCleaner import clean_files, peak_groups
+
+
+MSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<msd>
+  <annotations>
+    <annotation peakMZ="100.0" calcMZ="100.001" formula="C8H4"/>
+    <annotation peakMZ="100.0" calcMZ="100.002" formula="C7H16"/>
+  </annotations>
+</msd>
+'''
+
+
+def write_msd(path, content=MSD):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+
+def test_same_names_in_one_output_folder_fail(tmp_path):
+    write_msd(str(tmp_path / 'a' / 'S_Bulk.msd'))
+    write_msd(str(tmp_path / 'b' / 'S_Bulk.msd'))
+    output = tmp_path / 'out'
+
+    with pytest.raises(ValueError, match='same output'):
+        clean_files([str(tmp_path / 'a'), str(tmp_path / 'b')], workers=1, output_dir=str(output))
+
+    assert not output.exists() or not os.listdir(output)
+
+
+def test_same_names_next_to_their_inputs(tmp_path):
+    write_msd(str(tmp_path / 'a' / 'S_Bulk.msd'))
+    write_msd(str(tmp_path / 'b' / 'S_Bulk.msd'))
+
+    summaries = clean_files([str(tmp_path / 'a'), str(tmp_path / 'b')], workers=1)
+
+    assert [summary['error'] for summary in summaries] == [None, None]
+    assert [summary['annotations_out'] for summary in summaries] == [1, 1]
+    assert (tmp_path / 'a' / 'S_Bulk_cleaned.msd').exists() and (tmp_path / 'b' / 'S_Bulk_cleaned.msd').exists()
+
+
+def test_peak_groups_do_not_chain():
+    # 1000 peaks 1 ppm apart are closer than 2 ppm to their neighbours, but span about 1000 ppm
+    peak_mz = 500 * (1 + 1e-6) ** np.arange(1000)
+    codes, groups = peak_groups(peak_mz[::-1].copy(), 2, 'ppm')
+    codes = codes[::-1]
+
+    assert groups > 300
+
+    for group in range(groups):
+        members = peak_mz[codes == group]
+        assert (members.max() - members.min()) / members.min() * 1e6 <= 2 + 1e-9
+
+
+def test_peak_groups_absolute():
+    codes, groups = peak_groups(np.array([100.0, 100.0004, 100.0008, 100.0012, 200.0]), 0.001, 'mz')
+
+    assert list(codes) == [0, 0, 0, 1, 2]
+    assert groups == 3
+
+
+def test_peak_groups_without_tolerance():
+    codes, groups = peak_groups(np.array([100.0, 100.0000001, 100.0]))
+
+    assert list(codes) == [0, 1, 0]
+    assert groups == 2
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from SpectraCore import add_derived_columns, drop_derived_columns
+
+
+def formulas(rows):
+    # Sample data with the element counts of (C#, H#, N#, O#) rows
+    data = pd.DataFrame(rows, columns=['C#', 'H#', 'N#', 'O#'])
+    data['Family'] = pd.Categorical(['Aromatics'] * len(rows))
+    data['Mass'] = 100.0
+    data['Absolute intensity'] = 1.0
+    data['Sample'] = 'S'
+    data['Description'] = 'D'
+
+    return data
+
+
+def test_ai_mod_cho():
+    # C10H8O: (1 + 10 - 0.5 - 4) / (10 - 0.5 - 0)
+    data = add_derived_columns(formulas([(10, 8, 0, 1)]), ['AI_mod'])
+
+    assert data['AI_mod'].iloc[0] == pytest.approx(6.5 / 9.5)
+
+
+def test_ai_mod_with_nitrogen():
+    # C10H9N: (1 + 10 - (1 + 9) / 2) / (10 - 1), the nitrogen counts in the numerator too
+    data = add_derived_columns(formulas([(10, 9, 1, 0), (9, 8, 2, 1)]), ['AI_mod'])
+
+    assert data['AI_mod'].iloc[0] == pytest.approx(6 / 9)
+    assert data['AI_mod'].iloc[1] == pytest.approx((1 + 9 - 0.5 - 5) / (9 - 0.5 - 2))
+
+
+def test_ai_mod_not_positive_is_zero():
+    # C2H8: 1 + 2 - 4 < 0
+    data = add_derived_columns(formulas([(2, 8, 0, 0)]), ['AI_mod'])
+
+    assert data['AI_mod'].iloc[0] == 0
+
+
+def test_drop_derived_columns():
+    data = formulas([(10, 8, 0, 1)])
+    result = drop_derived_columns(add_derived_columns(data))
+
+    assert list(result.columns) == list(data.columns)
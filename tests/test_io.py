@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import zipfile
+
+import pytest
+
+from SpectraIO import load_folder
+from SpectraMSD import read_annotations
+
+
+ZIP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Training Data.zip')
+
+MSD = '''<?xml version="1.0" encoding="UTF-8"?>
+<msd>
+  <annotations>
+    <annotation peakMZ="78.046402" calcMZ="78.04695" formula="C6H6" intensity="10.0"/>
+    <annotation peakMZ="94.041316" calcMZ="94.041865" formula="C6H6O" intensity="5.0"/>
+  </annotations>
+</msd>
+'''
+
+
+def extract_export(folder, name):
+    # Copy one export file of the training data into the folder
+    with zipfile.ZipFile(ZIP_PATH) as archive:
+        member = next(member for member in archive.namelist() if member.endswith(name))
+
+        with open(os.path.join(folder, name), 'wb') as file:
+            file.write(archive.read(member))
+
+
+def test_cache_keeps_txt_and_msd_with_the_same_stem(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    extract_export(str(tmp_path), 'Murchison_Bulk.txt')
+    (tmp_path / 'Murchison_Bulk.msd').write_text(MSD, encoding='utf-8')
+
+    first, errors = load_folder(str(tmp_path), workers=1)
+    cached, _ = load_folder(str(tmp_path), workers=1)
+
+    assert errors == []
+    assert len(first) > 2
+    assert len(cached) == len(first)
+    assert cached.reset_index(drop=True).equals(first.reset_index(drop=True))
+    assert first['Formula'].iloc[-2:].tolist() == ['C6H6', 'C6H6O']
+
+
+def write_large_msd(path, count, peaks_first):
+    # count annotations without intensity and their peaks, in more than one read chunk
+    annotations = ''.join(f'    <annotation peakMZ="{100 + i * 0.001:.4f}" calcMZ="{100 + i * 0.001:.4f}" formula="C{i % 50 + 6}H6"/>\n'
+                          for i in range(count))
+    peaks = ''.join(f'    <peak mz="{100 + i * 0.001:.4f}" intensity="{i + 1}"/>\n' for i in range(count))
+    parts = [f'  <spectrum>\n{peaks}  </spectrum>\n', f'  <annotations>\n{annotations}  </annotations>\n']
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<msd>\n')
+        file.writelines(parts if peaks_first else parts[::-1])
+        file.write('</msd>\n')
+
+
+@pytest.mark.parametrize('peaks_first', [True, False])
+def test_msd_intensity_from_peaks_before_or_after_the_annotations(tmp_path, peaks_first):
+    path = str(tmp_path / 'S_Bulk.msd')
+    write_large_msd(path, 60000, peaks_first)
+
+    df = read_annotations(path)
+
+    assert len(df) == 60000
+    assert df['Absolute intensity'].tolist() == [float(i + 1) for i in range(60000)]
+
+
+def test_msd_without_intensity_fails(tmp_path):
+    path = tmp_path / 'S_Bulk.msd'
+    path.write_text(MSD.replace(' intensity="5.0"', ''), encoding='utf-8')
+
+    with pytest.raises(ValueError, match='1 annotations have no intensity'):
+        read_annotations(str(path))